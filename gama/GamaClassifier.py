@@ -49,8 +49,9 @@ class GamaClassifier(Gama):
         return self._label_encoder.transform(y)
 
     def _initialize_ensemble(self):
-        self.ensemble = EnsembleClassifier(self._scoring_function, self.y_train,
-                                           model_library_directory=self._cache_dir, n_jobs=self._n_jobs)
+        self.ensemble = EnsembleClassifier(self._scoring_function, self._validation_y_true(),
+                                           model_library_directory=self._cache_dir, n_jobs=self._n_jobs,
+                                           max_threads=self._threads_per_job)
 
     def _build_fit_ensemble(self, ensemble_size, timeout):
         super()._build_fit_ensemble(ensemble_size, timeout)
@@ -22,5 +22,6 @@ class GamaRegressor(Gama):
         return self.ensemble.predict(X)
 
     def _initialize_ensemble(self):
-        self.ensemble = EnsembleRegressor(self._scoring_function, self.y_train,
-                                          model_library_directory=self._cache_dir, n_jobs=self._n_jobs)
+        self.ensemble = EnsembleRegressor(self._scoring_function, self._validation_y_true(),
+                                          model_library_directory=self._cache_dir, n_jobs=self._n_jobs,
+                                          max_threads=self._threads_per_job)
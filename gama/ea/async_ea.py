@@ -1,12 +1,21 @@
+from collections import deque
+from datetime import datetime
 import logging
 from functools import partial
+import heapq
+import itertools
+import signal
 import time
 
 import stopit
 
+from gama.ea.canonical import canonical_form
+from gama.ea.evaluation import EvaluationResult, FoldResult
+from gama.ea.fitness_table import FitnessTable
 from gama.utilities.logging_utilities import TOKENS, log_parseable_event, default_time_format
 from ..utilities.logging_utilities import MultiprocessingLogger
-from gama.utilities.generic.function_dispatcher import FunctionDispatcher
+from gama.utilities.generic.function_dispatcher import FunctionDispatcher, WorkerDiedError, WorkerTimeoutError
+from gama.utilities.generic.remote_dispatcher import RemoteFunctionDispatcher
 
 log = logging.getLogger(__name__)
 
@@ -28,8 +37,85 @@ def _safe_outside_call(fn, timeout):
         raise stopit.utils.TimeoutException
 
 
+def _lost_job_result(error, pipeline, fidelity):
+    """ Log the failed evaluation of `pipeline` by a child process that died or was terminated for exceeding the
+    timeout, and return its `EvaluationResult`.
+
+    A child process which is killed (SIGKILL) was most likely killed by the OS for using too much memory.
+    """
+    single_line_pipeline = str(pipeline).replace('\n', '')
+    if isinstance(error, WorkerTimeoutError):
+        log.info('Child process was terminated because it exceeded the timeout while evaluating pipeline.')
+        log_parseable_event(log, TOKENS.EVALUATION_TIMEOUT, error.start_datetime, single_line_pipeline)
+    elif error.exitcode == -getattr(signal, 'SIGKILL', 9):
+        log.info('Child process was killed while evaluating pipeline, probably because it ran out of memory.')
+        log_parseable_event(log, TOKENS.EVALUATION_OOM, error.start_datetime, single_line_pipeline)
+    else:
+        log_parseable_event(log, TOKENS.EVALUATION_ERROR, error.start_datetime, single_line_pipeline,
+                            type(error), error)
+    evaluation_time = (datetime.now() - error.start_datetime).total_seconds()
+    return EvaluationResult(-float('inf'), error.start_datetime, evaluation_time, len(pipeline.steps), fidelity)
+
+
 def async_ea(objectives, start_population, toolbox, evaluation_callback=None, restart_callback=None,
-             elimination_callback=None, max_n_evaluations=10000, max_time_seconds=1e7, n_jobs=1):
+             elimination_callback=None, max_n_evaluations=10000, max_time_seconds=1e7, n_jobs=1,
+             successive_halving=None, fold_racing=False, max_eval_memory=None, max_eval_time=None,
+             cached_evaluation=None, split_folds=None, cost_model=None, max_eval_threads=None,
+             max_tasks_per_worker=None, max_worker_rss=None, evaluation_address=None, evaluation_authkey=None,
+             prefetch=None):
+    """ Perform asynchronous evolutionary optimization with the given toolbox.
+
+    If `successive_halving` (a `gama.ea.successive_halving.SuccessiveHalving`) is set, new individuals are first
+    evaluated on a subsample of the data, and individuals are promoted to larger subsamples if they rank well.
+    The fidelity at which an individual was last evaluated is available as `individual.fitness.fidelity`.
+
+    If `fold_racing` is True and the population is full, the evaluation of a new individual is stopped early when it
+    becomes clear it would be eliminated immediately. Such individuals do not enter the population.
+    Fold racing is not used in conjunction with successive halving.
+
+    If `max_eval_memory` is set, each evaluation process may use at most that many megabytes of memory.
+    Evaluations which run out of memory, or whose process dies, receive a score of -inf.
+
+    If `max_eval_time` is set, evaluation processes which exceed it (plus a grace period) are terminated, and the
+    evaluation receives a score of -inf. This also interrupts evaluations which are stuck in native code.
+
+    If `max_eval_threads` is set, the BLAS and OpenMP thread pools of each evaluation process are limited to that
+    many threads.
+
+    If `max_tasks_per_worker` or `max_worker_rss` (in megabytes) is set, evaluation processes are replaced between
+    evaluations once they evaluated that many jobs or their resident memory exceeds that limit.
+
+    When the EA restarts with a new population, evaluations which have not started yet are cancelled, but running
+    evaluations continue, and their individuals are added to the new population when they complete.
+
+    If `evaluation_address` (host, port) is set, individuals are evaluated by workers which connect to that address
+    with `evaluation_authkey`, see `gama.utilities.generic.remote_dispatcher`, instead of by local child processes.
+    `n_jobs` is then the number of individuals that are evaluated at the same time, and the options of local child
+    processes (memory, threads and replacement) are not used.
+
+    If `cached_evaluation` is set, it is called with the compiled individual before an evaluation on all data is
+    queued. If it returns an `EvaluationResult`, that result is used instead of evaluating the individual.
+
+    If `split_folds` (the number of folds) is set and at least two child processes would otherwise be idle, the folds
+    of a new individual are evaluated as separate jobs, so that they are evaluated in parallel. Each job calls
+    `toolbox.evaluate` with a `fold` keyword argument, and the results of all folds are combined by calling
+    `toolbox.combine_folds(pipeline, fold_results, subsample=subsample)`. Folds are not split with fold racing.
+    Each fold job may take `max_eval_time / split_folds` seconds. Once a fold fails, the other folds are cancelled.
+
+    If the toolbox has a `ranking` (e.g. a `gama.ea.nondominated.ParetoRanking` or a
+    `gama.ea.fitness_table.FitnessTable`), it is created empty and kept up to date with the population, and its
+    `worst` method is used instead of `toolbox.eliminate`. It must select the same individuals `toolbox.eliminate`
+    would.
+
+    After the start population, new individuals are created whenever fewer than `n_jobs + prefetch` individuals
+    are waiting for or in evaluation, so that child processes do not become idle while new individuals are created.
+    `prefetch` defaults to `n_jobs`. The fraction of time child processes were evaluating is logged at the end.
+
+    Individuals wait in a queue until a child process is available to evaluate them. If `cost_model`
+    (a `gama.ea.cost_model.CostModel`) is set, it learns the evaluation time of pipelines from the evaluation results,
+    individuals which are expected to be evaluated fastest are evaluated first, and individuals which are expected to
+    exceed `max_eval_time` are not evaluated at all.
+    """
     if max_time_seconds <= 0 or max_time_seconds > 3e6:
         raise ValueError("'max_time_seconds' must be greater than 0 and less than or equal to 3e6, but was {}."
                          .format(max_time_seconds))
@@ -37,34 +123,203 @@ def async_ea(objectives, start_population, toolbox, evaluation_callback=None, re
         raise ValueError("'n_evaluations' must be non-negative, but was {}.".format(max_n_evaluations))
     if n_jobs <= 0:
         raise ValueError("'n_jobs' must be non-negative, but was {}.".format(n_jobs))
+    if prefetch is not None and prefetch < 0:
+        raise ValueError("'prefetch' must be non-negative, but was {}.".format(prefetch))
 
     start_time = time.time()
     max_population_size = len(start_population)
-    queued_individuals_str = set()
+    queued_pipelines = set()
     queued_individuals = {}
-    logger = MultiprocessingLogger() if n_jobs > 1 else log
-    evaluation_dispatcher = FunctionDispatcher(n_jobs, partial(toolbox.evaluate, logger=logger))
+    # Individuals waiting to be dispatched, as (expected evaluation time, tie-breaker, individual, rung, compiled).
+    pending_individuals = []
+    tie_breaker = itertools.count()
+    cached_results = deque()
+    max_in_flight = n_jobs + (prefetch if prefetch is not None else n_jobs)
+    # Sum over time of the number of child processes that have a job, to compute their utilization.
+    busy_seconds, last_busy_update = 0.0, start_time
+    # Log messages of remote workers are written to the log on their own machine.
+    logger = MultiprocessingLogger() if n_jobs > 1 and evaluation_address is None else log
+    max_memory = max_eval_memory * 2**20 if max_eval_memory is not None else None
+    max_rss = max_worker_rss * 2**20 if max_worker_rss is not None else None
+    # Evaluations get a grace period to stop by themselves on `max_eval_time` first, so they can report it cleanly.
+    hard_timeout = max_eval_time * 1.1 + 1 if max_eval_time is not None else None
+    # Each fold evaluated as a separate job gets its share of `max_eval_time`, see `evaluate_pipeline`.
+    fold_hard_timeout = max_eval_time / split_folds * 1.1 + 1 \
+        if max_eval_time is not None and split_folds is not None else None
+    if evaluation_address is not None:
+        # Workers use their own module logger. Before Python 3.7, a logger can not be pickled to send it to them.
+        evaluation_dispatcher = RemoteFunctionDispatcher(partial(toolbox.evaluate, logger=None),
+                                                         evaluation_address, evaluation_authkey, timeout=hard_timeout)
+    else:
+        evaluation_dispatcher = FunctionDispatcher(n_jobs, partial(toolbox.evaluate, logger=logger),
+                                                   max_memory=max_memory, timeout=hard_timeout,
+                                                   max_threads=max_eval_threads,
+                                                   max_tasks_per_worker=max_tasks_per_worker, max_worker_rss=max_rss,
+                                                   logger=logger if isinstance(logger, MultiprocessingLogger) else None)
     evaluation_dispatcher.start()
 
     def exceed_timeout():
         return (time.time() - start_time) > max_time_seconds
 
-    def queue_individual_for_evaluation(individual):
-        """ Place an individual in the queue for evaluation if it compiles and is not yet queued. """
-        if str(individual) not in queued_individuals_str:
-            queued_individuals_str.add(str(individual))
-            compiled_individual = toolbox.compile(individual)
-            if compiled_individual is not None:
-                identifier = evaluation_dispatcher.queue_evaluation(compiled_individual)
-                queued_individuals[identifier] = individual
+    def race_threshold(pipeline):
+        """ Return a score that the individual of `pipeline` must (likely) exceed to not be eliminated immediately.
+
+        An individual is eliminated immediately if it is dominated by all individuals in the full population.
+        Returns None if this can not be determined before evaluation.
+        """
+        if not fold_racing or successive_halving is not None or len(current_population) < max_population_size:
+            return None
+        if len(objectives) == 2:
+            if objectives[1] != 'size':
+                return None
+            weighted_length = current_population[0].fitness.weights[1] * len(pipeline.steps)
+            if weighted_length > population_fitness.min_wvalues()[1]:
+                return None
+        return population_fitness.min_wvalues()[0]
+
+    def fidelity_of(rung):
+        return successive_halving.fidelities[rung] if successive_halving is not None else 1.0
+
+    def queue_individual_for_evaluation(individual, rung=0):
+        """ Place an individual in the queue for evaluation if it compiles and is not yet queued.
+
+        Individuals are considered the same if their compiled pipelines have the same canonical form.
+        Individuals are only evaluated once on each rung, so promoted individuals can be queued again.
+        Individuals which the cost model expects to exceed `max_eval_time` are not queued.
+        """
+        compiled_individual = toolbox.compile(individual)
+        if compiled_individual is None:
+            return False
+        key = canonical_form(compiled_individual)
+        if key in queued_pipelines and rung == 0:
+            return False
+        queued_pipelines.add(key)
+
+        uses_all_data = successive_halving is None or rung == len(successive_halving.fidelities) - 1
+        if cached_evaluation is not None and uses_all_data:
+            result = cached_evaluation(compiled_individual)
+            if result is not None:
+                cached_results.append((individual, rung, compiled_individual, result))
                 return True
-        return False
+
+        expected_time = cost_model.predict(compiled_individual, fidelity_of(rung)) if cost_model is not None else None
+        if expected_time is not None and max_eval_time is not None and expected_time > max_eval_time:
+            log.debug("Not evaluating {}, its evaluation is expected to take {:.1f}s."
+                      .format(individual, expected_time))
+            return False
+        heapq.heappush(pending_individuals,
+                       (expected_time or 0, next(tie_breaker), individual, rung, compiled_individual))
+        dispatch_pending_individuals()
+        return True
+
+    def dispatch_pending_individuals():
+        """ Dispatch pending individuals, expected fastest first, while there are idle child processes. """
+        while pending_individuals and len(queued_individuals) < n_jobs:
+            _, _, individual, rung, compiled_individual = heapq.heappop(pending_individuals)
+            dispatch(individual, rung, compiled_individual)
+
+    def update_busy_time():
+        """ Add the time since the last update for each child process that has a job. Call before jobs change. """
+        nonlocal busy_seconds, last_busy_update
+        now = time.time()
+        busy_seconds += (now - last_busy_update) * min(len(queued_individuals), n_jobs)
+        last_busy_update = now
+
+    def n_in_flight():
+        """ The number of individuals which are waiting for or in evaluation. """
+        # The folds of an individual which is evaluated fold by fold share their `fold_results`.
+        dispatched = {id(fold_results) if fold is not None else identifier
+                      for identifier, (_, _, fold, fold_results) in queued_individuals.items()}
+        return len(dispatched) + len(pending_individuals) + len(cached_results)
+
+    def queue_new_individuals():
+        """ Create and queue new individuals until `max_in_flight` individuals are waiting for or in evaluation. """
+        while n_in_flight() < max_in_flight:
+            for _ in range(50):
+                new_individual = toolbox.create(current_population, 1)[0]
+                if queue_individual_for_evaluation(new_individual):
+                    break
+            else:
+                log.warning('Unable to create new individual.')
+                return
+
+    def dispatch(individual, rung, compiled_individual):
+        update_busy_time()
+        kwargs = {}
+        if successive_halving is not None:
+            kwargs['subsample'] = successive_halving.fidelities[rung]
+        threshold = race_threshold(compiled_individual)
+        if threshold is not None:
+            kwargs['race_threshold'] = threshold
+
+        idle_workers = n_jobs - len(queued_individuals)
+        if split_folds is not None and threshold is None and idle_workers > 1 and not pending_individuals:
+            fold_results = [None] * split_folds
+            for fold in range(split_folds):
+                identifier = evaluation_dispatcher.queue_evaluation(compiled_individual, fold=fold,
+                                                                    job_timeout=fold_hard_timeout, **kwargs)
+                queued_individuals[identifier] = (individual, rung, fold, fold_results)
+        else:
+            identifier = evaluation_dispatcher.queue_evaluation(compiled_individual, **kwargs)
+            queued_individuals[identifier] = (individual, rung, None, None)
+
+    def cancel_waiting_evaluations():
+        """ Cancel evaluations which have not started, and the other folds of individuals with cancelled folds. """
+        update_busy_time()
+        cancelled = evaluation_dispatcher.cancel_pending()
+        cancelled_folds = [queued_individuals.pop(identifier)[3] for identifier in cancelled]
+        for identifier, (_, _, fold, fold_results) in list(queued_individuals.items()):
+            if fold is not None and any(fold_results is other_folds for other_folds in cancelled_folds):
+                evaluation_dispatcher.cancel(identifier)
+                del queued_individuals[identifier]
+
+    def cancel_other_folds(fold_results, failed_result):
+        """ Cancel the folds of an individual which are still queued or evaluated, after one of its folds failed.
+
+        The individual scores -inf regardless, so the cancelled folds are recorded with the error of the failed fold.
+        """
+        for identifier, (_, _, fold, other_fold_results) in list(queued_individuals.items()):
+            if other_fold_results is fold_results:
+                evaluation_dispatcher.cancel(identifier)
+                del queued_individuals[identifier]
+                fold_results[fold] = FoldResult(None, failed_result.start_datetime, 0, failed_result.error)
+
+    def get_next_dispatched_result():
+        """ Get the next result from the dispatcher which completes the evaluation of an individual.
+
+        Results of individual folds are collected until all folds of the individual are evaluated.
+        """
+        while True:
+            dispatch_pending_individuals()
+            identifier, output, compiled_individual = evaluation_dispatcher.get_next_result()
+            update_busy_time()
+            individual, rung, fold, fold_results = queued_individuals.pop(identifier)
+            subsample = successive_halving.fidelities[rung] if successive_halving is not None else None
+            if isinstance(output, (WorkerDiedError, WorkerTimeoutError)):
+                lost_result = _lost_job_result(output, compiled_individual, fidelity_of(rung))
+                if fold is None:
+                    return individual, rung, compiled_individual, lost_result
+                output = FoldResult(None, lost_result.start_datetime, lost_result.time, output)
+            if fold is None:
+                return individual, rung, compiled_individual, output
+
+            fold_results[fold] = output
+            if output.error is not None:
+                cancel_other_folds(fold_results, output)
+            if all(result is not None for result in fold_results):
+                output = toolbox.combine_folds(compiled_individual, fold_results, subsample=subsample)
+                return individual, rung, compiled_individual, output
 
     def get_next_evaluation_result():
         """ Get a new evaluation result, process it and assign it to the correct individual. """
-        identifier, output, _ = evaluation_dispatcher.get_next_result()
-        individual = queued_individuals[identifier]
-        score, start_time, evaluation_time, length = output
+        if cached_results:
+            individual, rung, compiled_individual, output = cached_results.popleft()
+        else:
+            individual, rung, compiled_individual, output = get_next_dispatched_result()
+        score, start_time, evaluation_time, length, fidelity = output
+        if cost_model is not None and fidelity == fidelity_of(rung):
+            # Evaluations stopped early by fold racing have a lower fidelity, their time is not representative.
+            cost_model.observe(compiled_individual, evaluation_time, fidelity)
         if len(objectives) == 1:
             individual.fitness.values = (score,)
         elif objectives[1] == 'time':
@@ -74,8 +329,11 @@ def async_ea(objectives, start_population, toolbox, evaluation_callback=None, re
 
         individual.fitness.start_time = start_time
         individual.fitness.time = evaluation_time
+        individual.fitness.fidelity = fidelity
+        if successive_halving is not None:
+            successive_halving.record(individual, rung)
 
-        if n_jobs > 1:
+        if isinstance(logger, MultiprocessingLogger):
             logger.flush_to_log(log)
         return individual
 
@@ -84,6 +342,11 @@ def async_ea(objectives, start_population, toolbox, evaluation_callback=None, re
         while should_restart:
             should_restart = False
             current_population = []
+            # The fitness of the current population, so that it can be queried without iterating over individuals.
+            population_fitness = FitnessTable()
+            ranking = toolbox.ranking() if hasattr(toolbox, 'ranking') else None
+            if successive_halving is not None:
+                successive_halving.clear()
 
             log.info('Starting EA with new population.')
             for individual in start_population:
@@ -104,28 +367,54 @@ def async_ea(objectives, start_population, toolbox, evaluation_callback=None, re
                     start_population = toolbox.population(n=max_population_size)
                     break
 
-                current_population.append(individual)
+                if successive_halving is None and individual.fitness.fidelity < 1:
+                    # The evaluation was stopped early by fold racing, because it would be eliminated immediately.
+                    log_parseable_event(log, TOKENS.EA_REMOVE_IND, [individual])
+                    if elimination_callback:
+                        _safe_outside_call(partial(elimination_callback, individual), exceed_timeout)
+                elif not any(individual is ind for ind in current_population):
+                    # Promoted individuals are already part of the population, their fitness is updated in-place.
+                    current_population.append(individual)
+                    population_fitness.add(individual)
+                    if ranking is not None:
+                        ranking.add(individual)
+                else:
+                    population_fitness.update(individual)
+                    if ranking is not None:
+                        ranking.update(individual)
                 if len(current_population) > max_population_size:
-                    to_remove = toolbox.eliminate(current_population, 1)
+                    if ranking is not None:
+                        to_remove = ranking.worst(1)
+                        ranking.remove(to_remove[0])
+                    else:
+                        to_remove = toolbox.eliminate(current_population, 1)
                     log_parseable_event(log, TOKENS.EA_REMOVE_IND, to_remove)
                     current_population.remove(to_remove[0])
+                    population_fitness.remove(to_remove[0])
                     if elimination_callback:
                         _safe_outside_call(partial(elimination_callback, to_remove[0]), exceed_timeout)
 
+                if successive_halving is not None:
+                    promoted, rung = successive_halving.next_promotion()
+                    if promoted is not None:
+                        log_parseable_event(log, TOKENS.EA_PROMOTE_IND, promoted.id, rung)
+                        queue_individual_for_evaluation(promoted, rung)
+
                 if len(current_population) > 1:
-                    for _ in range(50):
-                        new_individual = toolbox.create(current_population, 1)[0]
-                        if queue_individual_for_evaluation(new_individual):
-                            break
-                    else:
-                        log.warning('Unable to create new individual.')
+                    queue_new_individuals()
 
-            evaluation_dispatcher.restart()
+            if should_restart:
+                cancel_waiting_evaluations()
+            cached_results.clear()
+            pending_individuals.clear()
 
     # If the function is terminated early by way of a KeyboardInterrupt, there is no need to communicate to the
     # evaluation processes to shut down, since they handle the KeyboardInterrupt directly.
     # The function should not be terminated early by way of another exception, if it does, it should crash loud.
+    update_busy_time()
     evaluation_dispatcher.stop()
+    elapsed_time = time.time() - start_time
+    log.info("Child processes were evaluating {:.1%} of the time.".format(busy_seconds / (n_jobs * elapsed_time)))
     if not c_mgr:
         log.info('Asynchronous EA terminated because maximum time has elapsed.'
                  '{} individuals have been evaluated.'.format(ind_no))
@@ -103,8 +103,11 @@ def pset_from_config(configuration):
     return pset, parameter_checks
 
 
-def compile_individual(expr, pset, parameter_checks=None, preprocessing_steps=None):
-    """ Compile the individual to a sklearn pipeline."""
+def compile_individual(expr, pset, parameter_checks=None, preprocessing_steps=None, n_jobs=None):
+    """ Compile the individual to a sklearn pipeline.
+
+    If `n_jobs` is set, components which have an `n_jobs` hyperparameter that is not set by the individual use it.
+    """
     # TODO: expr only for compatibility
     ind = expr
     components = []
@@ -125,6 +128,10 @@ def compile_individual(expr, pset, parameter_checks=None, preprocessing_steps=No
         name = prim.name + str(name_counter[prim.name])
         name_counter[prim.name] += 1
 
+        kwarg_terminals = remainder[len(remainder) - n_kwargs:]
+        sets_n_jobs = any(terminal.name.split('=')[0].split('.')[-1] == 'n_jobs' for terminal in kwarg_terminals)
+        if n_jobs is not None and not sets_n_jobs and 'n_jobs' in component.get_params(deep=False):
+            component.set_params(n_jobs=n_jobs)
         components.append((name, component))
         if n_kwargs == 0:
             ind = ind[1:]
@@ -191,7 +198,26 @@ def eliminate_NSGA(pop, n):
 
 
 def eliminate_worst(pop, n):
-    return list(sorted(pop, key=lambda x: x.fitness.wvalues[0]))[-n:]
+    return list(sorted(pop, key=lambda x: x.fitness.wvalues[0]))[:n]
+
+
+def eliminate_within_fidelity(pop, n, eliminate):
+    """ Eliminate n individuals with `eliminate`, only comparing individuals evaluated at the same fidelity.
+
+    Individuals are eliminated from the lowest fidelity at which at least two individuals have been evaluated.
+    If no two individuals share a fidelity, the individual evaluated at the lowest fidelity is eliminated.
+    """
+    eliminated = []
+    pop = list(pop)
+    for _ in range(n):
+        fidelities = sorted(set(ind.fitness.fidelity for ind in pop))
+        by_fidelity = [[ind for ind in pop if ind.fitness.fidelity == fidelity] for fidelity in fidelities]
+        comparable = [group for group in by_fidelity if len(group) > 1]
+        group = comparable[0] if comparable else by_fidelity[0]
+        to_remove = eliminate(group, 1)[0]
+        eliminated.append(to_remove)
+        pop = [ind for ind in pop if ind is not to_remove]
+    return eliminated
 
 
 def offspring_mate_or_mutate(pop, n, cxpb, mutpb, toolbox):
@@ -0,0 +1,71 @@
+""" Canonical forms of pipelines, so that functionally identical pipelines can be recognized as such.
+
+Different individuals may compile to pipelines which behave identically, for example because they only differ in
+a hyperparameter that the estimator ignores given its other hyperparameters, or because a transformer is applied
+twice in a row where applying it once has the same effect. Such pipelines have the same canonical form.
+"""
+import logging
+
+from sklearn.base import BaseEstimator
+
+log = logging.getLogger(__name__)
+
+# Hyperparameters which never affect the predictions of a pipeline.
+ALWAYS_IGNORED_HYPERPARAMETERS = {'n_jobs', 'verbose', 'copy'}
+
+# For each estimator (by class name), a function which takes the hyperparameters of an instance and returns the names
+# of hyperparameters which the instance ignores given its other hyperparameter values.
+IGNORED_HYPERPARAMETERS = {
+    'KNeighborsClassifier': lambda params: {'p'} if params['metric'] != 'minkowski' else set(),
+    'KNeighborsRegressor': lambda params: {'p'} if params['metric'] != 'minkowski' else set(),
+    'Nystroem': lambda params: ({'gamma', 'degree', 'coef0'}
+                                if params['kernel'] in ['linear', 'cosine', 'additive_chi2'] else set()),
+    'PCA': lambda params: {'iterated_power'} if params['svd_solver'] != 'randomized' else set(),
+}
+
+# Transformers (by class name) for which applying the same instance twice in a row is the same as applying it once.
+IDEMPOTENT_TRANSFORMERS = {'StandardScaler', 'MinMaxScaler', 'MaxAbsScaler', 'RobustScaler', 'Normalizer',
+                           'VarianceThreshold', 'Imputer', 'SimpleImputer'}
+
+
+def _canonical_value(value):
+    if isinstance(value, BaseEstimator):
+        return canonical_step(value)
+    if callable(value):
+        # The default representation of functions contains their memory address, which differs between processes.
+        return '{}.{}'.format(getattr(value, '__module__', ''), getattr(value, '__qualname__', repr(value)))
+    return repr(value)
+
+
+def canonical_step(step):
+    """ Return a string which represents the estimator by its class and the hyperparameters it does not ignore. """
+    name = step.__class__.__name__
+    params = step.get_params(deep=False)
+    ignored = set(ALWAYS_IGNORED_HYPERPARAMETERS)
+    if name in IGNORED_HYPERPARAMETERS:
+        try:
+            ignored |= IGNORED_HYPERPARAMETERS[name](params)
+        except KeyError:
+            # E.g. an estimator with the same name, but different hyperparameters, from another library.
+            log.debug("Could not determine ignored hyperparameters of {}.".format(step), exc_info=True)
+    effective_params = ','.join('{}={}'.format(param, _canonical_value(value))
+                                for param, value in sorted(params.items()) if param not in ignored)
+    return '{}({})'.format(name, effective_params)
+
+
+def canonical_form(pipeline):
+    """ Return a string which is equal for pipelines which behave identically.
+
+    The canonical form consists of the canonical form of each step (see `canonical_step`), where consecutive
+    identical steps are collapsed into one if the transformer is idempotent. Step names are not part of the form.
+
+    :param pipeline: a scikit-learn Pipeline.
+    :return: str
+    """
+    steps = []
+    for _, step in pipeline.steps:
+        canonical = canonical_step(step)
+        if steps and steps[-1] == canonical and step.__class__.__name__ in IDEMPOTENT_TRANSFORMERS:
+            continue
+        steps.append(canonical)
+    return ' > '.join(steps)
@@ -0,0 +1,118 @@
+""" An online model of the time it takes to evaluate a pipeline, learned from the evaluations during search.
+
+The model is a ridge regression of the logarithm of the evaluation time on features of the pipeline and the data:
+which estimators the pipeline consists of, their hyperparameter values, and the (subsampled) number of samples and
+number of features of the data. The feature space grows as new estimators and hyperparameter values are observed.
+"""
+import logging
+import math
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_MIN_TIME = 1e-3  # seconds, evaluation times are clipped to this value before taking the logarithm.
+
+
+def _numeric_feature(value):
+    """ Map a number to a feature which grows logarithmically in its magnitude. """
+    return math.copysign(math.log1p(abs(value)), value)
+
+
+def pipeline_features(pipeline, n_samples, n_features):
+    """ Return a dict with the features of the pipeline evaluated on data of the given size.
+
+    :param pipeline: a scikit-learn Pipeline.
+    :param n_samples: number of samples the pipeline is fit on.
+    :param n_features: number of features of the data.
+    :return: dict which maps the name of each feature to its value.
+    """
+    features = {'log_n_samples': math.log(max(n_samples, 1)), 'log_n_features': math.log(max(n_features, 1))}
+    for _, step in pipeline.steps:
+        name = step.__class__.__name__
+        features[name] = features.get(name, 0) + 1
+        for param, value in step.get_params(deep=False).items():
+            if isinstance(value, bool):
+                features['{}.{}'.format(name, param)] = float(value)
+            elif isinstance(value, (int, float)) and math.isfinite(value):
+                features['{}.{}'.format(name, param)] = _numeric_feature(value)
+            elif isinstance(value, str):
+                features['{}.{}={}'.format(name, param, value)] = 1.0
+    return features
+
+
+class CostModel(object):
+    """ Predicts the evaluation time of pipelines from the evaluation times observed so far.
+
+    Predictions are only made once `min_observations` evaluations have been observed. The regression is refit when
+    the number of observations has grown by `refit_fraction` since the last fit, so the cost of fitting the model
+    is amortized over the evaluations.
+    """
+
+    def __init__(self, min_observations=30, refit_fraction=0.1, alpha=1.0):
+        """
+        :param min_observations: positive integer (default=30). Number of observations required for predictions.
+        :param refit_fraction: positive float (default=0.1). Relative growth of the number of observations after
+            which the model is refit.
+        :param alpha: positive float (default=1.0). Regularization strength of the ridge regression.
+        """
+        self._min_observations = min_observations
+        self._refit_fraction = refit_fraction
+        self._alpha = alpha
+        self._n_samples = 1
+        self._n_features = 1
+        self._columns = {}
+        self._observations = []
+        self._log_times = []
+        self._coefficients = None
+        self._n_fitted = 0
+
+    def set_data_shape(self, n_samples, n_features):
+        """ Set the size of the data on which pipelines are evaluated with fidelity 1. """
+        self._n_samples, self._n_features = n_samples, n_features
+
+    def _features(self, pipeline, fidelity):
+        return pipeline_features(pipeline, self._n_samples * fidelity, self._n_features)
+
+    def observe(self, pipeline, evaluation_time, fidelity=1.0):
+        """ Record that evaluating `pipeline` on a `fidelity` fraction of the data took `evaluation_time` seconds. """
+        features = self._features(pipeline, fidelity)
+        for name in features:
+            self._columns.setdefault(name, len(self._columns))
+        self._observations.append(features)
+        self._log_times.append(math.log(max(evaluation_time, _MIN_TIME)))
+
+        n_observations = len(self._observations)
+        if (n_observations >= self._min_observations
+                and n_observations >= self._n_fitted * (1 + self._refit_fraction)):
+            self._fit()
+
+    def _fit(self):
+        X = np.zeros((len(self._observations), len(self._columns) + 1))
+        X[:, -1] = 1  # intercept
+        for row, features in enumerate(self._observations):
+            for name, value in features.items():
+                X[row, self._columns[name]] = value
+        y = np.asarray(self._log_times)
+
+        # Ridge regression, with the intercept not regularized.
+        regularization = self._alpha * np.eye(X.shape[1])
+        regularization[-1, -1] = 0
+        self._coefficients = np.linalg.lstsq(X.T @ X + regularization, X.T @ y, rcond=None)[0]
+        self._n_fitted = len(self._observations)
+        log.debug("Fit cost model on {} observations with {} features.".format(X.shape[0], X.shape[1] - 1))
+
+    def predict(self, pipeline, fidelity=1.0):
+        """ Return the expected evaluation time in seconds of `pipeline` on a `fidelity` fraction of the data,
+        or None if too few evaluations have been observed.
+
+        Features which were not observed when the model was last fit do not contribute to the prediction.
+        """
+        if self._coefficients is None:
+            return None
+        log_time = self._coefficients[-1]
+        for name, value in self._features(pipeline, fidelity).items():
+            column = self._columns.get(name)
+            if column is not None and column < len(self._coefficients) - 1:
+                log_time += self._coefficients[column] * value
+        return math.exp(log_time)
@@ -1,48 +1,175 @@
+from collections import namedtuple
 from datetime import datetime
-import os
-import pickle
 import time
-import uuid
 
+import numpy as np
+from scipy import sparse
 import stopit
-from sklearn.model_selection import cross_val_predict
+from sklearn.base import clone
+from sklearn.utils import safe_indexing
 
 from gama.ea.automl_gp import log
 from gama.ea.metrics import Metric
+from gama.utilities.generic.lru_cache import LRUCache
 from gama.utilities.logging_utilities import MultiprocessingLogger, TOKENS, log_parseable_event
+from gama.utilities.persistent_cache import pipeline_key
 
+# `fidelity` is the fraction of the training data on which the pipeline was fit in each fold.
+EvaluationResult = namedtuple("EvaluationResult", ['score', 'start_datetime', 'time', 'length', 'fidelity'])
+# `error` is None if the fold was evaluated successfully, otherwise it describes why the evaluation failed.
+FoldResult = namedtuple("FoldResult", ['predictions', 'start_datetime', 'time', 'error'])
 
-def cross_val_predict_score(estimator, X, y_train, y_score, groups=None, scoring=None, cv=None, n_jobs=1, verbose=0,
-                            fit_params=None, pre_dispatch='2*n_jobs'):
-    """ Return both the predictions and score of the estimator trained on the data given the cv strategy.
-    # TODO: Add reference to underlying sklearn cross_val_predict for parameter descriptions.
 
-    :param estimator: the estimator to evaluate
-    :param X:
-    :param y_train: target in appropriate format for training (typically (N,))
-    :param y_score: target in appropriate format for scoring (typically (N,K) for metrics based on class probabilities,
-        (N,) otherwise).
-    :param groups:
-    :param scoring:
-    :param cv:
-    :param n_jobs:
-    :param verbose:
-    :param fit_params:
-    :param pre_dispatch:
-    :return:
+def _nbytes(data):
+    """ Estimate the number of bytes used by a numpy array, sparse matrix or DataFrame. """
+    if sparse.issparse(data):
+        return sum(getattr(data, attr).nbytes for attr in ['data', 'indices', 'indptr', 'row', 'col']
+                   if hasattr(data, attr))
+    if hasattr(data, 'memory_usage'):
+        return int(data.memory_usage(index=True).sum())
+    return getattr(data, 'nbytes', 0)
+
+
+def step_signature(step):
+    """ Return a string that identifies the configuration (class and hyperparameters) of a pipeline step. """
+    params = step.get_params(deep=False)
+    param_strings = ['{}={!r}'.format(name, value) for (name, value) in sorted(params.items())]
+    return '{}({})'.format(step.__class__.__name__, ', '.join(param_strings))
+
+
+def _prefix_entry_nbytes(entry):
+    """ The number of bytes of the transformed data in a `PrefixCache` entry (transformer, Xt_train, Xt_test). """
+    return _nbytes(entry[1]) + _nbytes(entry[2])
+
+
+class PrefixCache(LRUCache):
+    """ Stores the fitted transformers of pipeline prefixes alongside the train and validation data they output.
+
+    Pipelines found during search often share their leading steps. By caching the output of such a prefix for each
+    fold, only the steps which follow the longest cached prefix need to be fit for any new pipeline.
+    Entries are evicted in least recently used order once `max_memory` bytes are used by the transformed data.
     """
+
+    def __init__(self, max_memory):
+        # A module-level function rather than a lambda, so that the cache can be pickled, e.g. for remote workers.
+        super().__init__(max_memory, size_fn=_prefix_entry_nbytes)
+
+
+def fit_predict_fold(estimator, X_train, y_train, X_test, method='predict', fold_key=None, prefix_cache=None):
+    """ Fit a clone of the estimator on the training data and return its predictions for the test data.
+
+    :param estimator: the estimator to fit. The estimator itself is not modified.
+    :param X_train: data to fit the estimator on.
+    :param y_train: targets to fit the estimator on.
+    :param X_test: data to make predictions for.
+    :param method: name of the method of the estimator which produces the predictions.
+    :param fold_key: hashable (default=None). Identifies the train/test data, required if `prefix_cache` is set.
+    :param prefix_cache: `PrefixCache` or None (default=None).
+        If set, transformed data for each prefix of the pipeline is retrieved from or stored in the cache.
+    :return: predictions for X_test.
+    """
+    if prefix_cache is None or not hasattr(estimator, 'steps'):
+        estimator = clone(estimator)
+        estimator.fit(X_train, y_train)
+        return getattr(estimator, method)(X_test)
+
+    prefix_key = (fold_key,)
+    Xt_train, Xt_test = X_train, X_test
+    for _, transformer in estimator.steps[:-1]:
+        prefix_key = prefix_key + (step_signature(transformer),)
+        cached = prefix_cache.get(prefix_key)
+        if cached is None:
+            # Cached data is reused by later pipelines, which relies on transformers not modifying their input.
+            transformer = clone(transformer)
+            Xt_train = transformer.fit_transform(Xt_train, y_train)
+            Xt_test = transformer.transform(Xt_test)
+            prefix_cache.put(prefix_key, (transformer, Xt_train, Xt_test))
+        else:
+            _, Xt_train, Xt_test = cached
+
+    final_estimator = clone(estimator.steps[-1][1])
+    final_estimator.fit(Xt_train, y_train)
+    return getattr(final_estimator, method)(Xt_test)
+
+
+def optimistic_score(fold_scores):
+    """ An optimistic estimate of the cross-validation score, given the scores of only some of the folds.
+
+    The estimate is the upper bound of the (roughly 95%) confidence interval of the mean fold score.
+    """
+    standard_error = np.std(fold_scores, ddof=1) / np.sqrt(len(fold_scores))
+    return np.mean(fold_scores) + 2 * standard_error
+
+
+def _as_metric(scoring):
     if isinstance(scoring, Metric):
-        metric = scoring
+        return scoring
     elif isinstance(scoring, str):
-        metric = Metric(scoring)
-    else:
-        raise ValueError('Parameter `scoring` must be an instance of `str` or `gama.ea.metrics.Metric`, is {}.'
-                         .format(type(scoring)))
+        return Metric(scoring)
+    raise ValueError('Parameter `scoring` must be an instance of `str` or `gama.ea.metrics.Metric`, is {}.'
+                     .format(type(scoring)))
+
+
+def cross_val_predict_score(estimator, folds, scoring=None, prefix_cache=None, subsample=None, race_threshold=None):
+    """ Return both the predictions and score of the estimator trained on the data of each fold.
 
+    Unlike scikit-learn's `cross_val_predict`, each fold is fit by `fit_predict_fold`,
+    which allows for pipeline prefixes to be reused across calls through the `prefix_cache`.
+
+    :param estimator: the estimator to evaluate
+    :param folds: `gama.ea.folds.Folds`. The data splits to cross-validate the estimator on.
+    :param scoring: string or `gama.ea.metrics.Metric`. The metric to score the out-of-fold predictions with.
+    :param prefix_cache: `PrefixCache` or None (default=None). Cache to reuse fitted pipeline prefixes with.
+    :param subsample: float in (0, 1] or None (default=None). If set, the estimator is fit on only a (stratified for
+        classifiers) fraction of the training data of each fold. Predictions are still made for all validation data.
+        The selected subsample is the same for each call.
+    :param race_threshold: float or None (default=None). If set, folds are scored as they are evaluated, and
+        evaluation stops when after at least two folds `optimistic_score` of the fold scores is below this threshold.
+    :return: a tuple (predictions, score, fraction).
+        predictions are the out-of-fold predictions for `folds.validation_indices`, score is their score, and fraction
+        is the fraction of folds that was evaluated.
+        If evaluation stopped early, predictions is None and score is determined on evaluated folds.
+    """
+    metric = _as_metric(scoring)
     method = 'predict_proba' if metric.requires_probabilities else 'predict'
-    predictions = cross_val_predict(estimator, X, y_train, groups, cv, n_jobs, verbose, fit_params, pre_dispatch, method)
-    score = metric.maximizable_score(y_score, predictions)
-    return predictions, score
+
+    predictions = None
+    fold_scores, evaluated = [], []
+    for fold_index in range(len(folds)):
+        X_train, y_train, X_test, y_score_test, test = folds.fold(fold_index, subsample)
+        fold_predictions = fit_predict_fold(estimator, X_train, y_train, X_test, method=method,
+                                            fold_key=(fold_index, subsample), prefix_cache=prefix_cache)
+        if predictions is None:
+            predictions = np.empty((folds.n_samples, *fold_predictions.shape[1:]), dtype=fold_predictions.dtype)
+        predictions[test] = fold_predictions
+
+        if race_threshold is not None and len(folds) - fold_index > 1:
+            evaluated.append(test)
+            fold_scores.append(metric.maximizable_score(y_score_test, fold_predictions))
+            if len(fold_scores) >= 2 and optimistic_score(fold_scores) < race_threshold:
+                evaluated = np.concatenate(evaluated)
+                score = metric.maximizable_score(safe_indexing(folds.y_score, evaluated), predictions[evaluated])
+                return None, score, len(fold_scores) / len(folds)
+
+    predictions, score = out_of_fold_score(folds, predictions, metric)
+    return predictions, score, 1.0
+
+
+def out_of_fold_score(folds, predictions, metric):
+    """ Return the out-of-fold predictions for the validated samples and their score.
+
+    :param folds: `gama.ea.folds.Folds`.
+    :param predictions: numpy array with a prediction for each sample in `folds`, as assembled from the predictions
+        of each fold. Predictions for samples which are not validated may have any value.
+    :param metric: `gama.ea.metrics.Metric`.
+    :return: a tuple (predictions, score).
+    """
+    y_score = folds.y_score
+    if len(folds.validation_indices) < folds.n_samples:
+        # With holdout validation, there are no predictions for the other samples.
+        predictions = predictions[folds.validation_indices]
+        y_score = safe_indexing(y_score, folds.validation_indices)
+    return predictions, metric.maximizable_score(y_score, predictions)
 
 
 def object_is_valid_pipeline(o):
@@ -53,25 +180,69 @@ def object_is_valid_pipeline(o):
             hasattr(o, 'steps'))
 
 
-def evaluate_pipeline(pl, X, y_train, y_score, timeout, scoring='accuracy', cv=5, cache_dir=None, logger=None):
-    """ Evaluates a pipeline used k-Fold CV. """
+def _store_predictions(evaluation_store, pl, predictions, score):
+    try:
+        evaluation_store.append(pl, predictions, score)
+    except FileNotFoundError:
+        log.warning("File not found while saving predictions. This can happen in the multi-process case if the "
+                    "cache gets deleted within `max_eval_time` of the end of the search process.", exc_info=True)
+
+
+def evaluate_pipeline(pl, folds, timeout, scoring='accuracy', evaluation_store=None, logger=None,
+                      prefix_cache=None, subsample=None, race_threshold=None, persistent_cache=None, fold=None):
+    """ Evaluates a pipeline on the given `gama.ea.folds.Folds`.
+
+    Fitted pipeline prefixes are reused if `prefix_cache` is specified.
+    If `evaluation_store` (a `gama.utilities.evaluation_store.EvaluationStore`) is specified, the pipeline and its
+    predictions are appended to it if the evaluation on all data is successful. Predictions of pipelines fit on a
+    subsample are not stored, as they should not be used for ensembling.
+    If `persistent_cache` (a `gama.utilities.persistent_cache.PersistentCache`) is specified, the result of a complete
+    evaluation on all data is stored in it, unless the evaluation ran out of time or memory.
+
+    If `subsample` is set, in each fold the pipeline is only fit on that fraction of the training data.
+    If `race_threshold` is set, evaluation may stop before all folds are evaluated if the pipeline is unlikely to
+    achieve a score of at least `race_threshold`, in which case the fidelity of the result is reduced accordingly.
+    Returns an `EvaluationResult`.
+
+    If `fold` is set, only the fold with that index is evaluated and a `FoldResult` is returned instead,
+    see `evaluate_fold`. The evaluation store and persistent cache are then not used. The fold may take
+    `timeout / len(folds)` seconds, so that the pipeline has the same time budget as when its folds are evaluated
+    in one job.
+    """
     if not logger:
         logger = log
 
     if not object_is_valid_pipeline(pl):
         return ValueError('Pipeline is not valid. Must not be None and have `fit`, `predict` and `steps`.')
 
+    if fold is not None:
+        fold_timeout = timeout / len(folds) if timeout is not None else None
+        return evaluate_fold(pl, folds, fold, fold_timeout, scoring=scoring, logger=logger,
+                             prefix_cache=prefix_cache, subsample=subsample)
+
     start_datetime = datetime.now()
     start = time.process_time()
+    folds_fraction = 1.0
+    prediction = None
+    out_of_memory = False
     with stopit.ThreadingTimeout(timeout) as c_mgr:
         try:
-            prediction, score = cross_val_predict_score(pl, X, y_train, y_score, cv=cv, scoring=scoring)
+            prediction, score, folds_fraction = cross_val_predict_score(pl, folds, scoring=scoring,
+                                                                        prefix_cache=prefix_cache,
+                                                                        subsample=subsample,
+                                                                        race_threshold=race_threshold)
         except stopit.TimeoutException:
             # score not actually unused, because exception gets caught by the context manager.
             score = float('-inf')
             raise
         except KeyboardInterrupt:
             raise
+        except MemoryError:
+            logger.info('MemoryError encountered while evaluating pipeline.')
+            single_line_pipeline = str(pl).replace('\n', '')
+            log_parseable_event(logger, TOKENS.EVALUATION_OOM, start_datetime, single_line_pipeline)
+            score = -float("inf")
+            out_of_memory = True
         except Exception as e:
             if isinstance(logger, MultiprocessingLogger):
                 logger.info('{} encountered while evaluating pipeline.'.format(type(e)))
@@ -82,18 +253,13 @@ def evaluate_pipeline(pl, X, y_train, y_score, timeout, scoring='accuracy', cv=5
             log_parseable_event(logger, TOKENS.EVALUATION_ERROR, start_datetime, single_line_pipeline, type(e), e)
             score = -float("inf")
 
-    if cache_dir and score != -float("inf"):
-        pl_filename = str(uuid.uuid4())
-
-        try:
-            with open(os.path.join(cache_dir, pl_filename + '.pkl'), 'wb') as fh:
-                pickle.dump((pl, prediction, score), fh)
-        except FileNotFoundError:
-            log.warning("File not found while saving predictions. This can happen in the multi-process case if the "
-                        "cache gets deleted within `max_eval_time` of the end of the search process.", exc_info=True)
+    on_all_data = subsample is None or subsample == 1
+    if evaluation_store is not None and on_all_data and score != -float("inf") and prediction is not None:
+        _store_predictions(evaluation_store, pl, prediction, score)
 
     evaluation_time = time.process_time() - start
     pipeline_length = len(pl.steps)
+    fidelity = (subsample if subsample is not None else 1.0) * folds_fraction
 
     if c_mgr.state == c_mgr.INTERRUPTED:
         # A TimeoutException was raised, but not by the context manager.
@@ -103,13 +269,107 @@ def evaluate_pipeline(pl, X, y_train, y_score, timeout, scoring='accuracy', cv=5
 
     if not c_mgr:
         # For now we treat a eval timeout the same way as e.g. NaN exceptions.
-        fitness_values = (-float("inf"), start_datetime, timeout, pipeline_length)
+        fitness_values = EvaluationResult(-float("inf"), start_datetime, timeout, pipeline_length, fidelity)
         logger.info('Timeout encountered while evaluating pipeline.')
 
         single_line_pipeline = ''.join(str(pl).split('\n'))
         log_parseable_event(logger, TOKENS.EVALUATION_TIMEOUT, start_datetime, single_line_pipeline)
         logger.debug("Timeout after {}s: {}".format(timeout, pl))
     else:
-        fitness_values = (score, start_datetime, evaluation_time, pipeline_length)
+        fitness_values = EvaluationResult(score, start_datetime, evaluation_time, pipeline_length, fidelity)
+        if persistent_cache is not None and fidelity == 1 and not out_of_memory:
+            persistent_cache.put(pipeline_key(pl), score, evaluation_time, pipeline_length, pl, prediction)
 
     return fitness_values
+
+
+def evaluate_fold(pl, folds, fold, timeout, scoring='accuracy', logger=None, prefix_cache=None, subsample=None):
+    """ Evaluates a pipeline on a single fold of the given `gama.ea.folds.Folds`.
+
+    This allows the folds of one pipeline to be evaluated in parallel, the results of all folds are combined with
+    `combine_fold_results`. Returns a `FoldResult`, its error is None or one of `TOKENS.EVALUATION_ERROR`,
+    `TOKENS.EVALUATION_TIMEOUT` and `TOKENS.EVALUATION_OOM`. Failures are logged as in `evaluate_pipeline`.
+    """
+    if not logger:
+        logger = log
+    method = 'predict_proba' if _as_metric(scoring).requires_probabilities else 'predict'
+    single_line_pipeline = str(pl).replace('\n', '')
+
+    start_datetime = datetime.now()
+    start = time.process_time()
+    predictions, error = None, None
+    with stopit.ThreadingTimeout(timeout) as c_mgr:
+        try:
+            X_train, y_train, X_test, _, _ = folds.fold(fold, subsample)
+            predictions = fit_predict_fold(pl, X_train, y_train, X_test, method=method,
+                                           fold_key=(fold, subsample), prefix_cache=prefix_cache)
+        except stopit.TimeoutException:
+            raise
+        except KeyboardInterrupt:
+            raise
+        except MemoryError:
+            logger.info('MemoryError encountered while evaluating pipeline.')
+            log_parseable_event(logger, TOKENS.EVALUATION_OOM, start_datetime, single_line_pipeline)
+            error = TOKENS.EVALUATION_OOM
+        except Exception as e:
+            if isinstance(logger, MultiprocessingLogger):
+                logger.info('{} encountered while evaluating pipeline.'.format(type(e)))
+            else:
+                logger.info('{} encountered while evaluating pipeline.'.format(type(e)), exc_info=True)
+            log_parseable_event(logger, TOKENS.EVALUATION_ERROR, start_datetime, single_line_pipeline, type(e), e)
+            error = TOKENS.EVALUATION_ERROR
+
+    if c_mgr.state == c_mgr.INTERRUPTED:
+        logger.info("Outer-timeout during evaluation of {}".format(pl))
+        raise stopit.utils.TimeoutException()
+
+    if not c_mgr:
+        logger.info('Timeout encountered while evaluating pipeline.')
+        log_parseable_event(logger, TOKENS.EVALUATION_TIMEOUT, start_datetime, single_line_pipeline)
+        predictions, error = None, TOKENS.EVALUATION_TIMEOUT
+    return FoldResult(predictions, start_datetime, time.process_time() - start, error)
+
+
+def combine_fold_results(pl, fold_results, folds, scoring='accuracy', subsample=None, evaluation_store=None,
+                         persistent_cache=None):
+    """ Combine the `FoldResult` of each fold of the pipeline into one `EvaluationResult`.
+
+    The out-of-fold predictions are assembled and scored as in `evaluate_pipeline`, and stored in the
+    `evaluation_store` and `persistent_cache` if specified and the folds were evaluated on all data (not on a
+    subsample). If any fold failed, the score is -inf.
+    A failed result is only stored in the persistent cache if all failures were errors raised by the pipeline,
+    rather than the evaluation running out of time or memory.
+
+    :param pl: the evaluated pipeline.
+    :param fold_results: list with the `FoldResult` of each fold, in the order of the folds.
+    :param folds: `gama.ea.folds.Folds` on which the pipeline was evaluated.
+    :param scoring: string or `gama.ea.metrics.Metric`.
+    :param subsample: float in (0, 1] or None (default=None). The subsample the folds were evaluated with.
+    :param evaluation_store: `gama.utilities.evaluation_store.EvaluationStore` or None (default=None).
+    :param persistent_cache: `gama.utilities.persistent_cache.PersistentCache` or None (default=None).
+    :return: `EvaluationResult`. Its time is the total time of all folds.
+    """
+    start_datetime = min(result.start_datetime for result in fold_results)
+    evaluation_time = sum(result.time for result in fold_results)
+    pipeline_length = len(pl.steps)
+    fidelity = subsample if subsample is not None else 1.0
+    errors = [result.error for result in fold_results if result.error is not None]
+
+    predictions, score = None, -float("inf")
+    if not errors:
+        for index, result in enumerate(fold_results):
+            if predictions is None:
+                predictions = np.empty((folds.n_samples, *result.predictions.shape[1:]),
+                                       dtype=result.predictions.dtype)
+            predictions[folds.splits[index][1]] = result.predictions
+        try:
+            predictions, score = out_of_fold_score(folds, predictions, _as_metric(scoring))
+        except Exception as e:
+            log.info('{} encountered while scoring pipeline.'.format(type(e)), exc_info=True)
+            predictions, errors = None, [TOKENS.EVALUATION_ERROR]
+
+    if evaluation_store is not None and fidelity == 1 and score != -float("inf") and predictions is not None:
+        _store_predictions(evaluation_store, pl, predictions, score)
+    if persistent_cache is not None and fidelity == 1 and all(error == TOKENS.EVALUATION_ERROR for error in errors):
+        persistent_cache.put(pipeline_key(pl), score, evaluation_time, pipeline_length, pl, predictions)
+    return EvaluationResult(score, start_datetime, evaluation_time, pipeline_length, fidelity)
@@ -0,0 +1,141 @@
+""" The fitness of a collection of individuals stored column-wise in numpy arrays, see `FitnessTable`. """
+import numpy as np
+
+
+class FitnessTable(object):
+    """ The weighted fitness values and evaluation times of a collection of individuals, one row per individual.
+
+    Queries over the fitness (worst, best, tournaments) are vectorized over the rows, instead of sorting lists of
+    individuals by their `fitness.wvalues`. Individuals are stored with the `fitness.wvalues` and `fitness.time`
+    they have when they are added, so an individual whose fitness changes must be updated with `update`.
+    Removing an individual moves the last row to its place, so rows are not in the order individuals were added.
+    """
+
+    def __init__(self, individuals=(), capacity=64):
+        """
+        :param individuals: iterable (default=()). Individuals to add to the table.
+        :param capacity: positive integer (default=64). Number of rows to allocate at first. The arrays are
+            doubled in size whenever they are full.
+        """
+        self._wvalues = None
+        self._times = np.empty(capacity)
+        self._individuals = []
+        # Maps the id of each individual to its row.
+        self._rows = {}
+        for individual in individuals:
+            self.add(individual)
+
+    def __len__(self):
+        return len(self._individuals)
+
+    def __contains__(self, individual):
+        return id(individual) in self._rows
+
+    @property
+    def individuals(self):
+        """ List of the individuals, in the order of the rows. """
+        return list(self._individuals)
+
+    @property
+    def wvalues(self):
+        """ Array of shape (n_individuals, n_objectives) with the weighted fitness values of each row. """
+        return self._wvalues[:len(self)] if self._wvalues is not None else np.empty((0, 0))
+
+    @property
+    def times(self):
+        """ Array with the evaluation time of each row. """
+        return self._times[:len(self)]
+
+    def _write(self, row, individual):
+        self._wvalues[row] = individual.fitness.wvalues
+        self._times[row] = getattr(individual.fitness, 'time', np.nan)
+
+    def add(self, individual):
+        """ Add `individual` in a new row. """
+        wvalues = individual.fitness.wvalues
+        if self._wvalues is None:
+            self._wvalues = np.empty((len(self._times), len(wvalues)))
+        elif len(wvalues) != self._wvalues.shape[1]:
+            raise ValueError("Individuals in the table have {} fitness values, but the new individual has {}."
+                             .format(self._wvalues.shape[1], len(wvalues)))
+        if len(self) == len(self._times):
+            self._wvalues = np.concatenate([self._wvalues, np.empty_like(self._wvalues)])
+            self._times = np.concatenate([self._times, np.empty_like(self._times)])
+
+        row = len(self)
+        self._individuals.append(individual)
+        self._rows[id(individual)] = row
+        self._write(row, individual)
+
+    def remove(self, individual):
+        """ Remove the row of `individual`. """
+        row = self._rows.pop(id(individual))
+        last = len(self) - 1
+        if row != last:
+            self._wvalues[row] = self._wvalues[last]
+            self._times[row] = self._times[last]
+            self._individuals[row] = self._individuals[last]
+            self._rows[id(self._individuals[row])] = row
+        self._individuals.pop()
+
+    def update(self, individual):
+        """ Store the current fitness of `individual`, which is added if it is not in the table yet. """
+        if individual in self:
+            self._write(self._rows[id(individual)], individual)
+        else:
+            self.add(individual)
+
+    def worst(self, n=1):
+        """ Return the `n` individuals with the lowest first weighted fitness value, worst first.
+
+        This selects the same individuals as `gama.ea.automl_gp.eliminate_worst`, except that ties may be broken
+        differently, as rows are not kept in the order of the population.
+        """
+        if len(self) == 0:
+            return []
+        scores = self.wvalues[:, 0]
+        if n < len(self):
+            candidates = np.argpartition(scores, n - 1)[:n]
+            rows = candidates[np.argsort(scores[candidates], kind='mergesort')]
+        else:
+            rows = np.argsort(scores, kind='mergesort')
+        return [self._individuals[row] for row in rows]
+
+    def best(self, n=1, key=None):
+        """ Return the `n` individuals with the highest first weighted fitness value, best first.
+
+        :param n: integer (default=1). Number of individuals to return, fewer if the table has fewer rows.
+        :param key: function or None (default=None). If set, individuals with the same score are ordered by it.
+        """
+        if len(self) == 0:
+            return []
+        scores = self.wvalues[:, 0]
+        if n < len(self):
+            # All rows which score at least as well as the n-th best, so that ties at the n-th place are included.
+            nth_best = -np.partition(-scores, n - 1)[n - 1]
+            rows = np.flatnonzero(scores >= nth_best)
+        else:
+            rows = np.arange(len(self))
+        if key is None:
+            ranked = rows[np.argsort(-scores[rows], kind='mergesort')]
+            return [self._individuals[row] for row in ranked[:n]]
+        ranked = sorted(rows, key=lambda row: (-scores[row], key(self._individuals[row])))
+        return [self._individuals[row] for row in ranked[:n]]
+
+    def min_wvalues(self):
+        """ Array with the lowest weighted value of each objective, or None if the table is empty. """
+        return self.wvalues.min(axis=0) if len(self) > 0 else None
+
+    def tournament(self, k, tournsize=3, random_state=np.random):
+        """ Select `k` individuals with tournaments on the first weighted fitness value.
+
+        Like `deap.tools.selTournament`: each tournament draws `tournsize` rows with replacement, and the one with
+        the highest score wins.
+
+        :param k: integer. Number of individuals to select.
+        :param tournsize: integer (default=3). Number of individuals in each tournament.
+        :param random_state: object with a numpy `randint` method (default=np.random).
+        """
+        aspirants = random_state.randint(0, len(self), size=(k, tournsize))
+        winners = aspirants[np.arange(k), np.argmax(self.wvalues[aspirants, 0], axis=1)]
+        return [self._individuals[row] for row in winners]
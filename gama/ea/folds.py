@@ -0,0 +1,132 @@
+import logging
+import os
+
+import numpy as np
+from sklearn.model_selection import check_cv, ShuffleSplit, StratifiedShuffleSplit
+from sklearn.utils import safe_indexing
+
+from gama.utilities.generic.memmapped_array import MemmappedArray
+
+log = logging.getLogger(__name__)
+
+
+def _store(data, directory, name):
+    """ Store data contiguously, in a memory-mapped file in `directory` if possible.
+
+    Data which is not a numpy array with a numeric dtype (e.g. a DataFrame) is returned unaltered.
+    """
+    if not isinstance(data, np.ndarray) or data.dtype == object:
+        return data
+    if directory is None:
+        return np.ascontiguousarray(data)
+    return MemmappedArray(data, os.path.join(directory, name + '.npy'))
+
+
+def _load(data):
+    return data.array if isinstance(data, MemmappedArray) else data
+
+
+def validation_splitter(cv=5, y=None, stratify=True, repeats=1, random_state=None):
+    """ Return a cross-validation generator for the validation strategy.
+
+    :param cv: int, float, cross-validation generator or iterable (default=5).
+        If a float in (0, 1), each split is a (stratified if `stratify`) holdout split with this fraction of the data
+        as validation data. Otherwise, see scikit-learn's `check_cv`, e.g. an int k specifies (stratified) k-fold.
+    :param y: targets, used to determine whether stratified k-fold can be used.
+    :param stratify: bool (default=True). If True, splits are stratified by `y`.
+    :param repeats: positive integer (default=1). The number of holdout splits, only for a float `cv`.
+    :param random_state: integer or None (default=None). Seed for the holdout splits, only for a float `cv`.
+    """
+    if isinstance(cv, float):
+        if not 0 < cv < 1:
+            raise ValueError("A float cv must be in (0, 1), but was {}.".format(cv))
+        splitter = StratifiedShuffleSplit if stratify else ShuffleSplit
+        return splitter(n_splits=repeats, test_size=cv, random_state=random_state)
+    if repeats != 1:
+        raise ValueError("repeats can only be set for holdout validation, i.e. a float cv.")
+    return check_cv(cv, y, classifier=stratify)
+
+
+def subsample_indices(indices, y, fraction, stratify=True, random_state=None):
+    """ Select a random subsample of `indices`, maintaining class proportions if `stratify` is True.
+
+    :param indices: numpy array. The indices to subsample from.
+    :param y: numpy array of the same length as `indices`, with the targets corresponding to the indices.
+    :param fraction: float in (0, 1]. The fraction of indices to select. At least one index per class is selected.
+    :param stratify: bool (default=True). If True, the fraction is selected for each class separately.
+    :param random_state: integer, list of integers or None (default=None). Seed used for the selection.
+    :return: a sorted numpy array with the selected indices.
+    """
+    if fraction >= 1:
+        return indices
+
+    random_state = np.random.RandomState(random_state)
+    groups = [indices[y == label] for label in np.unique(y)] if stratify else [indices]
+    selected = [random_state.choice(group, size=max(1, int(round(fraction * len(group)))), replace=False)
+                for group in groups]
+    return np.sort(np.concatenate(selected))
+
+
+class Folds(object):
+    """ The train/validation splits on which pipelines are evaluated, computed once for each `fit`.
+
+    With k-fold cross-validation, each sample is validated exactly once. With holdout validation, only some samples
+    are validated, their indices are `validation_indices`. If a sample is validated in multiple (repeated holdout)
+    splits, only its prediction of the last split is used.
+
+    The data of each split is sliced from X and y once and stored contiguously, so that evaluations do not need to
+    index the data again. If a directory is given, the data is stored in memory-mapped files in that directory
+    instead of in memory. Pickled Folds then only contain file paths, so evaluation processes share the data
+    through the page cache instead of each holding a copy.
+    """
+
+    def __init__(self, X, y, y_score, cv=5, stratify=True, directory=None, repeats=1, random_state=None):
+        """
+        :param X: data to split, numpy array or DataFrame.
+        :param y: targets corresponding to X, in the format used for training.
+        :param y_score: targets corresponding to X, in the format used for scoring.
+        :param cv: int, float, cross-validation generator or iterable (default=5).
+            Determines the validation strategy, see `validation_splitter`.
+        :param stratify: bool (default=True). If True and cv is an int or float, splits are stratified by `y`.
+        :param directory: str or None (default=None). If set, directory in which to store the data of each fold.
+        :param repeats: positive integer (default=1). The number of holdout splits if cv is a float.
+        :param random_state: integer or None (default=None). Seed for the holdout splits and the subsamples.
+        """
+        self.n_samples = X.shape[0]
+        self.stratify = stratify
+        self.random_state = random_state
+        self.splits = list(validation_splitter(cv, y, stratify, repeats, random_state).split(X, y))
+        self.validation_indices = np.unique(np.concatenate([test for _, test in self.splits]))
+        self._y_score = _store(y_score, directory, 'y_score')
+        self._data = []
+        for i, (train, test) in enumerate(self.splits):
+            self._data.append((_store(safe_indexing(X, train), directory, 'fold{}_X_train'.format(i)),
+                               _store(safe_indexing(y, train), directory, 'fold{}_y_train'.format(i)),
+                               _store(safe_indexing(X, test), directory, 'fold{}_X_test'.format(i)),
+                               _store(safe_indexing(y_score, test), directory, 'fold{}_y_score_test'.format(i))))
+        log.debug("Split data into {} folds.".format(len(self.splits)))
+
+    def __len__(self):
+        return len(self.splits)
+
+    @property
+    def y_score(self):
+        """ The targets of all data in the format used for scoring. """
+        return _load(self._y_score)
+
+    def fold(self, index, subsample=None):
+        """ Return the data of the fold with the given index.
+
+        :param index: integer. Index of the fold.
+        :param subsample: float in (0, 1] or None (default=None). If set, only this fraction of the training data is
+            returned. The subsample is stratified if the folds are, and is the same for each call.
+        :return: a tuple (X_train, y_train, X_test, y_score_test, test),
+            where `test` are the indices of X_test in the original data.
+        """
+        X_train, y_train, X_test, y_score_test = [_load(data) for data in self._data[index]]
+        if subsample is not None:
+            seed = index if self.random_state is None else [self.random_state, index]
+            selected = subsample_indices(np.arange(len(y_train)), np.asarray(y_train), subsample,
+                                         stratify=self.stratify, random_state=seed)
+            X_train, y_train = safe_indexing(X_train, selected), safe_indexing(y_train, selected)
+        return X_train, y_train, X_test, y_score_test, self.splits[index][1]
@@ -0,0 +1,193 @@
+""" Incremental non-dominated sorting of a population with two objectives, see `ParetoRanking`. """
+from bisect import bisect_left
+import itertools
+
+
+def _is_dominated(key, keys):
+    """ True if the individual with `key` is dominated by one of the mutually non-dominated individuals with `keys`.
+
+    Keys are (wvalues[0], -wvalues[1]), and `keys` must be sorted. Among the individuals which are at least as good
+    in the first objective, the first one in `keys` is the best in the second objective, so it is the only candidate.
+    """
+    i = bisect_left(keys, (key[0], -float('inf')))
+    return i < len(keys) and keys[i][1] <= key[1] and keys[i] != key
+
+
+def _dominates(key, other_key):
+    """ True if the individual with `key` dominates the individual with `other_key`. """
+    return key[0] >= other_key[0] and key[1] <= other_key[1] and key != other_key
+
+
+def _merge(keys, individuals, new_keys, new_individuals):
+    """ Merge two lists of sorted keys and their individuals. Returns the merged keys and individuals. """
+    merged = sorted(zip(keys + new_keys, range(len(keys) + len(new_keys)), individuals + new_individuals))
+    return [key for key, _, __ in merged], [individual for _, __, individual in merged]
+
+
+def crowding_distances(individuals):
+    """ Crowding distance of each individual, computed as by `deap.tools.emo.assignCrowdingDist`. """
+    distances = [0.0] * len(individuals)
+    crowd = [(individual.fitness.values, i) for i, individual in enumerate(individuals)]
+    n_objectives = len(individuals[0].fitness.values)
+    for objective in range(n_objectives):
+        crowd.sort(key=lambda element: element[0][objective])
+        distances[crowd[0][1]] = float('inf')
+        distances[crowd[-1][1]] = float('inf')
+        if crowd[-1][0][objective] == crowd[0][0][objective]:
+            continue
+        norm = n_objectives * float(crowd[-1][0][objective] - crowd[0][0][objective])
+        for previous, current, next_ in zip(crowd[:-2], crowd[1:-1], crowd[2:]):
+            distances[current[1]] += (next_[0][objective] - previous[0][objective]) / norm
+    return distances
+
+
+class ParetoRanking(object):
+    """ Individuals sorted into Pareto fronts, which are updated incrementally as individuals are added or removed.
+
+    The first front contains the individuals which are not dominated, and each next front the individuals which are
+    only dominated by individuals in earlier fronts, as with `deap.tools.sortNondominated`. Only two objectives are
+    supported. Individuals are ranked by the `fitness.wvalues` they have when they are added, so an individual whose
+    fitness changes must be updated with `update`.
+
+    Adding an individual takes a binary search over the fronts, plus moving the individuals it dominates to the
+    next front. Removing an individual from the last front, as with elimination, does not change any other front.
+
+    The order in which individuals were added is remembered, so that `worst` can order each front as deap does for
+    a population in that order, which determines how ties are broken.
+    """
+
+    def __init__(self, individuals=()):
+        # For each front, the keys (wvalues[0], -wvalues[1]) of its individuals in sorted order, and the individuals
+        # in the same order. Along a front, the first objective increases and the second objective does not.
+        self._keys = []
+        self._fronts = []
+        # Maps the id of each individual to its key and the index of its front.
+        self._positions = {}
+        # Maps the id of each individual to the order in which it was added, its position in the population.
+        self._added = {}
+        self._counter = itertools.count()
+        for individual in individuals:
+            self.add(individual)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, individual):
+        return id(individual) in self._positions
+
+    @property
+    def fronts(self):
+        """ List with a list of the individuals in each front, best front first. """
+        return [list(front) for front in self._fronts]
+
+    def add(self, individual):
+        """ Add `individual` to the front of individuals which do not dominate it. """
+        wvalues = individual.fitness.wvalues
+        if len(wvalues) != 2:
+            raise ValueError("ParetoRanking only supports two objectives, but fitness has {}.".format(len(wvalues)))
+        key = (wvalues[0], -wvalues[1])
+        self._added[id(individual)] = next(self._counter)
+        # Each individual is dominated by an individual of the previous front, so if an individual is dominated by
+        # a front, it is also dominated by all earlier fronts.
+        low, high = 0, len(self._fronts)
+        while low < high:
+            middle = (low + high) // 2
+            if _is_dominated(key, self._keys[middle]):
+                low = middle + 1
+            else:
+                high = middle
+        self._insert([key], [individual], low)
+
+    def _insert(self, keys, individuals, i):
+        """ Insert mutually non-dominated individuals in the i-th front, and move those they dominate down a front. """
+        while individuals:
+            if i == len(self._fronts):
+                self._keys.append([])
+                self._fronts.append([])
+            for key, individual in zip(keys, individuals):
+                self._positions[id(individual)] = (key, i)
+
+            dominated = [_is_dominated(key, keys) for key in self._keys[i]]
+            moved_keys = [key for key, is_dominated in zip(self._keys[i], dominated) if is_dominated]
+            moved = [individual for individual, is_dominated in zip(self._fronts[i], dominated) if is_dominated]
+            kept_keys = [key for key, is_dominated in zip(self._keys[i], dominated) if not is_dominated]
+            kept = [individual for individual, is_dominated in zip(self._fronts[i], dominated) if not is_dominated]
+            self._keys[i], self._fronts[i] = _merge(kept_keys, kept, keys, individuals)
+            keys, individuals, i = moved_keys, moved, i + 1
+
+    def remove(self, individual):
+        """ Remove `individual`, and move individuals which were only dominated by it up a front. """
+        key, i = self._positions.pop(id(individual))
+        del self._added[id(individual)]
+        j = bisect_left(self._keys[i], key)
+        while self._fronts[i][j] is not individual:
+            j += 1
+        del self._keys[i][j]
+        del self._fronts[i][j]
+
+        while i + 1 < len(self._fronts):
+            promoted = [not _is_dominated(key, self._keys[i]) for key in self._keys[i + 1]]
+            if not any(promoted):
+                break
+            keys, individuals = self._keys[i + 1], self._fronts[i + 1]
+            promoted_keys = [key for key, is_promoted in zip(keys, promoted) if is_promoted]
+            promoted_individuals = [ind for ind, is_promoted in zip(individuals, promoted) if is_promoted]
+            self._keys[i + 1] = [key for key, is_promoted in zip(keys, promoted) if not is_promoted]
+            self._fronts[i + 1] = [ind for ind, is_promoted in zip(individuals, promoted) if not is_promoted]
+            for key, promoted_individual in zip(promoted_keys, promoted_individuals):
+                self._positions[id(promoted_individual)] = (key, i)
+            self._keys[i], self._fronts[i] = _merge(self._keys[i], self._fronts[i], promoted_keys, promoted_individuals)
+            i += 1
+
+        while self._fronts and not self._fronts[-1]:
+            self._keys.pop()
+            self._fronts.pop()
+
+    def update(self, individual):
+        """ Rank `individual` again after its fitness changed. It keeps its position in the population. """
+        added = self._added[id(individual)]
+        self.remove(individual)
+        self.add(individual)
+        self._added[id(individual)] = added
+
+    def _deap_fronts(self):
+        """ The fronts, each in the order in which `deap.tools.sortNondominated` lists it.
+
+        deap groups individuals with equal fitness, in population order, and orders the groups of the first front by
+        their first individual. A group in a later front is listed when the last of the groups which dominate it in
+        the previous front is processed. Groups listed by the same group are in order of their first individual.
+        """
+        fronts = []
+        previous_keys = None
+        for keys, front in zip(self._keys, self._fronts):
+            groups = {}
+            for key, individual in zip(keys, front):
+                groups.setdefault(key, []).append(individual)
+            for group in groups.values():
+                group.sort(key=lambda individual: self._added[id(individual)])
+
+            def listed_at(key):
+                first_added = self._added[id(groups[key][0])]
+                if previous_keys is None:
+                    return first_added
+                last_dominating = max(i for i, other_key in enumerate(previous_keys) if _dominates(other_key, key))
+                return last_dominating, first_added
+
+            ordered_keys = sorted(groups, key=listed_at)
+            fronts.append([individual for key in ordered_keys for individual in groups[key]])
+            previous_keys = ordered_keys
+        return fronts
+
+    def worst(self, n=1):
+        """ Return the `n` worst individuals, in the order of `gama.ea.automl_gp.eliminate_NSGA` (worst last).
+
+        As with `deap.tools.selNSGA2`, the last front is ordered by decreasing crowding distance and earlier fronts
+        are in the order of `deap.tools.sortNondominated`, so ties are broken the same way.
+        """
+        fronts = self._deap_fronts()
+        if not fronts:
+            return []
+        distances = crowding_distances(fronts[-1])
+        order = sorted(range(len(fronts[-1])), key=lambda index: distances[index], reverse=True)
+        ranked = [individual for front in fronts[:-1] for individual in front] + [fronts[-1][i] for i in order]
+        return ranked[-n:]
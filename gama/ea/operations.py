@@ -10,24 +10,28 @@ from .mutation import random_valid_mutation
 from .modified_deap import cxOnePoint
 
 log = logging.getLogger(__name__)
-created_individuals = {}
 
 
-def is_new(item):
-    """ Check whether this individual (genotype) has been seen before. If not, store it as seen. """
-    _is_new = str(item) not in created_individuals
-    if _is_new:
-        created_individuals[str(item)] = item
-    return _is_new
+def is_new(item, registry, key_fn=str):
+    """ Check whether this individual has been seen before. If not, store it as seen.
+
+    :param item: the individual.
+    :param registry: `gama.utilities.generic.duplicate_registry.DuplicateRegistry` of the individuals seen before,
+        or None, in which case every individual is new.
+    :param key_fn: function (default=str). Individuals with the same key are considered the same.
+        By default, individuals are compared by genotype.
+    """
+    return registry is None or registry.add(key_fn(item))
 
 
 def try_until_new(func):
-    def fn_new(*args, **kwargs):
+    """ Retry `func` until it creates an individual which is new according to `is_new` with the given `registry`
+    and `key_fn`. """
+    def fn_new(*args, key_fn=str, registry=None, **kwargs):
         max_tries = 50
-        ind_is_new = is_new
         for _ in range(max_tries):
             new_ind, log_args = func(*args, **kwargs)
-            if ind_is_new(new_ind):
+            if is_new(new_ind, registry, key_fn):
                 return new_ind, log_args
         log.warning("Could not create a new individual from 50 iterations of {}".format(func.__name__))
         return new_ind, log_args
@@ -0,0 +1,61 @@
+""" Asynchronous successive halving: evaluate individuals on increasingly large subsamples of the data.
+
+New individuals are evaluated on the lowest rung, where pipelines are fit on a small subsample of the data.
+Whenever an individual ranks in the top `1 / reduction_factor` of the individuals evaluated on its rung,
+it is promoted to be evaluated on the next rung, which uses `reduction_factor` times as much data.
+"""
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class SuccessiveHalving(object):
+    """ Keeps track of which individuals are evaluated on which rung, and which should be promoted. """
+
+    def __init__(self, min_sample_fraction=0.1, reduction_factor=3):
+        """
+        :param min_sample_fraction: float in (0, 1] (default=0.1). Fraction of the data used on the lowest rung.
+        :param reduction_factor: integer greater than 1 (default=3). Factor by which the amount of data increases
+            from one rung to the next, and by which the number of individuals decreases.
+        """
+        if not 0 < min_sample_fraction <= 1:
+            raise ValueError("min_sample_fraction must be in (0, 1], but was {}.".format(min_sample_fraction))
+        if reduction_factor < 2:
+            raise ValueError("reduction_factor must be at least 2, but was {}.".format(reduction_factor))
+
+        self.reduction_factor = reduction_factor
+        self.fidelities = []
+        while min_sample_fraction * reduction_factor ** len(self.fidelities) < 1:
+            self.fidelities.append(min_sample_fraction * reduction_factor ** len(self.fidelities))
+        self.fidelities.append(1.0)
+
+        self._rungs = [[] for _ in self.fidelities]
+        self._promoted = [set() for _ in self.fidelities]
+
+    def clear(self):
+        """ Forget all evaluations, e.g. when the search restarts with a new population. """
+        self._rungs = [[] for _ in self.fidelities]
+        self._promoted = [set() for _ in self.fidelities]
+
+    def record(self, individual, rung):
+        """ Record that `individual` was evaluated on `rung`. Its score is taken from its (first) fitness value. """
+        self._rungs[rung].append((individual.fitness.wvalues[0], individual))
+
+    def next_promotion(self):
+        """ Find an individual which should be evaluated on a higher rung, and mark it as promoted.
+
+        Higher rungs are considered first. An individual can be promoted if it is in the top `1 / reduction_factor`
+        of all individuals evaluated on its rung, and has not been promoted before.
+
+        :return: a tuple (individual, rung) with the rung to evaluate the individual on, or (None, None).
+        """
+        for rung in reversed(range(len(self.fidelities) - 1)):
+            n_promotable = len(self._rungs[rung]) // self.reduction_factor
+            ranked = sorted(self._rungs[rung], key=lambda score_ind: score_ind[0], reverse=True)
+            for score, individual in ranked[:n_promotable]:
+                if score == -float('inf'):
+                    break  # Failed evaluations are never promoted.
+                if id(individual) not in self._promoted[rung]:
+                    self._promoted[rung].add(id(individual))
+                    return individual, rung + 1
+        return None, None
@@ -20,12 +20,21 @@ from .ea.modified_deap import cxOnePoint
 from .ea import automl_gp
 from .ea.automl_gp import compile_individual, pset_from_config, generate_valid
 from gama.ea.mutation import random_valid_mutation
-from .ea.metrics import Metric
+from .ea.metrics import Metric, MetricType
+from .ea.canonical import canonical_form
+from .ea.cost_model import CostModel
+from .ea.fitness_table import FitnessTable
+from .ea.nondominated import ParetoRanking
+from .ea.folds import Folds
 from .utilities.observer import Observer
 
 from .ea.operations import create_from_population, mate_new, random_valid_mutation_new, generate_new
 from .ea.async_ea import async_ea
+from .ea.successive_halving import SuccessiveHalving
+from gama.utilities.evaluation_store import EvaluationStore, PREDICTION_DTYPES
+from gama.utilities.generic.duplicate_registry import DuplicateRegistry
 from gama.utilities.generic.stopwatch import Stopwatch
+from gama.utilities.persistent_cache import PersistentCache, dataset_fingerprint, pipeline_key
 from gama.utilities.logging_utilities import TOKENS, log_parseable_event
 from gama.utilities.preprocessing import define_preprocessing_steps
 
@@ -67,17 +76,120 @@ class Gama(object):
 
     :param max_eval_time: positive integer or None (default=300)
         Time in seconds that can be used to evaluate any one single individual.
+        With `n_jobs > 1`, evaluation processes which exceed it by more than a small grace period are terminated.
 
     :param n_jobs: integer (default=1)
         The amount of parallel processes that may be created to speed up `fit`. If this number
         is zero or negative, it will be set to the amount of cores.
 
+    :param limit_threads: bool (default=True)
+        If True and `n_jobs > 1`, the cores are divided over the evaluation processes: the BLAS and OpenMP thread
+        pools of each evaluation process are limited to `cores // n_jobs` threads (at least one), so that evaluations
+        do not slow each other down by starting a thread per core. The thread pools of libraries which are loaded
+        before the evaluation processes start, such as NumPy's BLAS, are limited with threadpoolctl (a dependency
+        of GAMA). Without threadpoolctl the limit is partial: only libraries loaded later are limited, and a warning
+        is logged.
+
+    :param max_tasks_per_worker: positive integer or None (default=None)
+        If set and `n_jobs > 1`, an evaluation process is replaced by a new one after it evaluated this many jobs.
+
+    :param max_worker_rss: positive integer or None (default=None)
+        If set and `n_jobs > 1`, an evaluation process is replaced by a new one between jobs if its resident memory
+        exceeds this many megabytes, which releases memory that is not returned to the OS. Only supported on Linux.
+
+    :param evaluation_address: tuple (host, port) or None (default=None)
+        If set, pipelines are evaluated by workers which connect to this address over TCP, possibly from other
+        machines, instead of by local processes. Start a worker with
+        `python -m gama.utilities.generic.remote_dispatcher HOST PORT --authkey KEY`. The data is sent once to each
+        worker. `n_jobs` is the number of pipelines evaluated at the same time, set it to the number of workers.
+        `cache_dir` must be on a file system shared with the workers.
+
+    :param evaluation_authkey: string or None (default=None)
+        The key workers must use to connect to `evaluation_address`. Required if `evaluation_address` is set.
+
+    :param set_estimator_n_jobs: bool (default=False)
+        If True, the `n_jobs` hyperparameter of components which have one, and for which the configuration does not
+        specify it, is set to the number of threads available to each evaluation (all cores if `n_jobs=1`).
+
+    :param duplicate_registry_size: positive integer (default=100000)
+        New individuals are only evaluated if no individual with the same pipeline was created before during the
+        search. At least this many of the most recently created pipelines are remembered for this purpose, and at
+        most twice as many, as a 64-bit hash which takes 16 to 32 bytes. The memory for two generations of this
+        many hashes (about 4MB by default) is allocated up front. The pipelines are forgotten when `fit` starts
+        a new search.
+
+    :param duplicate_false_positive_rate: float in (0, 1) or None (default=None)
+        If set, created pipelines are remembered in a Bloom filter instead, which uses about 10 bits per pipeline
+        for a rate of 0.01, but rejects a new pipeline as a duplicate with this probability.
+
     :param verbosity: integer (default=0)
         Does nothing right now. Follow progress of optimization by tracking the log.
 
     :param cache_dir: string or None (default=None)
         The directory in which to keep the cache during `fit`. In this directory,
         models and their evaluation results will be stored. This facilitates a quick ensemble construction.
+
+    :param cv: integer greater than one or float in (0, 1) (default=5)
+        The validation strategy used to evaluate pipelines. An integer k specifies k-fold cross-validation
+        (stratified for classification). A float specifies holdout validation with that fraction of the data as
+        validation data, which requires only one fit per evaluation and is recommended for large datasets.
+        Holdout splits are drawn with `random_state`, so they are only the same across runs if it is set.
+
+    :param cv_repeats: positive integer (default=1)
+        With holdout validation, the number of random holdout splits each pipeline is evaluated on.
+        Samples which are validated in multiple splits only contribute their prediction of the last split.
+
+    :param max_prefix_cache_memory: positive integer or None (default=None)
+        Memory in megabytes that each evaluation process may use to cache the data transformed by pipeline prefixes.
+        Pipelines which share leading steps then only fit the steps that follow the longest cached prefix.
+        If None, no prefixes are cached.
+
+    :param successive_halving: bool (default=False)
+        If True, new pipelines are first evaluated by fitting them on a small stratified subsample of the data.
+        Pipelines which rank in the top `1/reduction_factor` of pipelines evaluated on the same amount of data are
+        evaluated again on `reduction_factor` times as much data, until all data is used.
+        Individuals in the population are only compared to individuals evaluated on the same amount of data.
+
+    :param min_sample_fraction: float in (0, 1] (default=0.1)
+        Fraction of the data used to first evaluate pipelines with if `successive_halving` is True.
+
+    :param reduction_factor: integer greater than 1 (default=3)
+        Factor by which the amount of data increases between evaluations if `successive_halving` is True.
+
+    :param fold_racing: bool (default=False)
+        If True, once the population is full, cross-validation of a new pipeline is stopped after two or more folds
+        if its scores so far show that it would be eliminated from the population immediately.
+        Not used in conjunction with `successive_halving`.
+
+    :param max_eval_memory: positive integer or None (default=None)
+        Memory in megabytes that each evaluation process may use, including the memory-mapped data.
+        A pipeline which exceeds it, or whose evaluation process is killed, is assigned a score of -inf.
+        Only enforced on Unix systems and with `n_jobs > 1`. If None, memory use is not limited.
+
+    :param cached_prediction_dtype: string (default='float64')
+        One of 'float64', 'float32', 'float16' or 'uint8'. The precision with which the predicted class probabilities
+        of evaluated pipelines are stored for ensemble construction. Lower precision uses 2-8 times less disk space
+        and memory. Each stored probability is within a relative error of 2**-24 (float32), 2**-11 (float16, for
+        probabilities of at least 2**-14) or an absolute error of 1/510 (uint8) of the actual probability,
+        and so is the weighted average of the ensemble.
+        Hence, metrics based on class labels are only affected for samples where the two most likely classes have
+        probabilities within twice that error. For log loss, the loss of a sample changes by at most the error
+        divided by the probability of its true class, so 'uint8' should not be used with log loss when pipelines
+        assign small probabilities to the true class. Only applies to metrics which require probabilities.
+
+    :param persistent_cache_dir: string or None (default=None)
+        If set, evaluation results are stored in a database in this directory, which persists across `fit` calls
+        and runs. Results are keyed by a fingerprint of the data, cross-validation splits and metric, along with the
+        pipeline. When the same pipeline is to be evaluated on the same data again, the stored result is used instead.
+
+    :param max_persistent_cache_size: positive integer (default=1024)
+        Size in megabytes of the pipelines and predictions kept in the persistent cache.
+        When it is exceeded, the least recently used results are removed.
+
+    :param cost_model: bool (default=False)
+        If True, a model of the evaluation time of pipelines is learned from the evaluations during search.
+        Pipelines which are expected to be evaluated fastest are then evaluated first, and pipelines which are
+        expected to take longer than `max_eval_time` are not evaluated. The model is kept across `fit` calls.
     """
 
     def __init__(self, 
@@ -91,7 +203,27 @@ class Gama(object):
                  n_jobs=1,
                  verbosity=logging.WARNING,
                  keep_analysis_log=True,
-                 cache_dir=None):
+                 cache_dir=None,
+                 cv=5,
+                 cv_repeats=1,
+                 max_prefix_cache_memory=None,
+                 successive_halving=False,
+                 min_sample_fraction=0.1,
+                 reduction_factor=3,
+                 fold_racing=False,
+                 max_eval_memory=None,
+                 cached_prediction_dtype='float64',
+                 persistent_cache_dir=None,
+                 max_persistent_cache_size=1024,
+                 cost_model=False,
+                 limit_threads=True,
+                 max_tasks_per_worker=None,
+                 max_worker_rss=None,
+                 evaluation_address=None,
+                 evaluation_authkey=None,
+                 set_estimator_n_jobs=False,
+                 duplicate_registry_size=100000,
+                 duplicate_false_positive_rate=None):
 
         #  gamalog is for the entire gama module and submodules.
         gamalog = logging.getLogger('gama')
@@ -128,6 +260,58 @@ class Gama(object):
             error_message = "max_eval_time should be greater than zero, or None."
             log.error(error_message + " max_eval_time: {}".format(max_eval_time))
             raise ValueError(error_message)
+        if not ((isinstance(cv, int) and cv >= 2) or (isinstance(cv, float) and 0 < cv < 1)):
+            error_message = "cv should be an integer greater than one, or a float in (0, 1)."
+            log.error(error_message + " cv: {}".format(cv))
+            raise ValueError(error_message)
+        if cv_repeats < 1 or (isinstance(cv, int) and cv_repeats != 1):
+            error_message = "cv_repeats should be at least one, and can only be set for holdout validation."
+            log.error(error_message + " cv: {}, cv_repeats: {}".format(cv, cv_repeats))
+            raise ValueError(error_message)
+        if max_prefix_cache_memory is not None and max_prefix_cache_memory <= 0:
+            error_message = "max_prefix_cache_memory should be greater than zero, or None."
+            log.error(error_message + " max_prefix_cache_memory: {}".format(max_prefix_cache_memory))
+            raise ValueError(error_message)
+        if max_eval_memory is not None and max_eval_memory <= 0:
+            error_message = "max_eval_memory should be greater than zero, or None."
+            log.error(error_message + " max_eval_memory: {}".format(max_eval_memory))
+            raise ValueError(error_message)
+        if max_tasks_per_worker is not None and max_tasks_per_worker <= 0:
+            error_message = "max_tasks_per_worker should be greater than zero, or None."
+            log.error(error_message + " max_tasks_per_worker: {}".format(max_tasks_per_worker))
+            raise ValueError(error_message)
+        if max_worker_rss is not None and max_worker_rss <= 0:
+            error_message = "max_worker_rss should be greater than zero, or None."
+            log.error(error_message + " max_worker_rss: {}".format(max_worker_rss))
+            raise ValueError(error_message)
+        if evaluation_address is not None and not evaluation_authkey:
+            error_message = "evaluation_authkey must be set if evaluation_address is set."
+            log.error(error_message + " evaluation_address: {}".format(evaluation_address))
+            raise ValueError(error_message)
+        if duplicate_registry_size <= 0:
+            error_message = "duplicate_registry_size should be greater than zero."
+            log.error(error_message + " duplicate_registry_size: {}".format(duplicate_registry_size))
+            raise ValueError(error_message)
+        if duplicate_false_positive_rate is not None and not 0 < duplicate_false_positive_rate < 1:
+            error_message = "duplicate_false_positive_rate should be in (0, 1), or None."
+            log.error(error_message + " duplicate_false_positive_rate: {}".format(duplicate_false_positive_rate))
+            raise ValueError(error_message)
+        if cached_prediction_dtype not in PREDICTION_DTYPES:
+            error_message = "cached_prediction_dtype should be one of {}.".format(PREDICTION_DTYPES)
+            log.error(error_message + " cached_prediction_dtype: {}".format(cached_prediction_dtype))
+            raise ValueError(error_message)
+        if max_persistent_cache_size <= 0:
+            error_message = "max_persistent_cache_size should be greater than zero."
+            log.error(error_message + " max_persistent_cache_size: {}".format(max_persistent_cache_size))
+            raise ValueError(error_message)
+        if successive_halving and not 0 < min_sample_fraction <= 1:
+            error_message = "min_sample_fraction should be greater than zero and at most one."
+            log.error(error_message + " min_sample_fraction: {}".format(min_sample_fraction))
+            raise ValueError(error_message)
+        if successive_halving and reduction_factor < 2:
+            error_message = "reduction_factor should be at least two."
+            log.error(error_message + " reduction_factor: {}".format(reduction_factor))
+            raise ValueError(error_message)
 
         self._best_pipeline = None
         self._fitted_pipelines = {}
@@ -135,8 +319,31 @@ class Gama(object):
         self._pop_size = population_size
         self._max_total_time = max_total_time
         self._max_eval_time = max_eval_time
+        self._cv = cv
+        self._cv_repeats = cv_repeats
+        self._max_prefix_cache_memory = max_prefix_cache_memory
+        self._successive_halving = successive_halving
+        self._min_sample_fraction = min_sample_fraction
+        self._reduction_factor = reduction_factor
+        self._fold_racing = fold_racing
+        self._max_eval_memory = max_eval_memory
+        self._max_tasks_per_worker = max_tasks_per_worker
+        self._max_worker_rss = max_worker_rss
+        self._evaluation_address = evaluation_address
+        self._evaluation_authkey = evaluation_authkey.encode() if evaluation_authkey is not None else None
+        self._cached_prediction_dtype = cached_prediction_dtype
+        self._persistent_cache_dir = persistent_cache_dir
+        self._max_persistent_cache_size = max_persistent_cache_size
+        self._persistent_cache = None
+        self._evaluation_store = None
+        self._cost_model = CostModel() if cost_model else None
+        # Canonical forms of the pipelines created during search, so that no pipeline is created twice.
+        self._duplicate_registry = DuplicateRegistry(duplicate_registry_size, duplicate_false_positive_rate)
         self._fit_data = None
-        self._n_jobs = n_jobs
+        self._folds = None
+        self._n_jobs = n_jobs if n_jobs > 0 else os.cpu_count()
+        # Number of threads each evaluation may use, None if it is not limited.
+        self._threads_per_job = max(1, os.cpu_count() // self._n_jobs) if limit_threads and self._n_jobs > 1 else None
         self._scoring_function = objectives[0]
         self._observer = None
         self._objectives = objectives
@@ -172,24 +379,47 @@ class Gama(object):
         creator.create("Individual", gp.PrimitiveTree, fitness=creator.FitnessMax, pset=pset)
 
         self._toolbox.register("expr", generate_valid, pset=pset, min_=1, max_=3, toolbox=self._toolbox)
-        self._toolbox.register("individual", generate_new, creator.Individual, self._toolbox.expr)
+        self._toolbox.register("individual", generate_new, creator.Individual, self._toolbox.expr,
+                               key_fn=self._individual_key, registry=self._duplicate_registry)
         self._toolbox.register("population", tools.initRepeat, list, self._toolbox.individual)
-        self._toolbox.register("compile", compile_individual, pset=pset, parameter_checks=parameter_checks)
+        self._parameter_checks = parameter_checks
+        self._estimator_n_jobs = (self._threads_per_job or max(1, os.cpu_count() // self._n_jobs)) \
+            if set_estimator_n_jobs else None
+        self._toolbox.register("compile", compile_individual, pset=pset, parameter_checks=parameter_checks,
+                               n_jobs=self._estimator_n_jobs)
 
-        self._toolbox.register("mate", mate_new)
+        self._toolbox.register("mate", mate_new, key_fn=self._individual_key, registry=self._duplicate_registry)
 
-        self._toolbox.register("mutate", random_valid_mutation_new, pset=self._pset)
+        self._toolbox.register("mutate", random_valid_mutation_new, pset=self._pset, key_fn=self._individual_key,
+                               registry=self._duplicate_registry)
         self._toolbox.register("create", create_from_population, toolbox=self._toolbox, cxpb=0.2, mutpb=0.8)
 
         if len(self._objectives) == 1:
             self._toolbox.register("select", tools.selTournament, tournsize=3)
             self._toolbox.register("eliminate", automl_gp.eliminate_worst)
+            if not self._successive_halving:
+                self._toolbox.register("ranking", FitnessTable)
         elif len(self._objectives) == 2:
             self._toolbox.register("select", tools.selNSGA2)
             self._toolbox.register("eliminate", automl_gp.eliminate_NSGA)
+            if not self._successive_halving:
+                # Maintained alongside the population, so that eliminating does not require sorting it entirely.
+                self._toolbox.register("ranking", ParetoRanking)
         else:
             raise ValueError('Objectives must be a tuple of length at most 2.')
 
+        if self._successive_halving:
+            self._toolbox.register("eliminate", automl_gp.eliminate_within_fidelity,
+                                   eliminate=self._toolbox.eliminate)
+
+    def _individual_key(self, individual):
+        """ Key by which individuals are compared to check whether they are new: the canonical form of the pipeline.
+
+        Individuals which can not be compiled are compared by genotype.
+        """
+        pipeline = self._toolbox.compile(individual)
+        return canonical_form(pipeline) if pipeline is not None else str(individual)
+
     def _get_data_from_arff(self, arff_file_path, split_last=True):
         # load arff
         with open(arff_file_path, 'r') as arff_file:
@@ -227,7 +457,8 @@ class Gama(object):
     def _preprocess_arff(self, arff_file_path):
         X, y = self._get_data_from_arff(arff_file_path)
         steps = define_preprocessing_steps(X, max_extra_features_created=None, max_categories_for_one_hot=10)
-        self._toolbox.register("compile", compile_individual, pset=self._pset, preprocessing_steps=steps)
+        self._toolbox.register("compile", compile_individual, pset=self._pset, parameter_checks=self._parameter_checks,
+                               preprocessing_steps=steps, n_jobs=self._estimator_n_jobs)
         return X, y
 
     def fit(self, X=None, y=None, arff_file_path=None, warm_start=False, auto_ensemble_n=25, restart_=False, keep_cache=False):
@@ -285,6 +516,15 @@ class Gama(object):
         self.y_train = y
         self._construct_y_score(y)
         self._fit_data = (X, y)
+        is_classification = Metric(self._scoring_function).task_type == MetricType.CLASSIFICATION
+        self._folds = Folds(X, y, self.y_score, cv=self._cv, stratify=is_classification, directory=self._cache_dir,
+                            repeats=self._cv_repeats, random_state=self._random_state)
+        if self._persistent_cache_dir is not None:
+            fingerprint = dataset_fingerprint(X, y, self._folds.splits, self._scoring_function)
+            self._persistent_cache = PersistentCache(self._persistent_cache_dir, fingerprint,
+                                                     self._max_persistent_cache_size * 2**20)
+        if self._cost_model is not None:
+            self._cost_model.set_data_shape(*X.shape)
 
         time_left = self._max_total_time - preprocessing_sw.elapsed_time
 
@@ -356,13 +596,18 @@ class Gama(object):
         else:
             if warm_start:
                 log.warning('Warm-start enabled but no earlier fit. Using new generated population instead.')
+            self._duplicate_registry.clear()
             pop = self._toolbox.population(n=self._pop_size)
 
-        self._toolbox.register("evaluate", gama.ea.evaluation.evaluate_pipeline,
-                               X=self.X, y_train=self.y_train, y_score=self.y_score,
-                               scoring=self._scoring_function, timeout=self._max_eval_time,
-                               cache_dir=self._cache_dir)
+        self._register_evaluation()
+        # With multiple child processes, folds of a pipeline are evaluated in parallel if processes are idle.
+        split_folds = len(self._folds) if self._n_jobs > 1 and len(self._folds) > 1 else None
 
+        successive_halving = None
+        if self._successive_halving:
+            successive_halving = SuccessiveHalving(self._min_sample_fraction, self._reduction_factor)
+
+        cached_evaluation = self._cached_evaluation if self._persistent_cache is not None else None
         try:
             final_pop = async_ea(self._objectives,
                                  pop,
@@ -370,11 +615,47 @@ class Gama(object):
                                  evaluation_callback=self._on_evaluation_completed,
                                  restart_callback=restart_criteria,
                                  max_time_seconds=timeout,
-                                 n_jobs=self._n_jobs)
+                                 n_jobs=self._n_jobs,
+                                 successive_halving=successive_halving,
+                                 fold_racing=self._fold_racing,
+                                 max_eval_memory=self._max_eval_memory,
+                                 max_eval_time=self._max_eval_time,
+                                 cached_evaluation=cached_evaluation,
+                                 split_folds=split_folds,
+                                 cost_model=self._cost_model,
+                                 max_eval_threads=self._threads_per_job,
+                                 max_tasks_per_worker=self._max_tasks_per_worker,
+                                 max_worker_rss=self._max_worker_rss,
+                                 evaluation_address=self._evaluation_address,
+                                 evaluation_authkey=self._evaluation_authkey)
             self._final_pop = final_pop
         except KeyboardInterrupt:
             log.info('Search phase terminated because of Keyboard Interrupt.')
 
+    def _register_evaluation(self):
+        """ Register the `evaluate` and `combine_folds` functions for the current folds with the toolbox.
+
+        `evaluate` is pickled to be sent to the evaluation processes, or to remote workers.
+        """
+        prefix_cache = None
+        if self._max_prefix_cache_memory is not None:
+            # Each evaluation process gets its own (initially empty) copy of the cache.
+            prefix_cache = gama.ea.evaluation.PrefixCache(max_memory=self._max_prefix_cache_memory * 2**20)
+
+        # Predictions other than probabilities (class labels, regression targets) are always stored as they are.
+        requires_probabilities = Metric(self._scoring_function).requires_probabilities
+        prediction_dtype = self._cached_prediction_dtype if requires_probabilities else 'float64'
+        self._evaluation_store = EvaluationStore(self._cache_dir, prediction_dtype=prediction_dtype)
+
+        self._toolbox.register("evaluate", gama.ea.evaluation.evaluate_pipeline,
+                               folds=self._folds,
+                               scoring=self._scoring_function, timeout=self._max_eval_time,
+                               evaluation_store=self._evaluation_store, prefix_cache=prefix_cache,
+                               persistent_cache=self._persistent_cache)
+        self._toolbox.register("combine_folds", gama.ea.evaluation.combine_fold_results,
+                               folds=self._folds, scoring=self._scoring_function,
+                               evaluation_store=self._evaluation_store, persistent_cache=self._persistent_cache)
+
     def _postprocess_phase(self, n, timeout=1e6):
         """ Perform any necessary post processing, such as ensemble building. """
         #self._best_pipeline = list(reversed(sorted(self._final_pop, key=lambda ind: ind.fitness.wvalues)))[0]
@@ -387,6 +668,10 @@ class Gama(object):
     def _initialize_ensemble(self):
         raise NotImplementedError('_initialize_ensemble should be implemented by a child class.')
 
+    def _validation_y_true(self):
+        """ The targets of the samples for which pipelines made out-of-fold predictions during search. """
+        return np.asarray(self.y_train)[self._folds.validation_indices]
+
     def _build_fit_ensemble(self, ensemble_size, timeout):
         start_build = time.time()
         log.debug('Building ensemble.')
@@ -415,6 +700,20 @@ class Gama(object):
         """ Removes the cache folder and all files associated to this instance. """
         shutil.rmtree(self._cache_dir)
 
+    def _cached_evaluation(self, pipeline):
+        """ Return the `EvaluationResult` of `pipeline` from the persistent cache, or None if it is not cached.
+
+        Cached predictions are added to the evaluation store, so the pipeline can be used in the ensemble.
+        """
+        cached = self._persistent_cache.get(pipeline_key(pipeline))
+        if cached is None:
+            return None
+        log.debug("Using cached evaluation result of {}.".format(pipeline))
+        if cached.predictions is not None and cached.score != -float('inf'):
+            self._evaluation_store.append(cached.pipeline, cached.predictions, cached.score)
+        return gama.ea.evaluation.EvaluationResult(cached.score, datetime.datetime.now(), cached.time,
+                                                   cached.length, 1.0)
+
     def _on_evaluation_completed(self, ind):
         for callback in self._subscribers['evaluation_completed']:
             callback(ind)
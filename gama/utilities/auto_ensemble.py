@@ -1,6 +1,5 @@
 from collections import namedtuple
-import os
-import pickle
+from functools import partial
 import logging
 
 import numpy as np
@@ -8,7 +7,8 @@ from sklearn.preprocessing import OneHotEncoder
 import stopit
 
 from gama.ea.metrics import Metric, classification_metrics, MetricType
-from gama.utilities.generic.function_dispatcher import FunctionDispatcher
+from gama.utilities.evaluation_store import EvaluationStore
+from gama.utilities.generic.function_dispatcher import FunctionDispatcher, WorkerDiedError, WorkerTimeoutError
 
 log = logging.getLogger(__name__)
 Model = namedtuple("Model", ['name', 'pipeline', 'predictions', 'validation_score'])
@@ -18,7 +18,7 @@ class Ensemble(object):
 
     def __init__(self, metric, y_true,
                  model_library=None, model_library_directory=None,
-                 shrink_on_pickle=True, n_jobs=1):
+                 shrink_on_pickle=True, n_jobs=1, max_threads=None):
         """
         Either model_library or model_library_directory must be specified.
         If model_library is specified, model_library_directory is ignored.
@@ -30,6 +30,7 @@ class Ensemble(object):
         :param shrink_on_pickle: if True, remove memory-intensive attributes that are required during fit,
                                  but not predict, before pickling
         :param n_jobs: the number of jobs to run in parallel when fitting the final ensemble.
+        :param max_threads: if set, the BLAS and OpenMP threads each of the `n_jobs` processes may use.
         :param label_encoder: a LabelEncoder which can decode the model predictions to desired labels.
         """
         if isinstance(metric, str):
@@ -51,6 +52,7 @@ class Ensemble(object):
         self._model_library = model_library if model_library is not None else []
         self._shrink_on_pickle = shrink_on_pickle
         self._n_jobs = n_jobs
+        self._max_threads = max_threads
         self._y_true = y_true
         self._y_score = y_true
         self._prediction_transformation = None
@@ -76,7 +78,8 @@ class Ensemble(object):
 
     def _averaged_validation_predictions(self):
         """ Get weighted average of predictions from the self._models on the hillclimb/validation set. """
-        weighted_sum_predictions = sum([model.predictions * weight for (model, weight) in self._models.values()])
+        weighted_sum_predictions = sum([_float_predictions(model) * weight
+                                        for (model, weight) in self._models.values()])
         return weighted_sum_predictions / self._total_model_weights()
 
     def build_initial_ensemble(self, n):
@@ -125,7 +128,7 @@ class Ensemble(object):
                 if model.validation_score == 0:
                     continue
                 candidate_pred = current_weighted_average + \
-                                 (model.predictions - current_weighted_average) / (current_total_weight + 1)
+                                 (_float_predictions(model) - current_weighted_average) / (current_total_weight + 1)
                 candidate_ensemble_score = self._ensemble_validation_score(candidate_pred)
                 if best_addition_score < candidate_ensemble_score:
                     best_addition, best_addition_score = model, candidate_ensemble_score
@@ -151,14 +154,20 @@ class Ensemble(object):
             raise ValueError("timeout must be greater than 0.")
 
         self._fit_models = []
-        fit_dispatcher = FunctionDispatcher(self._n_jobs, fit_and_weight)
+        # The data is bound to the function given to each process, rather than sent along with each pipeline.
+        fit_dispatcher = FunctionDispatcher(self._n_jobs, partial(fit_and_weight, X=X, y=y),
+                                            max_threads=self._max_threads)
         with stopit.ThreadingTimeout(timeout) as c_mgr:
             fit_dispatcher.start()
             for (model, weight) in self._models.values():
-                fit_dispatcher.queue_evaluation((model.pipeline, X, y, weight))
+                fit_dispatcher.queue_evaluation((model.pipeline, weight))
 
             for _ in self._models.values():
-                _, output, __ = fit_dispatcher.get_next_result()
+                _, output, pipeline_and_weight = fit_dispatcher.get_next_result()
+                if isinstance(output, (WorkerDiedError, WorkerTimeoutError)):
+                    log.warning("Could not fit pipeline {} of the ensemble: {} Leaving it out of the ensemble."
+                                .format(pipeline_and_weight[0], output))
+                    continue
                 pipeline, weight = output
                 if weight > 0:
                     self._fit_models.append((pipeline, weight))
@@ -204,30 +213,34 @@ class Ensemble(object):
 
 
 def load_predictions(cache_dir, prediction_transformation=None):
-    models = []
-    for file in os.listdir(cache_dir):
-        if file.endswith('.pkl'):
-            file_name = os.path.join(cache_dir, file)
-            if os.stat(file_name).st_size > 0:
-                # We check file size, because writing to disk may be interrupted if the process was terminated due
-                # to a restart/timeout. I can not find specifications saying that any interrupt of pickle.dump leads
-                # to 0-sized files, but in practice this seems to case so far. TODO: Find verification, or fix proper.
-                with open(os.path.join(cache_dir, file), 'rb') as fh:
-                    pl, predictions, score = pickle.load(fh)
-                if prediction_transformation:
-                    predictions = prediction_transformation(predictions)
-                models.append(Model(str(pl), pl, predictions, score))
-    return models
-
-
-def fit_and_weight(args):
+    return EvaluationStore(cache_dir).load_models(prediction_transformation)
+
+
+def _float_predictions(model):
+    """ The predictions of the model, converted to float64 if they are stored with reduced precision.
+
+    Models loaded from a `gama.utilities.evaluation_store.EvaluationStore` may store quantized predictions, which
+    must be multiplied by their `prediction_scale`. The conversion creates a temporary array only.
+    """
+    scale = getattr(model, 'prediction_scale', 1)
+    predictions = model.predictions
+    if isinstance(predictions, np.ndarray) and (scale != 1 or predictions.dtype in [np.float32, np.float16]):
+        return np.multiply(predictions, scale, dtype=np.float64)
+    return predictions
+
+
+def fit_and_weight(args, X, y):
     """ Fit the pipeline given the data. Update weight to 0 if fitting fails.
 
+    :param args: tuple (pipeline, weight).
+    :param X: Data to fit the pipeline on.
+    :param y: Targets corresponding to features X.
+
     :return:  pipeline, weight - The same pipeline that was provided as input.
                                  Weight is either the input value of `weight`, if fitting succeeded, or 0 if *any*
                                  exception occurred during fitting.
     """
-    pipeline, X, y, weight = args
+    pipeline, weight = args
     try:
         pipeline.fit(X, y)
     except Exception:
@@ -0,0 +1,169 @@
+""" An append-only store for the results of pipeline evaluations, from which the ensemble is built.
+
+Each process appends to its own segment in the store directory, so processes never have to coordinate writes.
+Segments are named by a random uuid rather than the process id, because workers on other machines (or in
+containers, which reuse process ids) may write to the same directory.
+A segment consists of three files:
+
+ - `<segment>.predictions`: the raw bytes of the out-of-fold predictions of each pipeline, one block after another.
+ - `<segment>.pipelines`: the pickled (unfitted) pipelines, one after another.
+ - `<segment>.index`: one line for each pipeline, with its name, score and the location of its data in the other files.
+
+The index line is written last, so a result which is only partially written (e.g. because its process was
+terminated) is never read. When the store is loaded, the predictions of each segment are memory-mapped,
+so predictions are only read from disk when they are used, and pipelines are only unpickled when they are used.
+
+Probability predictions may be stored with reduced precision, see `EvaluationStore`.
+"""
+import json
+import logging
+import os
+import pickle
+import uuid
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_ALIGNMENT = 16  # bytes, predictions are aligned so that they can be used without copying.
+PREDICTION_DTYPES = ['float64', 'float32', 'float16', 'uint8']
+_UINT8_SCALE = 1 / 255  # Probabilities stored as uint8 are multiples of this value.
+
+
+class StoredModel(object):
+    """ A model loaded from an `EvaluationStore`. Has the same attributes as `gama.utilities.auto_ensemble.Model`. """
+
+    def __init__(self, name, validation_score, predictions, pipeline_file, pipeline_offset,
+                 prediction_transformation=None, prediction_scale=1):
+        self.name = name
+        self.validation_score = validation_score
+        self.prediction_scale = prediction_scale
+        self._predictions = predictions
+        self._pipeline_file = pipeline_file
+        self._pipeline_offset = pipeline_offset
+        self._pipeline = None
+        self._prediction_transformation = prediction_transformation
+        self._transformed_predictions = None
+
+    @property
+    def pipeline(self):
+        """ The unfitted pipeline. It is unpickled on first access, and the same object is returned afterwards. """
+        if self._pipeline is None:
+            with open(self._pipeline_file, 'rb') as fh:
+                fh.seek(self._pipeline_offset)
+                self._pipeline = pickle.load(fh)
+        return self._pipeline
+
+    @property
+    def predictions(self):
+        """ The out-of-fold predictions, memory-mapped unless a prediction transformation was specified.
+
+        Predictions are returned as stored, the actual predictions are `predictions * prediction_scale`.
+        """
+        if self._prediction_transformation is None:
+            return self._predictions
+        if self._transformed_predictions is None:
+            self._transformed_predictions = self._prediction_transformation(np.asarray(self._predictions))
+        return self._transformed_predictions
+
+
+class EvaluationStore(object):
+    """ Stores (pipeline, predictions, score) of evaluations in a directory, see the module documentation.
+
+    Floating point predictions can be stored with reduced precision to save disk space and memory.
+    This is intended for class probabilities: with 'uint8' the predictions are quantized to multiples of 1/255,
+    which requires predictions to be in [0, 1].
+    """
+
+    def __init__(self, directory, prediction_dtype='float64'):
+        """
+        :param directory: str. Directory in which to store the results. It must exist.
+        :param prediction_dtype: str (default='float64'). One of 'float64', 'float32', 'float16' and 'uint8'.
+            The type in which floating point predictions are stored.
+        """
+        if prediction_dtype not in PREDICTION_DTYPES:
+            raise ValueError("prediction_dtype must be one of {}, but was {}."
+                             .format(PREDICTION_DTYPES, prediction_dtype))
+        self._directory = directory
+        self._prediction_dtype = prediction_dtype
+        self._segment_pid = None
+        self._files = None
+
+    def __getstate__(self):
+        # Open files can not be shared with other processes, each process opens its own segment.
+        return dict(_directory=self._directory, _prediction_dtype=self._prediction_dtype,
+                    _segment_pid=None, _files=None)
+
+    def _open_segment(self):
+        segment = os.path.join(self._directory, 'evaluations_{}'.format(uuid.uuid4().hex))
+        self._files = tuple(open(segment + extension, 'ab') for extension in ['.predictions', '.pipelines', '.index'])
+        self._segment_pid = os.getpid()
+
+    def append(self, pipeline, predictions, score):
+        """ Append the evaluation result of `pipeline` to the segment of this process.
+
+        :param pipeline: the (unfitted) pipeline.
+        :param predictions: numpy array with the out-of-fold predictions of the pipeline.
+            Floating point predictions are converted to `prediction_dtype`.
+        :param score: the validation score of the pipeline.
+        """
+        if self._segment_pid != os.getpid():
+            # Also after a fork, the segment of the parent process must not be written to.
+            self._open_segment()
+        predictions_fh, pipelines_fh, index_fh = self._files
+
+        predictions, scale = np.ascontiguousarray(predictions), 1
+        if predictions.dtype.kind == 'f' and self._prediction_dtype == 'uint8':
+            predictions, scale = np.rint(predictions / _UINT8_SCALE).astype(np.uint8), _UINT8_SCALE
+        elif predictions.dtype.kind == 'f':
+            predictions = predictions.astype(self._prediction_dtype, copy=False)
+        predictions_fh.write(b'\0' * (-predictions_fh.tell() % _ALIGNMENT))
+        predictions_offset = predictions_fh.tell()
+        predictions_fh.write(predictions.tobytes())
+        pipeline_offset = pipelines_fh.tell()
+        pickle.dump(pipeline, pipelines_fh)
+        predictions_fh.flush()
+        pipelines_fh.flush()
+
+        name = str(pipeline).replace('\n', '')
+        entry = [name, float(score), predictions_offset, predictions.dtype.str, predictions.shape, scale,
+                 pipeline_offset]
+        index_fh.write((json.dumps(entry) + '\n').encode('utf-8'))
+        index_fh.flush()
+
+    def load_models(self, prediction_transformation=None):
+        """ Load all results in the store, from all segments.
+
+        :param prediction_transformation: function or None (default=None). If set, it is applied to the
+            predictions of a model on first access.
+        :return: a list of `StoredModel`.
+        """
+        models = []
+        for file in sorted(os.listdir(self._directory)):
+            if file.startswith('evaluations_') and file.endswith('.index'):
+                models += self._load_segment(os.path.join(self._directory, file[:-len('.index')]),
+                                             prediction_transformation)
+        return models
+
+    def _load_segment(self, segment, prediction_transformation):
+        with open(segment + '.index', 'rb') as fh:
+            lines = fh.read().decode('utf-8').split('\n')
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # An empty line, or the index line of a result was interrupted while it was written.
+                continue
+        if not entries:
+            return []
+
+        raw_predictions = np.memmap(segment + '.predictions', dtype=np.uint8, mode='r')
+        models = []
+        for name, score, predictions_offset, dtype, shape, scale, pipeline_offset in entries:
+            dtype = np.dtype(dtype)
+            n_bytes = int(np.prod(shape)) * dtype.itemsize
+            predictions = raw_predictions[predictions_offset:predictions_offset + n_bytes].view(dtype).reshape(shape)
+            models.append(StoredModel(name, score, predictions, segment + '.pipelines', pipeline_offset,
+                                      prediction_transformation, scale))
+        return models
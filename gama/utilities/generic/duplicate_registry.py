@@ -0,0 +1,127 @@
+import hashlib
+import math
+
+import numpy as np
+
+
+def _digest(key):
+    """ 16-byte hash of the string `key`, which is the same in every process (unlike `hash`). """
+    return hashlib.sha256(key.encode('utf-8')).digest()[:16]
+
+
+class _HashSet(object):
+    """ Set of non-zero 64-bit hashes in a numpy array, using open addressing with linear probing.
+
+    The number of slots is the power of two which is at least twice `capacity`, so each of `capacity` hashes costs
+    16 to 32 bytes, and probes stay short.
+    """
+
+    def __init__(self, capacity):
+        n_slots = 1 << max(3, (2 * capacity - 1).bit_length())
+        self._mask = n_slots - 1
+        self._slots = np.zeros(n_slots, dtype=np.uint64)
+
+    def _slot(self, hash_):
+        """ The slot which holds `hash_`, or the empty slot where it would be added. """
+        slot = hash_ & self._mask
+        # Compared as Python integers: comparing a uint64 to an integer may convert both to float64.
+        while True:
+            stored = int(self._slots[slot])
+            if stored == hash_ or stored == 0:
+                return slot
+            slot = (slot + 1) & self._mask
+
+    def add(self, hash_):
+        self._slots[self._slot(hash_)] = hash_
+
+    def __contains__(self, hash_):
+        return int(self._slots[self._slot(hash_)]) == hash_
+
+
+class _BloomFilter(object):
+    """ Bit array in which each key sets `n_hashes` bits. A key is reported as present if all its bits are set. """
+
+    def __init__(self, capacity, false_positive_rate):
+        self.n_bits = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+        self.n_hashes = max(1, int(round(self.n_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing: the k-th position is h1 + k * h2, which behaves like k independent hashes.
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + k * h2) % self.n_bits for k in range(self.n_hashes)]
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, digest):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(digest))
+
+
+class DuplicateRegistry(object):
+    """ Remembers which keys have been seen, using a fixed amount of memory per key and a bounded number of keys.
+
+    Keys are not stored, only their hashes: a 64-bit hash per key in a numpy hash table (16 to 32 bytes per key),
+    or about ten bits per key (for a 1% false positive rate) if `false_positive_rate` is set, in which
+    case a Bloom filter is used. The memory for `max_size` keys is allocated up front. Keys are remembered in two
+    generations of at most `max_size` keys each. When the newest generation is full, the oldest generation is
+    forgotten, so at least the `max_size` most recently added keys are remembered.
+
+    A key which was not seen before is reported as seen with probability `false_positive_rate` (for a Bloom filter),
+    or with negligible probability (2**-64 per pair of keys) otherwise. Seen keys are never reported as unseen,
+    unless they were forgotten.
+    """
+
+    def __init__(self, max_size=100000, false_positive_rate=None):
+        """
+        :param max_size: positive integer (default=100000). Number of keys in each generation.
+        :param false_positive_rate: float in (0, 1) or None (default=None). If set, keys are stored in a Bloom filter
+            with this false positive rate when it holds `max_size` keys, rather than as 64-bit hashes.
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be greater than zero, but was {}.".format(max_size))
+        if false_positive_rate is not None and not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate must be in (0, 1) or None, but was {}.".format(false_positive_rate))
+        self._max_size = max_size
+        self._false_positive_rate = false_positive_rate
+        self.clear()
+
+    def _new_generation(self):
+        if self._false_positive_rate is not None:
+            return _BloomFilter(self._max_size, self._false_positive_rate)
+        return _HashSet(self._max_size)
+
+    def _stored_hash(self, digest):
+        if self._false_positive_rate is not None:
+            return digest
+        # Zero marks an empty slot of a `_HashSet`.
+        return int.from_bytes(digest[:8], 'little') or 1
+
+    def clear(self):
+        """ Forget all keys. """
+        self._current, self._n_current = self._new_generation(), 0
+        self._previous, self._n_previous = self._new_generation(), 0
+
+    def __len__(self):
+        """ Number of keys remembered. """
+        return self._n_current + self._n_previous
+
+    def __contains__(self, key):
+        stored_hash = self._stored_hash(_digest(key))
+        return stored_hash in self._current or stored_hash in self._previous
+
+    def add(self, key):
+        """ Remember `key`. Return True if it was not seen before, False if it was (or possibly was).
+
+        :param key: str.
+        """
+        stored_hash = self._stored_hash(_digest(key))
+        if stored_hash in self._current or stored_hash in self._previous:
+            return False
+        if self._n_current == self._max_size:
+            self._previous, self._n_previous = self._current, self._n_current
+            self._current, self._n_current = self._new_generation(), 0
+        self._current.add(stored_hash)
+        self._n_current += 1
+        return True
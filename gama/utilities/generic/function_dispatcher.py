@@ -4,28 +4,126 @@ This can happen when objects passed are not pickleable, however all items should
 I am not sure if the behavior would be exactly the same. For now, I will have to work with this.
 """
 
+from collections import deque
+from datetime import datetime
 import logging
 import multiprocessing as mp
-import queue
+from multiprocessing import connection
+import os
 import random
-import time
 import uuid
 
 import numpy as np
 
+try:
+    import resource
+except ImportError:
+    # The resource module is only available on Unix systems.
+    resource = None
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
 log = logging.getLogger(__name__)
 
+# Maximum time in seconds to block while waiting for results, so that a stopit timeout can interrupt the wait.
+_WAIT_INTERVAL = 0.1
+
+
+class WorkerDiedError(Exception):
+    """ Returned as output of a job if the child process evaluating it died, e.g. because it was killed by the OS. """
+
+    def __init__(self, exitcode, start_datetime):
+        """
+        :param exitcode: exit code of the child process. Negative if the process was killed by a signal,
+            None if it is unknown, e.g. for a process on another machine.
+        :param start_datetime: datetime at which the child process started the job.
+        """
+        super().__init__("Child process died with exit code {}.".format(exitcode))
+        self.exitcode = exitcode
+        self.start_datetime = start_datetime
+
+
+class WorkerTimeoutError(Exception):
+    """ Returned as output of a job if the child process evaluating it was terminated for exceeding the timeout. """
+
+    def __init__(self, timeout, start_datetime):
+        """
+        :param timeout: the timeout in seconds that was exceeded.
+        :param start_datetime: datetime at which the child process started the job.
+        """
+        super().__init__("Child process exceeded timeout of {}s.".format(timeout))
+        self.timeout = timeout
+        self.start_datetime = start_datetime
+
+
+def limit_memory(max_memory):
+    """ Limit the address space of the current process to `max_memory` bytes. Returns True if successful. """
+    if resource is None:
+        return False
+    resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    return True
 
-def evaluator_daemon(input_queue, output_queue, fn, seed=0, print_exit_message=False):
+
+# Environment variables which set the size of the thread pools of BLAS and OpenMP libraries when they are loaded.
+THREAD_ENVIRONMENT_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                                'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+
+def limit_threads(max_threads):
+    """ Limit the BLAS and OpenMP thread pools of the current process to `max_threads` threads.
+
+    Libraries which are not loaded yet read the limit from environment variables. Thread pools of libraries which
+    are already loaded, such as NumPy's BLAS in a forked process, can only be resized if threadpoolctl is installed.
+    Returns True if the thread pools of loaded libraries were limited.
+    """
+    for variable in THREAD_ENVIRONMENT_VARIABLES:
+        os.environ[variable] = str(max_threads)
+    if threadpool_limits is None:
+        return False
+    threadpool_limits(limits=max_threads)
+    return True
+
+
+def resident_memory():
+    """ Return the resident set size of the current process in bytes, or None if it can not be determined. """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def evaluator_daemon(job_connection, fn, seed=0, print_exit_message=False, max_memory=None, max_threads=None,
+                     logger=None):
+    """ Evaluate `fn` on jobs received over `job_connection` until it receives None or the connection is closed.
+
+    Jobs are received as (identifier, input, kwargs) and their results are sent back as
+    (identifier, output, rss, messages), where rss is the resident memory of the process after the job in bytes
+    (None if unknown) and messages are the log messages `logger` (a `MultiprocessingLogger`) stored during the job.
+    """
     random.seed(seed)
     np.random.seed(seed)
+    if max_memory is not None:
+        limit_memory(max_memory)
+    if max_threads is not None:
+        limit_threads(max_threads)
+    if logger is not None:
+        # Messages which were not yet flushed when this process was forked are already in the parent process.
+        logger.pop_messages()
 
     shutdown_message = 'Helper process stopping normally.'
     try:
         while True:
-            identifier, input_ = input_queue.get()
-            output = fn(input_)
-            output_queue.put((identifier, output))
+            job = job_connection.recv()
+            if job is None:
+                break
+            identifier, input_, kwargs = job
+            output = fn(input_, **kwargs)
+            messages = logger.pop_messages() if logger is not None else []
+            job_connection.send((identifier, output, resident_memory(), messages))
     except KeyboardInterrupt:
         shutdown_message = 'Helper process stopping due to keyboard interrupt.'
     except (BrokenPipeError, EOFError):
@@ -35,41 +133,92 @@ def evaluator_daemon(input_queue, output_queue, fn, seed=0, print_exit_message=F
         print(shutdown_message)
 
 
-def clear_queue(queue_):
-    """ Dequeue items until the queue is empty. Returns number of items removed from the queue. """
-    items_cleared = 0
-    while True:
-        try:
-            queue_.get(block=False)
-            items_cleared += 1
-        except queue.Empty:
-            break
-        except EOFError:
-            log.warning('EOFError occurred while clearing queue.', exc_info=True)
-    return items_cleared
-
-
 class FunctionDispatcher(object):
     """ A manager for evaluating functions async in the background using multi-processing.
 
     This object will spawn `n_jobs` child processes which will run `func` on any input given through `queue_evaluation`.
+    Keyword arguments given to `queue_evaluation` are passed on to `func` for that input only.
     Return values of evaluations can be obtained by calling `get_next_result`.
     To keep track of which input leads to which output, `queue_evaluation` returns a unique identifier for each call.
     Finally, `get_next_result` will return the identifier and `item` alongside the output of `func(item)`.
+
+    If a child process dies while evaluating a job, e.g. because it was killed by the operating system for using too
+    much memory, it is replaced by a new child process and the output for that job is a `WorkerDiedError`.
+    Similarly, if a timeout is set, a child process that evaluates a job for longer than the timeout is terminated
+    and replaced, and the output for that job is a `WorkerTimeoutError`. Unlike a timeout within the child process,
+    this also interrupts functions which are stuck in native code.
+
+    Each child process is connected to this object by its own pipe, over which it receives one job at a time and
+    sends back its result. Jobs wait in this process until a child process is idle. `get_next_result` blocks until
+    one of the pipes has data or a child process dies, so results are received as soon as they are sent.
+
+    If `max_threads` is set, the BLAS and OpenMP thread pools of each child process are limited, so that child
+    processes do not each start a thread per core and compete for them.
+
+    Child processes can be replaced after they completed `max_tasks_per_worker` jobs, or when their resident memory
+    exceeds `max_worker_rss` after a job, to release memory that accumulates over many jobs. Child processes are only
+    replaced between jobs, so no work is lost.
+
+    If `func` logs to a `gama.utilities.logging_utilities.MultiprocessingLogger`, pass it as `logger`: the messages
+    a child process logs during a job are sent back with the result and added to `logger` in this process.
+    Messages of a job whose child process dies are lost.
     """
 
-    def __init__(self, n_jobs, func):
+    def __init__(self, n_jobs, func, max_memory=None, timeout=None, max_threads=None, max_tasks_per_worker=None,
+                 max_worker_rss=None, logger=None):
+        """
+        :param n_jobs: positive integer. The number of child processes to use, no child processes are used if 1.
+        :param func: the function to evaluate on each item.
+        :param max_memory: positive integer or None (default=None). If set, limit the address space of each child
+            process to this many bytes, so that allocating more memory raises a MemoryError. This includes the data
+            mapped from files. Only supported on Unix, and only if child processes are used.
+        :param timeout: positive number or None (default=None). If set, terminate child processes which evaluate
+            a single job for longer than this many seconds. Only enforced if child processes are used.
+            Can be overridden for individual jobs, see `queue_evaluation`.
+        :param max_threads: positive integer or None (default=None). If set, limit the BLAS and OpenMP thread pools
+            of each child process to this many threads. Only applied if child processes are used.
+        :param max_tasks_per_worker: positive integer or None (default=None). If set, replace child processes after
+            they completed this many jobs.
+        :param max_worker_rss: positive integer or None (default=None). If set, replace child processes whose resident
+            memory exceeds this many bytes after completing a job. Only supported on Linux.
+        :param logger: `MultiprocessingLogger` or None (default=None). The logger `func` logs to, if any.
+        """
         if n_jobs <= 0:
             raise ValueError("n_jobs must be at least 1.")
+        if max_memory is not None and (n_jobs == 1 or resource is None):
+            log.warning("Can not limit memory of evaluations {}, max_memory is ignored."
+                        .format("without child processes" if n_jobs == 1 else "on this platform"))
+            max_memory = None
+        if max_worker_rss is not None and n_jobs > 1 and resident_memory() is None:
+            log.warning("Can not measure memory of child processes on this platform, max_worker_rss is ignored.")
+            max_worker_rss = None
+        if max_threads is not None and n_jobs > 1 and threadpool_limits is None:
+            log.warning("threadpoolctl is not installed, so thread pools of libraries which are already loaded, such as "
+                        "NumPy's BLAS, are not limited in child processes. Install threadpoolctl to limit them.")
 
-        mp_manager = mp.Manager()
-        self._input_queue = mp_manager.Queue() if n_jobs > 1 else queue.Queue()
-        self._output_queue = mp_manager.Queue() if n_jobs > 1 else queue.Queue()
         self._n_jobs = n_jobs
         self._func = func
+        self._max_memory = max_memory
+        self._timeout = timeout
+        self._max_threads = max_threads
+        self._max_tasks_per_worker = max_tasks_per_worker
+        self._max_worker_rss = max_worker_rss
+        self._logger = logger
 
         self._job_map = {}
+        # Maps the identifier of a job to its timeout, for jobs which do not use the default `timeout`.
+        self._job_timeouts = {}
+        # (identifier, item, kwargs) of jobs which are not yet sent to a child process.
+        self._pending_jobs = deque()
         self._child_processes = []
+        # The connection to each child process, in the same order as `_child_processes`.
+        self._connections = []
+        # (identifier, output) of results which were received but not yet returned by `get_next_result`.
+        self._results = deque()
+        # Maps the index of a child process to (identifier, start datetime) of the job it is evaluating.
+        self._running_jobs = {}
+        # The number of jobs each child process completed, in the same order as `_child_processes`.
+        self._tasks_completed = []
 
     def start(self):
         """ Start child processes. """
@@ -79,60 +228,212 @@ class FunctionDispatcher(object):
         if self._n_jobs > 1:
             log.debug('Starting {} child processes.'.format(self._n_jobs))
             self._job_map = {}
+            self._running_jobs = {}
             for _ in range(self._n_jobs):
-                p = mp.Process(target=evaluator_daemon,
-                               args=(self._input_queue, self._output_queue, self._func))
-                p.daemon = True
-                self._child_processes.append(p)
-                p.start()
+                process, connection_ = self._start_child_process()
+                self._child_processes.append(process)
+                self._connections.append(connection_)
+                self._tasks_completed.append(0)
         else:
             log.debug('Not starting child processes because n_jobs=1.')
 
+    def _start_child_process(self):
+        """ Start a child process, returns the process and the connection to it. """
+        parent_connection, child_connection = mp.Pipe()
+        p = mp.Process(target=evaluator_daemon,
+                       args=(child_connection, self._func),
+                       kwargs=dict(max_memory=self._max_memory, max_threads=self._max_threads, logger=self._logger))
+        p.daemon = True
+        p.start()
+        # Only the child process should hold its end of the pipe, so that reading raises an EOFError once it died.
+        child_connection.close()
+        return p, parent_connection
+
     def stop(self):
         """ Dequeue all outstanding jobs, discard saved results and terminate child processes. """
         log.debug('Terminating {} child processes.'.format(len(self._child_processes)))
+        for connection_ in self._connections:
+            connection_.close()
         for process in self._child_processes:
             process.terminate()
         self._child_processes = []
+        self._connections = []
+        self._tasks_completed = []
+        nr_terminated = len(self._running_jobs)
+        self._running_jobs = {}
 
-        nr_cancelled = clear_queue(self._input_queue)
-        nr_discarded = clear_queue(self._output_queue)
+        nr_cancelled = len(self._pending_jobs)
+        self._pending_jobs.clear()
+        self._job_timeouts = {}
+        nr_discarded = len(self._results)
+        self._results.clear()
         log.debug("Cancelled {} outstanding jobs. Discarded {} results. Terminated {} currently executing jobs."
-                  .format(nr_cancelled, nr_discarded, len(self._job_map) - nr_cancelled - nr_discarded))
+                  .format(nr_cancelled, nr_discarded, nr_terminated))
 
     def restart(self):
         """ This is equivalent to calling `stop` then `start`."""
         self.stop()
         self.start()
 
-    def queue_evaluation(self, item):
+    def cancel(self, identifier):
+        """ Cancel the job with `identifier`, its result will not be returned by `get_next_result`.
+
+        If the job is being evaluated, its child process is terminated and replaced.
+        Returns False if there is no such job, e.g. because its result was already returned, True otherwise.
+        """
+        if identifier not in self._job_map:
+            return False
+        del self._job_map[identifier]
+        self._job_timeouts.pop(identifier, None)
+        self._pending_jobs = deque(job for job in self._pending_jobs if job[0] != identifier)
+        self._results = deque(result for result in self._results if result[0] != identifier)
+        for i, (running_identifier, _) in list(self._running_jobs.items()):
+            if running_identifier == identifier:
+                self._replace_child_process(i)
+        return True
+
+    def cancel_pending(self):
+        """ Cancel all jobs which are not being evaluated yet. Returns the identifiers of the cancelled jobs. """
+        cancelled = [identifier for identifier, _, __ in self._pending_jobs]
+        for identifier in cancelled:
+            del self._job_map[identifier]
+            self._job_timeouts.pop(identifier, None)
+        self._pending_jobs.clear()
+        return cancelled
+
+    def queue_evaluation(self, item, job_timeout=None, **kwargs):
         """ Queue an item to be processed by a child process according to `func` passed to __init__.
 
+        Any other keyword arguments are passed to `func` alongside the item.
+        If `job_timeout` is set, it is used instead of the `timeout` passed to __init__ for this job.
         Returns the identifier of the job.
         """
         identifier = uuid.uuid4()
         self._job_map[identifier] = item
-        self._input_queue.put((identifier, item))
+        if job_timeout is not None:
+            self._job_timeouts[identifier] = job_timeout
+        self._pending_jobs.append((identifier, item, kwargs))
+        self._send_pending_jobs()
         return identifier
 
+    def _send_pending_jobs(self):
+        """ Send pending jobs to idle child processes. """
+        for i, connection_ in enumerate(self._connections):
+            if not self._pending_jobs:
+                return
+            if i in self._running_jobs:
+                continue
+            job = self._pending_jobs.popleft()
+            try:
+                connection_.send(job)
+            except (BrokenPipeError, OSError):
+                # The child process died, the job is sent to its replacement instead.
+                self._pending_jobs.appendleft(job)
+                continue
+            self._running_jobs[i] = (job[0], datetime.now())
+
     def _get_next_from_daemons(self):
-        # If we just used the blocking queue.get, then KeyboardInterrupts/Timeout would not work.
-        # Previously, specifying a timeout worked, but for some reason that seems no longer the case.
-        # Using timeout prevents the stopit.Timeout exception from being received.
-        # When waiting with sleep, we don't want to wait too long, but we never know when a pipeline
-        # would finish evaluating.
-        last_get_successful = True
+        # Blocking indefinitely would prevent KeyboardInterrupts and stopit.Timeout exceptions from being received,
+        # so wait in intervals. Waiting returns as soon as a result is sent or a child process dies.
         while True:
+            if self._results:
+                return self._results.popleft()
+
+            ready = connection.wait(self._connections + [p.sentinel for p in self._child_processes],
+                                    timeout=_WAIT_INTERVAL)
+            for i, connection_ in enumerate(self._connections):
+                if connection_ in ready:
+                    self._receive_result(i)
+            if not self._results:
+                lost_job = self._check_child_processes()
+                if lost_job is not None:
+                    return lost_job
+            self._send_pending_jobs()
+
+    def _receive_result(self, i):
+        """ Receive the result the i-th child process sent, if any. """
+        connection_ = self._connections[i]
+        try:
+            if not connection_.poll():
+                return
+            identifier, output, rss, messages = connection_.recv()
+        except (EOFError, OSError):
+            return  # The child process died, which is handled by `_check_child_processes`.
+        if self._logger is not None:
+            self._logger.add_messages(messages)
+        self._running_jobs.pop(i, None)
+        if identifier in self._job_map:  # Otherwise the job was already reported failed.
+            self._results.append((identifier, output))
+
+        self._tasks_completed[i] += 1
+        if self._max_tasks_per_worker is not None and self._tasks_completed[i] >= self._max_tasks_per_worker:
+            log.debug("Replacing child process after {} jobs.".format(self._tasks_completed[i]))
+            self._replace_child_process(i)
+        elif self._max_worker_rss is not None and rss is not None and rss > self._max_worker_rss:
+            log.debug("Replacing child process which uses {:.1f}MB of memory.".format(rss / 2**20))
+            self._replace_child_process(i)
+
+    def _replace_child_process(self, i):
+        """ Stop the i-th child process if it is still running and start a new child process in its place. """
+        process = self._child_processes[i]
+        if process.is_alive() and i in self._running_jobs:
+            process.terminate()
+        elif process.is_alive():
+            # An idle child process is asked to stop, rather than terminated, so it is not killed while it writes.
+            # Closing the connection is not enough: children forked later hold copies of this end of the pipe.
             try:
-                if not last_get_successful:
-                    time.sleep(0.1)  # seconds
+                self._connections[i].send(None)
+                process.join(timeout=1)
+            except (BrokenPipeError, OSError):
+                pass
+            if process.is_alive():
+                process.terminate()
+        self._connections[i].close()
+        self._running_jobs.pop(i, None)
+        self._tasks_completed[i] = 0
+        self._child_processes[i], self._connections[i] = self._start_child_process()
 
-                identifier, fitness = self._output_queue.get(block=False)
-                return identifier, fitness
+    def _check_child_processes(self):
+        """ Replace child processes which died or exceeded the timeout.
 
-            except queue.Empty:
-                last_get_successful = False
+        Returns (identifier, error) for a job that was lost, where error is a `WorkerDiedError` or
+        `WorkerTimeoutError`, or None if no job was lost. If multiple jobs were lost, the others are returned by
+        subsequent calls.
+        """
+        now = datetime.now()
+        lost_job = None
+        for i, process in enumerate(self._child_processes):
+            identifier, start_datetime = self._running_jobs.get(i, (None, None))
+            timeout = self._job_timeouts.get(identifier, self._timeout)
+            timed_out = (identifier is not None and timeout is not None
+                         and (now - start_datetime).total_seconds() > timeout)
+            if process.is_alive() and not timed_out:
+                continue
+            # A result which was sent before the child process died or timed out is still valid.
+            self._receive_result(i)
+            if self._child_processes[i] is not process:
+                continue  # The child process was replaced after completing its job.
+            identifier, start_datetime = self._running_jobs.get(i, (None, None))
+            is_running_job = identifier in self._job_map
+            if process.is_alive() and not is_running_job:
                 continue
+            if is_running_job and lost_job is not None:
+                continue  # The job is reported, and the process replaced, on a subsequent call.
+
+            if process.is_alive():
+                log.info("Terminating child process because it exceeded the timeout of {}s while evaluating {}."
+                         .format(timeout, self._job_map[identifier]))
+                process.terminate()
+                process.join(timeout=1)
+                lost_job = (identifier, WorkerTimeoutError(timeout, start_datetime))
+            elif is_running_job:
+                log.warning("Child process died with exit code {} while evaluating {}."
+                            .format(process.exitcode, self._job_map[identifier]))
+                lost_job = (identifier, WorkerDiedError(process.exitcode, start_datetime))
+            else:
+                log.warning("Child process died with exit code {}.".format(process.exitcode))
+            self._replace_child_process(i)
+        return lost_job
 
     def get_next_result(self):
         """ Get the result of an evaluation that was queued by calling `queue_evaluation`. This function is blocking.
@@ -146,8 +447,9 @@ class FunctionDispatcher(object):
             identifier, output = self._get_next_from_daemons()
         else:
             # For n_jobs = 1, we do not want to spawn a separate process. Mimic behaviour.
-            identifier, input_ = self._input_queue.get()
-            output = self._func(input_)
+            identifier, input_, kwargs = self._pending_jobs.popleft()
+            output = self._func(input_, **kwargs)
 
         input_ = self._job_map.pop(identifier)
+        self._job_timeouts.pop(identifier, None)
         return identifier, output, input_
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+
+def _unit_size(item):
+    return 1
+
+
+class LRUCache(object):
+    """ A dictionary-like cache which evicts least recently used items once the total size of its items exceeds a budget.
+
+    The size of each item is determined by `size_fn`, which makes it possible to bound the cache by e.g. memory usage
+    rather than by number of items. Items which by themselves exceed the budget are never stored.
+    """
+
+    def __init__(self, max_size, size_fn=None):
+        """
+        :param max_size: positive number. The maximum total size of all items in the cache.
+        :param size_fn: function (default: None). Function that takes an item and returns its size.
+            If left None, each item has size 1 and `max_size` is the maximum number of items in the cache.
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be greater than zero.")
+
+        self._max_size = max_size
+        self._size_fn = size_fn if size_fn is not None else _unit_size
+        self._items = OrderedDict()
+        self._total_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_size(self):
+        return self._total_size
+
+    def get(self, key, default=None):
+        """ Return the item stored under `key` and mark it as most recently used, or `default` if it is not stored. """
+        if key not in self._items:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._items.move_to_end(key)
+        item, _ = self._items[key]
+        return item
+
+    def put(self, key, item):
+        """ Store `item` under `key`, evicting least recently used items as needed to stay within budget.
+
+        :return: True if the item was stored, False if the item by itself exceeds the budget.
+        """
+        size = self._size_fn(item)
+        if size > self._max_size:
+            return False
+
+        self.pop(key)
+        while self._items and self._total_size + size > self._max_size:
+            _, (__, evicted_size) = self._items.popitem(last=False)
+            self._total_size -= evicted_size
+
+        self._items[key] = (item, size)
+        self._total_size += size
+        return True
+
+    def pop(self, key, default=None):
+        """ Remove the item stored under `key` and return it, or return `default` if it is not stored. """
+        if key not in self._items:
+            return default
+        item, size = self._items.pop(key)
+        self._total_size -= size
+        return item
+
+    def clear(self):
+        self._items.clear()
+        self._total_size = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+
+
+class MemmappedArray(object):
+    """ A numpy array stored in a .npy file, which each process that uses it maps into memory.
+
+    Pickling a MemmappedArray only stores the path to the file, so passing it to other processes does not copy the
+    data, and all processes share the same physical memory through the operating system's page cache.
+    """
+
+    def __init__(self, array, path):
+        """ Store `array` in a .npy file at `path`. """
+        if os.path.exists(path):
+            # Remove rather than overwrite, processes which mapped the old file keep a valid mapping.
+            os.remove(path)
+        np.save(path, np.asarray(array))
+        self._path = path
+        self._array = None
+
+    @classmethod
+    def in_memory(cls, array):
+        """ A MemmappedArray which holds `array` in memory instead of mapping a file, e.g. on another machine. """
+        memmapped_array = cls.__new__(cls)
+        memmapped_array._path = None
+        memmapped_array._array = array
+        return memmapped_array
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def array(self):
+        """ The array, memory-mapped on first access in each process.
+
+        The array is mapped copy-on-write rather than read-only: the file is never modified, but estimators which
+        require a writeable buffer (or write to their input) still work. Only pages that are written to are copied.
+        """
+        if self._array is None:
+            self._array = np.load(self._path, mmap_mode='c')
+        return self._array
+
+    def __getstate__(self):
+        return dict(_path=self._path, _array=None)
+
+    def __len__(self):
+        return len(self.array)
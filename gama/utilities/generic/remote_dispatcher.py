@@ -0,0 +1,377 @@
+"""
+Evaluate functions on worker processes which connect over TCP, so that evaluations can run on other machines.
+
+A worker is started on any machine which can reach the dispatcher with:
+
+    python -m gama.utilities.generic.remote_dispatcher HOST PORT --authkey KEY
+
+Connections are authenticated with the shared `authkey`, because jobs and results are pickled, and unpickling data
+from an untrusted source can execute arbitrary code.
+"""
+import argparse
+import copyreg
+from collections import deque
+from datetime import datetime
+import io
+import logging
+from multiprocessing import connection
+import pickle
+import queue
+import socket
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from .function_dispatcher import WorkerDiedError, WorkerTimeoutError, limit_memory, limit_threads
+from .memmapped_array import MemmappedArray
+
+log = logging.getLogger(__name__)
+
+# Maximum time in seconds to block while waiting for results, so that a stopit timeout can interrupt the wait.
+_WAIT_INTERVAL = 0.1
+
+
+def _reduce_memmapped_array(memmapped_array):
+    return MemmappedArray.in_memory, (np.asarray(memmapped_array.array),)
+
+
+def dumps_with_data(obj):
+    """ Pickle `obj`, including the data of the memory-mapped arrays it references rather than their file paths. """
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[MemmappedArray] = _reduce_memmapped_array
+    pickler.dump(obj)
+    return buffer.getvalue()
+
+
+def _evaluate_jobs(connection_, heartbeat_interval):
+    """ Receive the function from the dispatcher over `connection_`, then evaluate jobs until the connection closes.
+
+    While a job is evaluated, a heartbeat is sent every `heartbeat_interval` seconds so the dispatcher knows the
+    worker is still alive.
+    """
+    fn = pickle.loads(connection_.recv_bytes())
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send_heartbeats():
+        while not stopped.wait(heartbeat_interval):
+            try:
+                with send_lock:
+                    connection_.send(('heartbeat', None, None))
+            except OSError:
+                return
+
+    threading.Thread(target=send_heartbeats, daemon=True).start()
+    try:
+        while True:
+            identifier, input_, kwargs = connection_.recv()
+            output = fn(input_, **kwargs)
+            with send_lock:
+                connection_.send(('result', identifier, output))
+    finally:
+        stopped.set()
+
+
+def run_worker(address, authkey, max_memory=None, max_threads=None, heartbeat_interval=5, retry_time=60):
+    """ Evaluate jobs of the `RemoteFunctionDispatcher` at `address`.
+
+    If the connection is lost, e.g. because the dispatcher restarted or gave up on a job, the worker reconnects.
+    The worker stops once it could not connect to the dispatcher for `retry_time` seconds.
+
+    :param address: tuple (host, port) of the dispatcher.
+    :param authkey: bytes. The key with which the dispatcher authenticates connections.
+    :param max_memory: positive integer or None (default=None). If set, limit the address space of this process to
+        this many bytes. Only supported on Unix.
+    :param max_threads: positive integer or None (default=None). If set, limit the BLAS and OpenMP thread pools of
+        this process to this many threads.
+    :param heartbeat_interval: positive number (default=5). Seconds between heartbeats sent during evaluations.
+    :param retry_time: positive number (default=60). Seconds after which to stop trying to connect.
+    """
+    if max_memory is not None:
+        limit_memory(max_memory)
+    if max_threads is not None:
+        limit_threads(max_threads)
+
+    last_connected = time.time()
+    while time.time() - last_connected < retry_time:
+        try:
+            connection_ = connection.Client(address, authkey=authkey)
+        except OSError:
+            time.sleep(1)
+            continue
+        log.info("Connected to dispatcher at {}:{}.".format(*address))
+        try:
+            _evaluate_jobs(connection_, heartbeat_interval)
+        except (EOFError, OSError):
+            log.info("Lost connection to dispatcher.")
+        finally:
+            connection_.close()
+        last_connected = time.time()
+
+
+class RemoteFunctionDispatcher(object):
+    """ A manager for evaluating functions async on workers which connect over TCP, possibly from other machines.
+
+    It has the same interface as `gama.utilities.generic.function_dispatcher.FunctionDispatcher`, but instead of
+    starting child processes, it listens on `address` for workers started with `run_worker`. Workers may connect and
+    disconnect at any time. Each worker that connects first receives `func`, including the data of memory-mapped
+    arrays it references, and then evaluates one job at a time.
+
+    Workers send heartbeats while they evaluate a job. If a worker disconnects or sends no message for
+    `heartbeat_timeout` seconds while evaluating a job, the output for that job is a `WorkerDiedError`. If a timeout
+    is set and a worker evaluates a single job for longer than the timeout, the output is a `WorkerTimeoutError`
+    and the worker is disconnected, after which it reconnects once it finishes the job.
+
+    Files that `func` writes, such as evaluation results in the cache directory, are written on the machine of the
+    worker, so the cache directory must be on a file system that is shared with the workers.
+    """
+
+    def __init__(self, func, address, authkey, timeout=None, heartbeat_timeout=30):
+        """
+        :param func: the function to evaluate on each item.
+        :param address: tuple (host, port) on which to listen for workers. If port is 0, a free port is chosen,
+            see `address`.
+        :param authkey: bytes. Workers must use the same key to connect.
+        :param timeout: positive number or None (default=None). If set, give up on jobs which take longer than this
+            many seconds. Can be overridden for individual jobs, see `queue_evaluation`.
+        :param heartbeat_timeout: positive number (default=30). Seconds without a message after which a worker which
+            is evaluating a job is considered dead. Must be larger than the heartbeat interval of the workers.
+        """
+        if not isinstance(authkey, bytes):
+            raise TypeError("authkey must be bytes.")
+        self._func = func
+        self._address = address
+        self._authkey = authkey
+        self._timeout = timeout
+        self._heartbeat_timeout = heartbeat_timeout
+
+        self._socket = None
+        self._payload = None
+        # Connections of workers which completed the handshake and received `func`, added from other threads.
+        self._new_workers = queue.Queue()
+        self._job_map = {}
+        # Maps the identifier of a job to its timeout, for jobs which do not use the default `timeout`.
+        self._job_timeouts = {}
+        # (identifier, item, kwargs) of jobs which are not yet sent to a worker.
+        self._pending_jobs = deque()
+        # Maps the connection of each worker to the time of its last message.
+        self._workers = {}
+        # Maps the connection of a worker to (identifier, start datetime) of the job it is evaluating.
+        self._running_jobs = {}
+        # (identifier, output) of results which were received but not yet returned by `get_next_result`.
+        self._results = deque()
+
+    @property
+    def address(self):
+        """ (host, port) on which the dispatcher listens for workers, available after `start`. """
+        return self._address
+
+    def start(self):
+        """ Start listening for workers. """
+        if self._socket is not None:
+            raise RuntimeError("Dispatcher already started.")
+        if self._payload is None:
+            self._payload = dumps_with_data(self._func)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(self._address)
+        self._socket.listen()
+        # Listen on the same port after a restart, so that workers can reconnect.
+        self._address = self._socket.getsockname()
+        self._job_map = {}
+        log.debug('Listening for workers on {}:{}.'.format(*self._address))
+
+    def _accept_worker(self):
+        """ Accept a connection and send `func` to the worker in a separate thread, as that may take a while. """
+        try:
+            sock, (host, port) = self._socket.accept()
+        except OSError:
+            return
+        threading.Thread(target=self._welcome_worker, args=(sock, host, port), daemon=True).start()
+
+    def _welcome_worker(self, sock, host, port):
+        connection_ = connection.Connection(sock.detach())
+        try:
+            connection.deliver_challenge(connection_, self._authkey)
+            connection.answer_challenge(connection_, self._authkey)
+            connection_.send_bytes(self._payload)
+        except (connection.AuthenticationError, EOFError, OSError):
+            log.warning("Rejected worker {}:{}.".format(host, port), exc_info=True)
+            connection_.close()
+            return
+        log.debug("Worker {}:{} connected.".format(host, port))
+        self._new_workers.put(connection_)
+
+    def stop(self):
+        """ Discard outstanding jobs and saved results, disconnect workers and stop listening. """
+        log.debug('Disconnecting {} workers.'.format(len(self._workers)))
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        while True:
+            try:
+                self._workers[self._new_workers.get(block=False)] = time.time()
+            except queue.Empty:
+                break
+        for connection_ in self._workers:
+            connection_.close()
+        self._workers = {}
+        nr_terminated = len(self._running_jobs)
+        self._running_jobs = {}
+
+        nr_cancelled = len(self._pending_jobs)
+        self._pending_jobs.clear()
+        self._job_timeouts = {}
+        nr_discarded = len(self._results)
+        self._results.clear()
+        log.debug("Cancelled {} outstanding jobs. Discarded {} results. Abandoned {} currently executing jobs."
+                  .format(nr_cancelled, nr_discarded, nr_terminated))
+
+    def restart(self):
+        """ This is equivalent to calling `stop` then `start`."""
+        self.stop()
+        self.start()
+
+    def cancel(self, identifier):
+        """ Cancel the job with `identifier`, its result will not be returned by `get_next_result`.
+
+        If the job is being evaluated, its worker is disconnected, after which it reconnects once it finishes the job.
+        Returns False if there is no such job, e.g. because its result was already returned, True otherwise.
+        """
+        if identifier not in self._job_map:
+            return False
+        del self._job_map[identifier]
+        self._job_timeouts.pop(identifier, None)
+        self._pending_jobs = deque(job for job in self._pending_jobs if job[0] != identifier)
+        self._results = deque(result for result in self._results if result[0] != identifier)
+        for connection_, (running_identifier, _) in list(self._running_jobs.items()):
+            if running_identifier == identifier:
+                self._remove_worker(connection_)
+        return True
+
+    def cancel_pending(self):
+        """ Cancel all jobs which are not being evaluated yet. Returns the identifiers of the cancelled jobs. """
+        cancelled = [identifier for identifier, _, __ in self._pending_jobs]
+        for identifier in cancelled:
+            del self._job_map[identifier]
+            self._job_timeouts.pop(identifier, None)
+        self._pending_jobs.clear()
+        return cancelled
+
+    def queue_evaluation(self, item, job_timeout=None, **kwargs):
+        """ Queue an item to be processed by a worker according to `func` passed to __init__.
+
+        Any other keyword arguments are passed to `func` alongside the item.
+        If `job_timeout` is set, it is used instead of the `timeout` passed to __init__ for this job.
+        Returns the identifier of the job.
+        """
+        identifier = uuid.uuid4()
+        self._job_map[identifier] = item
+        if job_timeout is not None:
+            self._job_timeouts[identifier] = job_timeout
+        self._pending_jobs.append((identifier, item, kwargs))
+        self._send_pending_jobs()
+        return identifier
+
+    def _send_pending_jobs(self):
+        """ Add workers which connected, and send pending jobs to idle workers. """
+        while True:
+            try:
+                self._workers[self._new_workers.get(block=False)] = time.time()
+            except queue.Empty:
+                break
+
+        for connection_ in list(self._workers):
+            if not self._pending_jobs:
+                return
+            if connection_ in self._running_jobs:
+                continue
+            job = self._pending_jobs.popleft()
+            try:
+                connection_.send(job)
+            except OSError:
+                self._pending_jobs.appendleft(job)
+                self._remove_worker(connection_)
+                continue
+            self._running_jobs[connection_] = (job[0], datetime.now())
+            self._workers[connection_] = time.time()
+
+    def _remove_worker(self, connection_, error=None):
+        """ Disconnect the worker. If it was evaluating a job, `error` is returned as output of that job. """
+        connection_.close()
+        del self._workers[connection_]
+        identifier, _ = self._running_jobs.pop(connection_, (None, None))
+        if identifier in self._job_map:
+            self._results.append((identifier, error))
+
+    def _receive_messages(self, connection_):
+        """ Process all messages the worker sent so far. """
+        try:
+            while connection_.poll():
+                message, identifier, output = connection_.recv()
+                self._workers[connection_] = time.time()
+                if message == 'result':
+                    self._running_jobs.pop(connection_, None)
+                    if identifier in self._job_map:  # Otherwise the job was already reported failed.
+                        self._results.append((identifier, output))
+        except (EOFError, OSError):
+            _, start_datetime = self._running_jobs.get(connection_, (None, datetime.now()))
+            log.warning("Worker disconnected.")
+            self._remove_worker(connection_, WorkerDiedError(None, start_datetime))
+
+    def _check_workers(self):
+        """ Disconnect workers which stopped sending heartbeats or exceeded the timeout while evaluating a job. """
+        now = datetime.now()
+        for connection_, (identifier, start_datetime) in list(self._running_jobs.items()):
+            timeout = self._job_timeouts.get(identifier, self._timeout)
+            if time.time() - self._workers[connection_] > self._heartbeat_timeout:
+                log.warning("Worker sent no heartbeat for {}s while evaluating {}."
+                            .format(self._heartbeat_timeout, self._job_map.get(identifier)))
+                self._remove_worker(connection_, WorkerDiedError(None, start_datetime))
+            elif timeout is not None and (now - start_datetime).total_seconds() > timeout:
+                log.info("Disconnecting worker because it exceeded the timeout of {}s while evaluating {}."
+                         .format(timeout, self._job_map.get(identifier)))
+                self._remove_worker(connection_, WorkerTimeoutError(timeout, start_datetime))
+
+    def get_next_result(self):
+        """ Get the result of an evaluation that was queued by calling `queue_evaluation`. This function is blocking.
+
+        This function raises a ValueError if it is called when there is no job queued with `queue_evaluation`.
+        """
+        if len(self._job_map) <= 0:
+            raise ValueError("You have to queue an evaluation for each time you call this function since last cancel.")
+
+        # Blocking indefinitely would prevent KeyboardInterrupts and stopit.Timeout exceptions from being received,
+        # so wait in intervals. Waiting returns as soon as a worker connects or sends a message.
+        while not self._results:
+            ready = connection.wait([self._socket] + list(self._workers), timeout=_WAIT_INTERVAL)
+            if self._socket in ready:
+                self._accept_worker()
+            for connection_ in list(self._workers):
+                if connection_ in ready:
+                    self._receive_messages(connection_)
+            self._check_workers()
+            self._send_pending_jobs()
+
+        identifier, output = self._results.popleft()
+        input_ = self._job_map.pop(identifier)
+        self._job_timeouts.pop(identifier, None)
+        return identifier, output, input_
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Start a worker which evaluates jobs of a remote dispatcher.")
+    parser.add_argument('host', help="Host name or IP address of the dispatcher.")
+    parser.add_argument('port', type=int, help="Port on which the dispatcher listens.")
+    parser.add_argument('--authkey', required=True, help="Key shared with the dispatcher.")
+    parser.add_argument('--max-memory', type=int, default=None, help="Memory limit of the worker in megabytes.")
+    parser.add_argument('--max-threads', type=int, default=None, help="Thread limit of BLAS and OpenMP.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    run_worker((args.host, args.port), args.authkey.encode(),
+               max_memory=args.max_memory * 2**20 if args.max_memory is not None else None,
+               max_threads=args.max_threads)
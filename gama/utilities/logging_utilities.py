@@ -1,42 +1,48 @@
-import itertools
 import logging
-import multiprocessing as mp
-import queue
 from datetime import datetime
 
 
 class MultiprocessingLogger(object):
     """ Stores log messages to be written to a log later. This is helpful when communicating log messages from
     auxiliary processes to the main process.
+
+    Messages are stored in the process that logs them. A child process sends its messages to the main process
+    along with each result (see `gama.utilities.generic.function_dispatcher.FunctionDispatcher`), where they are
+    added to the logger with `add_messages`. Unlike a shared queue, a child process which is terminated while it
+    logs can not block the other processes, it only loses its own messages.
     """
 
     def __init__(self):
-        manager = mp.Manager()
-        self._queue = manager.Queue()
+        self._messages = []
 
     def info(self, msg):
-        self._queue.put((logging.INFO, msg))
+        self._messages.append((logging.INFO, msg))
 
     def debug(self, msg):
-        self._queue.put((logging.DEBUG, msg))
+        self._messages.append((logging.DEBUG, msg))
 
     def warning(self, msg):
-        self._queue.put((logging.WARNING, msg))
+        self._messages.append((logging.WARNING, msg))
 
     def error(self, msg):
-        self._queue.put((logging.WARNING, msg))
+        self._messages.append((logging.WARNING, msg))
+
+    def pop_messages(self):
+        """ Return the (level, message) tuples stored so far, and forget them. """
+        messages, self._messages = self._messages, []
+        return messages
+
+    def add_messages(self, messages):
+        """ Store (level, message) tuples, e.g. those popped in another process. """
+        self._messages.extend(messages)
 
     def flush_to_log(self, log):
-        # According to the official documentation, Queue.Empty is not reliable, so we just poll the queue until empty.
-        for i in itertools.count():
-            try:
-                level, message = self._queue.get(block=False)
-                log.log(level, message)
-            except queue.Empty:
-                break
+        messages = self.pop_messages()
+        for level, message in messages:
+            log.log(level, message)
 
-        if i > 0:
-            log.debug("Flushed {} log messages.".format(i))
+        if messages:
+            log.debug("Flushed {} log messages.".format(len(messages)))
 
 
 class TOKENS:
@@ -47,7 +53,9 @@ class TOKENS:
     POSTPROCESSING_END = 'POST_END'
     EA_RESTART = 'EA_RST'
     EA_REMOVE_IND = 'RMV_IND'
+    EA_PROMOTE_IND = 'PRM_IND'
     EVALUATION_TIMEOUT = 'EVAL_TO'
+    EVALUATION_OOM = 'EVAL_OOM'
     MUTATION = 'IND_MUT'
     CROSSOVER = "IND_CX"
 
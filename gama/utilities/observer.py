@@ -1,5 +1,6 @@
 import logging
 
+from gama.ea.fitness_table import FitnessTable
 from gama.utilities.generic.paretofront import ParetoFront
 
 log = logging.getLogger(__name__)
@@ -13,7 +14,7 @@ class Observer(object):
 
         self._pareto_callbacks = []
 
-        self._individuals = []
+        self._fitness_table = FitnessTable()
         self._individuals_since_last_pareto_update = 0
 
         self._evaluation_filename = str(id_)+'_evaluations.csv'
@@ -28,7 +29,8 @@ class Observer(object):
 
     def update(self, ind):
         log.debug("Evaluation;{:.4f};{};{}".format(ind.fitness.time, ind.fitness.wvalues, ind))
-        self._individuals.append(ind)
+        # Individuals evaluated again (e.g. promoted by successive halving) keep one row, with their latest fitness.
+        self._fitness_table.update(ind)
         self._record_individual(ind)
 
         updated = self._current_pareto_front.update(ind)
@@ -54,8 +56,7 @@ class Observer(object):
         :return: a list of up to n individuals for which the score on the first criterion is the best.
                 returns less than n individuals if less than n have been evaluated.
         """
-        best_pipelines = sorted(self._individuals, key=lambda x: (-x.fitness.values[0], str(x)))
-        return best_pipelines[:n]
+        return self._fitness_table.best(n, key=str)
 
     def _update_pareto_front(self, ind):
         for callback in self._pareto_callbacks:
@@ -0,0 +1,171 @@
+""" A cache of evaluation results which persists across `fit` calls and processes.
+
+Results are stored in an SQLite database, keyed by a fingerprint of the evaluation setup (data, cross-validation
+splits and metric) together with the pipeline. When the total size of the cached results exceeds the budget,
+the least recently used results are evicted.
+"""
+from collections import namedtuple
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from gama.ea.canonical import canonical_form
+
+log = logging.getLogger(__name__)
+
+CachedEvaluation = namedtuple("CachedEvaluation", ['score', 'time', 'length', 'pipeline', 'predictions'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    fingerprint TEXT NOT NULL,
+    pipeline_key TEXT NOT NULL,
+    score REAL NOT NULL,
+    time REAL NOT NULL,
+    length INTEGER NOT NULL,
+    pipeline BLOB,
+    predictions BLOB,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (fingerprint, pipeline_key)
+)
+"""
+
+
+def _data_bytes(data):
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return pd.util.hash_pandas_object(data).values.tobytes() + str(list(getattr(data, 'dtypes', []))).encode()
+    if isinstance(data, np.ndarray) and data.dtype != object:
+        return np.ascontiguousarray(data).tobytes() + str((data.dtype, data.shape)).encode()
+    return pickle.dumps(data)
+
+
+def dataset_fingerprint(X, y, splits, metric):
+    """ Compute a fingerprint which identifies the setup in which pipelines are evaluated.
+
+    :param X: the data.
+    :param y: the targets.
+    :param splits: list of (train, test) index arrays, the cross-validation splits.
+    :param metric: str, the name of the metric.
+    :return: str, a hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    for data in [X, y] + [indices for split in splits for indices in split]:
+        digest.update(_data_bytes(data))
+    digest.update(metric.encode())
+    return digest.hexdigest()
+
+
+def pipeline_key(pipeline):
+    """ The key under which the evaluation result of `pipeline` is cached, its canonical form. """
+    return canonical_form(pipeline)
+
+
+class PersistentCache(object):
+    """ Stores the evaluation results of pipelines evaluated in a specific setup, identified by a fingerprint.
+
+    The cache may be shared by multiple processes, which may all read and write concurrently.
+    """
+
+    def __init__(self, directory, fingerprint, max_size):
+        """
+        :param directory: str. Directory in which the database is stored, it is created if it does not exist.
+        :param fingerprint: str. Fingerprint of the evaluation setup, see `dataset_fingerprint`.
+        :param max_size: positive integer. The maximum total size in bytes of pipelines and predictions in the cache.
+            Results of all fingerprints count towards this budget.
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be greater than zero.")
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._path = os.path.join(directory, 'evaluations.sqlite')
+        self._fingerprint = fingerprint
+        self._max_size = max_size
+        self._connection = None
+        with self._connect() as connection:
+            connection.execute(_SCHEMA)
+
+    def __getstate__(self):
+        # Connections can not be shared with other processes, each process opens its own connection.
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        return state
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._path, timeout=60)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+        return self._connection
+
+    def get(self, key):
+        """ Return the `CachedEvaluation` stored for the pipeline with `key`, or None if it is not cached.
+
+        None is also returned if the database can not be read, e.g. because it is locked for too long.
+        """
+        try:
+            return self._get(key)
+        except sqlite3.Error:
+            log.warning("Could not read from the persistent cache.", exc_info=True)
+            return None
+
+    def _get(self, key):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT score, time, length, pipeline, predictions FROM evaluations "
+                "WHERE fingerprint = ? AND pipeline_key = ?", (self._fingerprint, key)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE evaluations SET last_used = ? WHERE fingerprint = ? AND pipeline_key = ?",
+                               (time.time(), self._fingerprint, key))
+
+        score, evaluation_time, length, pipeline, predictions = row
+        return CachedEvaluation(score, evaluation_time, length,
+                                pickle.loads(pipeline) if pipeline is not None else None,
+                                pickle.loads(predictions) if predictions is not None else None)
+
+    def put(self, key, score, evaluation_time, length, pipeline=None, predictions=None):
+        """ Store the evaluation result of the pipeline with `key`, evicting old results if needed.
+
+        :param key: str, see `pipeline_key`.
+        :param score: the score of the pipeline.
+        :param evaluation_time: the time it took to evaluate the pipeline.
+        :param length: the number of steps in the pipeline.
+        :param pipeline: the (unfitted) pipeline or None. Required to use the predictions in an ensemble.
+        :param predictions: numpy array with out-of-fold predictions of the pipeline or None.
+        """
+        try:
+            self._put(key, score, evaluation_time, length, pipeline, predictions)
+        except sqlite3.Error:
+            log.warning("Could not write to the persistent cache.", exc_info=True)
+
+    def _put(self, key, score, evaluation_time, length, pipeline, predictions):
+        pipeline = pickle.dumps(pipeline) if pipeline is not None else None
+        predictions = pickle.dumps(np.asarray(predictions)) if predictions is not None else None
+        size = sum(len(blob) for blob in [pipeline, predictions] if blob is not None)
+        if size > self._max_size:
+            return
+
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (self._fingerprint, key, score, evaluation_time, length, pipeline, predictions, size,
+                                time.time()))
+            total_size, = connection.execute("SELECT COALESCE(SUM(size), 0) FROM evaluations").fetchone()
+            if total_size > self._max_size:
+                self._evict(connection, total_size - self._max_size)
+
+    def _evict(self, connection, n_bytes):
+        """ Remove least recently used results until at least `n_bytes` are freed. """
+        freed, to_remove = 0, []
+        for fingerprint, key, size in connection.execute(
+                "SELECT fingerprint, pipeline_key, size FROM evaluations ORDER BY last_used"):
+            if freed >= n_bytes:
+                break
+            to_remove.append((fingerprint, key))
+            freed += size
+        connection.executemany("DELETE FROM evaluations WHERE fingerprint = ? AND pipeline_key = ?", to_remove)
+        log.debug("Evicted {} results ({} bytes) from the persistent cache.".format(len(to_remove), freed))
@@ -9,7 +9,8 @@ requirements = [
     'deap>=1.2',
     'stopit>=1.1.1',
     'liac-arff>=2.2.2',
-    'category-encoders>=1.2.8'
+    'category-encoders>=1.2.8',
+    'threadpoolctl>=1.0.0'
 ]
 
 setup(
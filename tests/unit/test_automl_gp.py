@@ -3,7 +3,7 @@ import unittest
 from deap import gp, creator
 
 from gama.configuration.testconfiguration import clf_config
-from gama.ea.automl_gp import compile_individual, individual_length, eliminate_NSGA
+from gama.ea.automl_gp import compile_individual, individual_length, eliminate_NSGA, eliminate_worst
 from gama import GamaClassifier
 
 
@@ -23,7 +23,7 @@ class AutomlGpTestCase(unittest.TestCase):
     [ ] generate_valid
         If this breaks it's probably not subtle, hard to test edge cases, leave it to system test?
 
-    [ ] eliminate_worst
+    [x] eliminate_worst
     [ ] offspring_mate_and_mutate
     """
     
@@ -65,6 +65,13 @@ class AutomlGpTestCase(unittest.TestCase):
         # LinearSVC
         self.assertEqual(individual_length(self.individual_list[2]), 1)
 
+    def test_compile_individual_n_jobs(self):
+        pipeline = compile_individual(self.individual_list[1], self.gama._pset, n_jobs=3)
+        self.assertEqual(pipeline.steps[-1][1].n_jobs, 3)
+        self.assertNotIn('n_jobs', pipeline.steps[0][1].get_params())
+        pipeline = compile_individual(self.individual_list[1], self.gama._pset)
+        self.assertEqual(pipeline.steps[-1][1].n_jobs, 1)
+
     def test_eliminate_NSGA(self):
         self.individual_list[0].fitness.wvalues = (2, 1)
         self.individual_list[1].fitness.wvalues = (1, 2)
@@ -77,3 +84,14 @@ class AutomlGpTestCase(unittest.TestCase):
         eliminated = eliminate_NSGA(pop=list(reversed(self.individual_list)), n=1)
         self.assertListEqual(eliminated, [self.individual_list[0]],
                              "Individual should be dominated regardless of order.")
+
+    def test_eliminate_worst(self):
+        self.individual_list[0].fitness.wvalues = (2,)
+        self.individual_list[1].fitness.wvalues = (1,)
+        self.individual_list[2].fitness.wvalues = (3,)
+
+        eliminated = eliminate_worst(pop=self.individual_list, n=1)
+        self.assertListEqual(eliminated, [self.individual_list[1]])
+
+        eliminated = eliminate_worst(pop=self.individual_list, n=2)
+        self.assertListEqual(eliminated, [self.individual_list[1], self.individual_list[0]])
@@ -0,0 +1,150 @@
+from datetime import datetime
+import itertools
+import time
+import unittest
+
+from deap import base
+from sklearn.naive_bayes import GaussianNB
+from sklearn.pipeline import Pipeline
+
+from gama.ea.async_ea import async_ea
+from gama.ea.automl_gp import eliminate_worst
+from gama.ea.evaluation import EvaluationResult, FoldResult
+
+
+def async_ea_test_suite():
+    test_cases = [AsyncEATestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class _Fitness(base.Fitness):
+    weights = (1.0,)
+
+
+class _Individual(object):
+    def __init__(self, id_):
+        self.id = id_
+        self.fitness = _Fitness()
+
+    def __str__(self):
+        return 'Individual{}'.format(self.id)
+
+
+def _score(pipeline):
+    return -pipeline.steps[-1][1].var_smoothing
+
+
+def _evaluate(pipeline, logger=None, fold=None):
+    time.sleep(0.01)
+    if fold is not None:
+        return FoldResult(None, datetime.now(), 0.01, None)
+    return EvaluationResult(_score(pipeline), datetime.now(), 0.01, len(pipeline.steps), 1.0)
+
+
+class _InFlightCounter(object):
+    """ Stub toolbox functions which count the individuals that are created but not yet evaluated. """
+
+    def __init__(self):
+        self.ids = itertools.count()
+        self.n_created = 0
+        self.n_evaluated = 0
+        self.n_combined = 0
+        # The number of individuals in flight after each evaluation result, and before each individual is created.
+        self.after_evaluation = []
+        self.before_create = []
+
+    def individual(self):
+        self.n_created += 1
+        return _Individual(next(self.ids))
+
+    def create(self, population, n):
+        self.before_create.append(self.n_created - self.n_evaluated)
+        return [self.individual() for _ in range(n)]
+
+    def combine_folds(self, pipeline, fold_results, subsample=None):
+        self.n_combined += 1
+        start_datetime = min(result.start_datetime for result in fold_results)
+        evaluation_time = sum(result.time for result in fold_results)
+        return EvaluationResult(_score(pipeline), start_datetime, evaluation_time, len(pipeline.steps), 1.0)
+
+    def evaluated(self, individual):
+        self.n_evaluated += 1
+        self.after_evaluation.append(self.n_created - self.n_evaluated)
+
+
+class AsyncEATestCase(unittest.TestCase):
+    """ Unit Tests for ea/async_ea.py """
+
+    def _run_async_ea(self, n_jobs, prefetch, **kwargs):
+        """ Run `async_ea` with a stub toolbox, and return the number of individuals in flight over time. """
+        counter = _InFlightCounter()
+        toolbox = base.Toolbox()
+        # Individuals compile to distinct pipelines, so that none are skipped as duplicates.
+        toolbox.register('compile', lambda ind: Pipeline([('nb', GaussianNB(var_smoothing=1e-9 * (ind.id + 1)))]))
+        toolbox.register('create', counter.create)
+        toolbox.register('evaluate', _evaluate)
+        toolbox.register('combine_folds', counter.combine_folds)
+        toolbox.register('eliminate', eliminate_worst)
+
+        start_population = [counter.individual() for _ in range(2)]
+        async_ea(['accuracy'], start_population, toolbox, evaluation_callback=counter.evaluated,
+                 max_n_evaluations=20, max_time_seconds=60, n_jobs=n_jobs, prefetch=prefetch, **kwargs)
+        self.assertEqual(counter.n_evaluated, 20)
+        return counter
+
+    def _assert_in_flight(self, counter, max_in_flight):
+        # New individuals are created once the start population of two individuals is evaluated. From then on, new
+        # individuals are created until `max_in_flight` are in flight, so each result leaves one less in flight.
+        self.assertTrue(all(n < max_in_flight for n in counter.before_create))
+        self.assertListEqual(counter.after_evaluation[2:], [max_in_flight - 1] * 18)
+
+    def test_async_ea_in_flight(self):
+        """ Test that `n_jobs + prefetch` individuals are waiting for or in evaluation. """
+        self._assert_in_flight(self._run_async_ea(n_jobs=2, prefetch=3), max_in_flight=5)
+        self._assert_in_flight(self._run_async_ea(n_jobs=2, prefetch=0), max_in_flight=2)
+        self._assert_in_flight(self._run_async_ea(n_jobs=2, prefetch=None), max_in_flight=4)
+
+    def test_async_ea_in_flight_split_folds(self):
+        """ Test that an individual evaluated fold by fold is counted once. """
+        counter = self._run_async_ea(n_jobs=3, prefetch=1, split_folds=3)
+        self.assertGreater(counter.n_combined, 0)
+        self._assert_in_flight(counter, max_in_flight=4)
+
+    def test_async_ea_in_flight_cached_evaluation(self):
+        """ Test that individuals with a cached result are counted until their result is processed. """
+        cached = []
+
+        def cached_evaluation(pipeline):
+            if pipeline.steps[-1][1].var_smoothing < 1e-8:
+                return None
+            cached.append(pipeline)
+            return EvaluationResult(_score(pipeline), datetime.now(), 0.0, len(pipeline.steps), 1.0)
+
+        counter = self._run_async_ea(n_jobs=2, prefetch=2, cached_evaluation=cached_evaluation)
+        self.assertGreater(len(cached), 0)
+        self._assert_in_flight(counter, max_in_flight=4)
+
+    def test_async_ea_fold_racing(self):
+        """ Test that racing starts once the population is full, and raced individuals do not enter it. """
+        counter = _InFlightCounter()
+        race_thresholds = []
+
+        def evaluate(pipeline, logger=None, race_threshold=None):
+            race_thresholds.append(race_threshold)
+            # Each new individual scores worse than all before it, so it is always stopped early once racing.
+            fidelity = 0.4 if race_threshold is not None and _score(pipeline) < race_threshold else 1.0
+            return EvaluationResult(_score(pipeline), datetime.now(), 0.01, len(pipeline.steps), fidelity)
+
+        toolbox = base.Toolbox()
+        toolbox.register('compile', lambda ind: Pipeline([('nb', GaussianNB(var_smoothing=1e-9 * (ind.id + 1)))]))
+        toolbox.register('create', counter.create)
+        toolbox.register('evaluate', evaluate)
+        toolbox.register('eliminate', eliminate_worst)
+
+        start_population = [counter.individual() for _ in range(2)]
+        population = async_ea(['accuracy'], start_population, toolbox, evaluation_callback=counter.evaluated,
+                              max_n_evaluations=10, max_time_seconds=60, n_jobs=1, fold_racing=True)
+        self.assertListEqual(race_thresholds[:2], [None, None])
+        # The threshold is the score of the worst individual in the full population.
+        self.assertListEqual(race_thresholds[2:], [_score(toolbox.compile(start_population[1]))] * 8)
+        self.assertListEqual(sorted(ind.id for ind in population), [0, 1])
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+from sklearn.feature_selection import SelectPercentile, f_classif
+from sklearn.kernel_approximation import Nystroem
+from sklearn.decomposition import PCA
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler, Binarizer
+from sklearn.svm import LinearSVC
+
+from gama.ea.canonical import canonical_form
+
+
+def canonical_test_suite():
+    test_cases = [CanonicalFormTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class CanonicalFormTestCase(unittest.TestCase):
+    """ Unit Tests for ea/canonical.py """
+
+    def test_canonical_form_ignores_step_names_and_parameter_order(self):
+        pipeline1 = Pipeline([('StandardScaler0', StandardScaler()), ('GaussianNB0', GaussianNB())])
+        pipeline2 = Pipeline([('a', StandardScaler(with_std=True, with_mean=True)), ('b', GaussianNB())])
+        self.assertEqual(canonical_form(pipeline1), canonical_form(pipeline2))
+
+    def test_canonical_form_ignored_hyperparameters(self):
+        """ Test that hyperparameters which are ignored given the other hyperparameters are not part of the form. """
+        self.assertNotEqual(canonical_form(Pipeline([('svc', LinearSVC(penalty='l2', dual=False))])),
+                            canonical_form(Pipeline([('svc', LinearSVC(penalty='l2', dual=True))])))
+        self.assertEqual(canonical_form(Pipeline([('ny', Nystroem(kernel='linear', gamma=0.1)), ('nb', GaussianNB())])),
+                         canonical_form(Pipeline([('ny', Nystroem(kernel='linear', gamma=0.5)), ('nb', GaussianNB())])))
+        self.assertNotEqual(canonical_form(Pipeline([('ny', Nystroem(kernel='rbf', gamma=0.1)), ('nb', GaussianNB())])),
+                            canonical_form(Pipeline([('ny', Nystroem(kernel='rbf', gamma=0.5)), ('nb', GaussianNB())])))
+
+    def test_ignored_hyperparameters_do_not_change_predictions(self):
+        """ Test that pipelines which only differ in ignored hyperparameters make the same predictions. """
+        random_state = np.random.RandomState(0)
+        X = random_state.normal(size=(60, 4))
+        y = (X[:, 0] + X[:, 1] > 0).astype(int)
+        equivalent_pipelines = [
+            (Pipeline([('knn', KNeighborsClassifier(metric='manhattan', p=1))]),
+             Pipeline([('knn', KNeighborsClassifier(metric='manhattan', p=2))])),
+            (Pipeline([('ny', Nystroem(kernel='linear', gamma=0.1, random_state=0)), ('nb', GaussianNB())]),
+             Pipeline([('ny', Nystroem(kernel='linear', gamma=0.5, random_state=0)), ('nb', GaussianNB())])),
+            (Pipeline([('pca', PCA(svd_solver='full', iterated_power=1)), ('nb', GaussianNB())]),
+             Pipeline([('pca', PCA(svd_solver='full', iterated_power=5)), ('nb', GaussianNB())])),
+        ]
+        for pipeline1, pipeline2 in equivalent_pipelines:
+            self.assertEqual(canonical_form(pipeline1), canonical_form(pipeline2))
+            np.testing.assert_array_equal(pipeline1.fit(X, y).predict_proba(X), pipeline2.fit(X, y).predict_proba(X))
+
+    def test_canonical_form_collapses_idempotent_transformers(self):
+        """ Test that consecutive identical idempotent transformers are collapsed, but other transformers are not. """
+        single = Pipeline([('scale', StandardScaler()), ('nb', GaussianNB())])
+        double = Pipeline([('scale0', StandardScaler()), ('scale1', StandardScaler()), ('nb', GaussianNB())])
+        self.assertEqual(canonical_form(single), canonical_form(double))
+
+        different = Pipeline([('scale0', StandardScaler(with_mean=False)), ('scale1', StandardScaler()),
+                              ('nb', GaussianNB())])
+        self.assertNotEqual(canonical_form(single), canonical_form(different))
+
+        single = Pipeline([('binarize', Binarizer(threshold=1.0)), ('nb', GaussianNB())])
+        double = Pipeline([('binarize0', Binarizer(threshold=1.0)), ('binarize1', Binarizer(threshold=1.0)),
+                           ('nb', GaussianNB())])
+        self.assertNotEqual(canonical_form(single), canonical_form(double))
+
+    def test_canonical_form_functions(self):
+        """ Test that functions are represented by name, not by their (process-specific) memory address. """
+        pipeline = Pipeline([('select', SelectPercentile(f_classif, percentile=10)), ('nb', GaussianNB())])
+        self.assertIn('sklearn.feature_selection', canonical_form(pipeline))
+        self.assertNotIn(' at 0x', canonical_form(pipeline))
@@ -0,0 +1,51 @@
+import unittest
+
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from gama.ea.cost_model import CostModel, pipeline_features
+
+
+def cost_model_test_suite():
+    test_cases = [CostModelTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+def _knn(n_neighbors):
+    return Pipeline([('scaler', StandardScaler()), ('knn', KNeighborsClassifier(n_neighbors=n_neighbors))])
+
+
+def _tree(max_depth):
+    return Pipeline([('tree', DecisionTreeClassifier(max_depth=max_depth))])
+
+
+class CostModelTestCase(unittest.TestCase):
+    """ Unit Tests for ea/cost_model.py """
+
+    def test_pipeline_features(self):
+        features = pipeline_features(_knn(5), n_samples=100, n_features=10)
+        self.assertEqual(features['StandardScaler'], 1)
+        self.assertIn('KNeighborsClassifier.n_neighbors', features)
+        self.assertIn('KNeighborsClassifier.weights=uniform', features)
+        self.assertNotIn('DecisionTreeClassifier', features)
+
+    def test_predict_requires_observations(self):
+        model = CostModel(min_observations=5)
+        model.set_data_shape(100, 10)
+        for _ in range(4):
+            model.observe(_tree(3), 0.1)
+        self.assertIsNone(model.predict(_tree(3)))
+        model.observe(_tree(3), 0.1)
+        self.assertAlmostEqual(model.predict(_tree(3)), 0.1, delta=0.02)
+
+    def test_predictions_order_pipelines(self):
+        model = CostModel(min_observations=10, alpha=0.01)
+        model.set_data_shape(100, 10)
+        for i in range(10):
+            model.observe(_knn(i + 1), 10.0)
+            model.observe(_tree(i + 1), 0.1)
+        self.assertGreater(model.predict(_knn(3)), 5 * model.predict(_tree(3)))
+        self.assertGreater(model.predict(_tree(3)), model.predict(_tree(3), fidelity=0.1),
+                           "Less data should not take longer to evaluate.")
@@ -0,0 +1,141 @@
+import tempfile
+import unittest
+
+import numpy as np
+from sklearn.naive_bayes import BernoulliNB, GaussianNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from gama.ea.evaluation import (evaluate_pipeline, combine_fold_results, cross_val_predict_score, fit_predict_fold,
+                                optimistic_score, PrefixCache)
+from gama.ea.folds import Folds
+from gama.utilities.evaluation_store import EvaluationStore
+from gama.utilities.logging_utilities import TOKENS
+from gama.utilities.persistent_cache import PersistentCache, pipeline_key
+
+
+def evaluation_test_suite():
+    test_cases = [EvaluationTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class FailingClassifier(GaussianNB):
+    def fit(self, X, y, sample_weight=None):
+        raise ValueError("Always fails.")
+
+
+class EvaluationTestCase(unittest.TestCase):
+    """ Unit Tests for ea/evaluation.py """
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.X = random_state.normal(size=(100, 3))
+        self.y = (self.X[:, 0] > 0).astype(int)
+        self.folds = Folds(self.X, self.y, self.y, cv=5)
+        self.pipeline = Pipeline([('scaler', StandardScaler()), ('nb', GaussianNB())])
+
+    def test_combined_fold_results_equal_whole_evaluation(self):
+        whole = evaluate_pipeline(self.pipeline, self.folds, timeout=60)
+        fold_results = [evaluate_pipeline(self.pipeline, self.folds, timeout=60, fold=i)
+                        for i in range(len(self.folds))]
+        self.assertTrue(all(result.error is None for result in fold_results))
+
+        combined = combine_fold_results(self.pipeline, fold_results, self.folds)
+        self.assertEqual(whole.score, combined.score)
+        self.assertEqual(whole.length, combined.length)
+        self.assertEqual(combined.fidelity, 1.0)
+        self.assertAlmostEqual(combined.time, sum(result.time for result in fold_results))
+
+    def test_failed_fold_fails_evaluation(self):
+        pipeline = Pipeline([('scaler', StandardScaler()), ('nb', FailingClassifier())])
+        fold_result = evaluate_pipeline(pipeline, self.folds, timeout=60, fold=0)
+        self.assertIsNone(fold_result.predictions)
+        self.assertEqual(fold_result.error, TOKENS.EVALUATION_ERROR)
+
+        fold_results = [evaluate_pipeline(self.pipeline, self.folds, timeout=60, fold=i)
+                        for i in range(1, len(self.folds))]
+        combined = combine_fold_results(self.pipeline, [fold_result] + fold_results, self.folds)
+        self.assertEqual(combined.score, -float('inf'))
+
+    def test_only_evaluations_on_all_data_are_stored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = EvaluationStore(directory)
+            evaluate_pipeline(self.pipeline, self.folds, timeout=60, evaluation_store=store, subsample=0.5)
+            fold_results = [evaluate_pipeline(self.pipeline, self.folds, timeout=60, fold=i, subsample=0.5)
+                            for i in range(len(self.folds))]
+            combine_fold_results(self.pipeline, fold_results, self.folds, subsample=0.5, evaluation_store=store)
+            self.assertEqual(len(store.load_models()), 0)
+
+            evaluate_pipeline(self.pipeline, self.folds, timeout=60, evaluation_store=store)
+            fold_results = [evaluate_pipeline(self.pipeline, self.folds, timeout=60, fold=i)
+                            for i in range(len(self.folds))]
+            combine_fold_results(self.pipeline, fold_results, self.folds, evaluation_store=store)
+            self.assertEqual(len(store.load_models()), 2)
+
+    def test_fit_predict_fold_with_prefix_cache(self):
+        """ Predictions with a prefix cache equal those without, and a shared prefix is only fit once. """
+        prefix_cache = PrefixCache(max_memory=1e8)
+        other_pipeline = Pipeline([('scaler', StandardScaler()), ('nb', BernoulliNB())])
+        X_train, y_train, X_test, _, _ = self.folds.fold(0)
+        for pipeline in [self.pipeline, other_pipeline]:
+            expected = fit_predict_fold(pipeline, X_train, y_train, X_test, method='predict_proba')
+            actual = fit_predict_fold(pipeline, X_train, y_train, X_test, method='predict_proba',
+                                      fold_key=(0, None), prefix_cache=prefix_cache)
+            np.testing.assert_array_equal(expected, actual)
+        self.assertEqual(prefix_cache.misses, 1)
+        self.assertEqual(prefix_cache.hits, 1)
+
+    def test_cross_val_predict_score_with_prefix_cache(self):
+        prefix_cache = PrefixCache(max_memory=1e8)
+        other_pipeline = Pipeline([('scaler', StandardScaler()), ('nb', BernoulliNB())])
+        for pipeline in [self.pipeline, other_pipeline]:
+            expected_predictions, expected_score, _ = cross_val_predict_score(pipeline, self.folds, 'accuracy')
+            predictions, score, _ = cross_val_predict_score(pipeline, self.folds, 'accuracy',
+                                                            prefix_cache=prefix_cache)
+            np.testing.assert_array_equal(expected_predictions, predictions)
+            self.assertEqual(expected_score, score)
+        # The scaler is fit once per fold, and reused for the second pipeline.
+        self.assertEqual(prefix_cache.misses, len(self.folds))
+        self.assertEqual(prefix_cache.hits, len(self.folds))
+
+    def test_optimistic_score(self):
+        """ Test that the optimistic score is the mean fold score plus two standard errors. """
+        self.assertAlmostEqual(optimistic_score([0.5, 0.7]), 0.6 + 2 * 0.1)
+        self.assertAlmostEqual(optimistic_score([0.6, 0.6, 0.6]), 0.6)
+        # The sample standard deviation of these scores is sqrt(1/15), the standard error half of that.
+        self.assertAlmostEqual(optimistic_score([0.2, 0.4, 0.6, 0.8]), 0.5 + np.sqrt(1 / 15))
+
+    def test_race_stops_below_threshold(self):
+        """ Test that evaluation stops after two folds if the pipeline can not reach the threshold. """
+        predictions, score, fraction = cross_val_predict_score(self.pipeline, self.folds, 'accuracy',
+                                                               race_threshold=2.0)
+        self.assertIsNone(predictions)
+        self.assertEqual(fraction, 2 / len(self.folds))
+        self.assertTrue(0 <= score <= 1)
+
+    def test_race_continues_above_threshold(self):
+        """ Test that all folds are evaluated if the pipeline can still reach the threshold. """
+        expected_predictions, expected_score, _ = cross_val_predict_score(self.pipeline, self.folds, 'accuracy')
+        for race_threshold in [None, 0.0, expected_score]:
+            predictions, score, fraction = cross_val_predict_score(self.pipeline, self.folds, 'accuracy',
+                                                                   race_threshold=race_threshold)
+            self.assertEqual(fraction, 1.0)
+            self.assertEqual(score, expected_score)
+            np.testing.assert_array_equal(predictions, expected_predictions)
+
+    def test_raced_evaluation_is_not_stored(self):
+        """ Test that an evaluation stopped by racing is not written to the evaluation store or persistent cache. """
+        with tempfile.TemporaryDirectory() as directory:
+            store = EvaluationStore(directory)
+            persistent_cache = PersistentCache(directory, 'fingerprint', max_size=2**20)
+            result = evaluate_pipeline(self.pipeline, self.folds, timeout=60, evaluation_store=store,
+                                       race_threshold=2.0, persistent_cache=persistent_cache)
+            self.assertEqual(result.fidelity, 2 / len(self.folds))
+            self.assertEqual(len(store.load_models()), 0)
+            self.assertIsNone(persistent_cache.get(pipeline_key(self.pipeline)))
+
+            result = evaluate_pipeline(self.pipeline, self.folds, timeout=60, evaluation_store=store,
+                                       race_threshold=0.0, persistent_cache=persistent_cache)
+            self.assertEqual(result.fidelity, 1.0)
+            self.assertEqual(len(store.load_models()), 1)
+            self.assertEqual(persistent_cache.get(pipeline_key(self.pipeline)).score, result.score)
@@ -0,0 +1,94 @@
+import random
+import unittest
+
+import numpy as np
+from deap import base
+
+from gama.ea.automl_gp import eliminate_worst
+from gama.ea.fitness_table import FitnessTable
+
+
+def fitness_table_test_suite():
+    test_cases = [FitnessTableTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class _Fitness(base.Fitness):
+    weights = (1.0, -1.0)
+
+
+class _Individual(object):
+    def __init__(self, values, time=1.0):
+        self.fitness = _Fitness(values)
+        self.fitness.time = time
+
+
+def _random_individual():
+    return _Individual((random.random(), random.randint(1, 5)), time=random.random())
+
+
+class FitnessTableTestCase(unittest.TestCase):
+    """ Unit Tests for ea/fitness_table.py """
+
+    def test_rows_after_adding_and_removing(self):
+        random.seed(0)
+        population = [_random_individual() for _ in range(50)]
+        table = FitnessTable(population, capacity=4)
+
+        for _ in range(200):
+            if random.random() < 0.5:
+                individual = random.choice(population)
+                population.remove(individual)
+                table.remove(individual)
+            else:
+                individual = _random_individual()
+                population.append(individual)
+                table.add(individual)
+            self.assertEqual(len(table), len(population))
+            for individual, wvalues, time in zip(table.individuals, table.wvalues, table.times):
+                self.assertIn(individual, population)
+                self.assertListEqual(list(wvalues), list(individual.fitness.wvalues))
+                self.assertEqual(time, individual.fitness.time)
+
+    def test_worst_equals_eliminate_worst(self):
+        random.seed(0)
+        population = [_random_individual() for _ in range(30)]
+        table = FitnessTable(population)
+        for n in [1, 5, 30, 40]:
+            self.assertListEqual(table.worst(n), eliminate_worst(population, n))
+
+    def test_best(self):
+        individuals = [_Individual((0.5, 1)), _Individual((0.8, 2)), _Individual((0.5, 3)), _Individual((0.1, 1))]
+        table = FitnessTable(individuals)
+        self.assertListEqual(table.best(1), [individuals[1]])
+        self.assertListEqual(table.best(2, key=lambda ind: -ind.fitness.values[1]), individuals[1:3])
+        best_three = table.best(3, key=lambda ind: ind.fitness.values[1])
+        self.assertListEqual(best_three, [individuals[1], individuals[0], individuals[2]])
+        self.assertEqual(len(table.best(10)), 4)
+        self.assertListEqual(FitnessTable().best(3), [])
+
+    def test_update(self):
+        individuals = [_Individual((0.5, 2)), _Individual((0.6, 3))]
+        table = FitnessTable(individuals)
+        individuals[0].fitness.values = (0.7, 4)
+        table.update(individuals[0])
+        self.assertListEqual(table.best(2), individuals)
+        np.testing.assert_array_equal(table.min_wvalues(), [0.6, -4])
+
+    def test_tournament(self):
+        random.seed(0)
+        table = FitnessTable([_random_individual() for _ in range(20)])
+        selected = table.tournament(100, tournsize=60, random_state=np.random.RandomState(0))
+        self.assertEqual(len(selected), 100)
+        # With tournaments much larger than the table, the best individual takes part in, and wins, most of them.
+        self.assertGreater(selected.count(table.best(1)[0]), 80)
+
+    def test_number_of_objectives_must_match(self):
+        class ThreeObjectives(base.Fitness):
+            weights = (1.0, 1.0, 1.0)
+
+        table = FitnessTable([_Individual((0.5, 2))])
+        individual = _Individual((1, 2))
+        individual.fitness = ThreeObjectives((1, 2, 3))
+        with self.assertRaises(ValueError):
+            table.add(individual)
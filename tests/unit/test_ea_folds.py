@@ -0,0 +1,94 @@
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from gama.ea.folds import Folds, subsample_indices
+
+
+def folds_test_suite():
+    test_cases = [FoldsTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class FoldsTestCase(unittest.TestCase):
+    """ Unit Tests for ea/folds.py """
+
+    def setUp(self):
+        self.X = np.arange(200).reshape(100, 2).astype(float)
+        self.y = np.asarray([0] * 80 + [1] * 20)
+
+    def test_folds_partition_data(self):
+        folds = Folds(self.X, self.y, self.y, cv=5)
+        self.assertEqual(len(folds), 5)
+        all_test = np.sort(np.concatenate([folds.fold(i)[4] for i in range(len(folds))]))
+        np.testing.assert_array_equal(all_test, np.arange(100))
+
+        for i in range(len(folds)):
+            X_train, y_train, X_test, y_score_test, test = folds.fold(i)
+            self.assertTrue(X_train.flags['C_CONTIGUOUS'])
+            np.testing.assert_array_equal(X_test, self.X[test])
+            np.testing.assert_array_equal(y_score_test, self.y[test])
+            self.assertEqual(len(X_train) + len(X_test), 100)
+            self.assertEqual(sum(y_train), 16, "Folds should be stratified.")
+
+    def test_folds_subsample(self):
+        folds = Folds(self.X, self.y, self.y, cv=5)
+        X_train, y_train, X_test, _, test = folds.fold(0, subsample=0.25)
+        self.assertEqual(len(y_train), 20)
+        self.assertEqual(sum(y_train), 4, "Subsample should be stratified.")
+        self.assertEqual(len(X_test), 20, "Validation data should not be subsampled.")
+
+        X_train_again, *_ = folds.fold(0, subsample=0.25)
+        np.testing.assert_array_equal(X_train, X_train_again, "Subsamples should be reproducible.")
+
+    def test_folds_holdout(self):
+        folds = Folds(self.X, self.y, self.y, cv=0.2)
+        self.assertEqual(len(folds), 1)
+        X_train, y_train, X_test, y_score_test, test = folds.fold(0)
+        self.assertEqual(len(X_test), 20)
+        self.assertEqual(sum(y_score_test), 4, "Holdout should be stratified.")
+        np.testing.assert_array_equal(folds.validation_indices, np.sort(test))
+
+        folds = Folds(self.X, self.y, self.y, cv=0.2, repeats=3)
+        self.assertEqual(len(folds), 3)
+        all_test = np.unique(np.concatenate([folds.fold(i)[4] for i in range(len(folds))]))
+        np.testing.assert_array_equal(folds.validation_indices, all_test)
+
+        with self.assertRaises(ValueError):
+            Folds(self.X, self.y, self.y, cv=5, repeats=3)
+
+    def test_folds_random_state(self):
+        """ Test that holdout splits and subsamples are reproducible for a random state, and differ between them. """
+        folds = Folds(self.X, self.y, self.y, cv=0.2, random_state=1)
+        same_seed = Folds(self.X, self.y, self.y, cv=0.2, random_state=1)
+        other_seed = Folds(self.X, self.y, self.y, cv=0.2, random_state=2)
+        np.testing.assert_array_equal(folds.validation_indices, same_seed.validation_indices)
+        self.assertFalse(np.array_equal(folds.validation_indices, other_seed.validation_indices))
+        np.testing.assert_array_equal(folds.fold(0, subsample=0.5)[0], same_seed.fold(0, subsample=0.5)[0])
+
+        folds = Folds(self.X, self.y, self.y, cv=5, random_state=1)
+        other_seed = Folds(self.X, self.y, self.y, cv=5, random_state=2)
+        self.assertFalse(np.array_equal(folds.fold(0, subsample=0.5)[0], other_seed.fold(0, subsample=0.5)[0]))
+
+    def test_folds_memmapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            folds = Folds(self.X, self.y, self.y, cv=5, directory=directory)
+            folds_copy = pickle.loads(pickle.dumps(folds))
+            in_memory_folds = Folds(self.X, self.y, self.y, cv=5)
+            self.assertLess(len(pickle.dumps(folds)), len(pickle.dumps(in_memory_folds)) - self.X.nbytes,
+                            "Pickled folds should not contain the data.")
+            for i in range(len(folds)):
+                X_train, y_train, X_test, y_score_test, test = folds_copy.fold(i)
+                self.assertIsInstance(X_train, np.memmap)
+                np.testing.assert_array_equal(X_test, self.X[test])
+                np.testing.assert_array_equal(y_score_test, self.y[test])
+            np.testing.assert_array_equal(folds_copy.y_score, self.y)
+
+    def test_subsample_indices_keeps_each_class(self):
+        indices = np.arange(10)
+        y = np.asarray([0] * 9 + [1])
+        selected = subsample_indices(indices, y, 0.1, stratify=True, random_state=0)
+        self.assertIn(9, selected)
+        self.assertEqual(len(selected), 2)
@@ -0,0 +1,110 @@
+import random
+import unittest
+
+from deap import base, tools
+
+from gama.ea.automl_gp import eliminate_NSGA
+from gama.ea.nondominated import ParetoRanking
+
+
+def nondominated_test_suite():
+    test_cases = [ParetoRankingTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class _Fitness(base.Fitness):
+    weights = (1.0, -1.0)
+
+
+class _Individual(object):
+    def __init__(self, values):
+        self.fitness = _Fitness(values)
+
+
+def _random_individual():
+    return _Individual((random.random(), random.random() * 10))
+
+
+class ParetoRankingTestCase(unittest.TestCase):
+    """ Unit Tests for ea/nondominated.py """
+
+    def assertSameFronts(self, ranking, population):
+        expected = tools.sortNondominated(population, k=len(population))
+        self.assertEqual([sorted(map(id, front)) for front in ranking.fronts],
+                         [sorted(map(id, front)) for front in expected])
+
+    def test_fronts_after_adding_and_removing(self):
+        random.seed(0)
+        population = [_random_individual() for _ in range(50)]
+        ranking = ParetoRanking(population)
+        self.assertSameFronts(ranking, population)
+
+        for _ in range(100):
+            if random.random() < 0.5:
+                individual = random.choice(population)
+                population.remove(individual)
+                ranking.remove(individual)
+            else:
+                individual = _random_individual()
+                population.append(individual)
+                ranking.add(individual)
+            self.assertSameFronts(ranking, population)
+        self.assertEqual(len(ranking), len(population))
+
+    def test_worst_equals_eliminate_NSGA(self):
+        random.seed(0)
+        population = [_random_individual() for _ in range(30)]
+        ranking = ParetoRanking(population)
+        for _ in range(100):
+            individual = _random_individual()
+            population.append(individual)
+            ranking.add(individual)
+            to_remove = ranking.worst(1)[0]
+            self.assertIs(to_remove, eliminate_NSGA(population, 1)[0])
+            population.remove(to_remove)
+            ranking.remove(to_remove)
+
+    def test_worst_equals_eliminate_NSGA_with_ties(self):
+        """ Test that ties in crowding distance, e.g. between duplicate fitness values, are broken as by deap. """
+        random.seed(0)
+        for _ in range(20):
+            # Few distinct values, so that many individuals share a value or have exactly the same fitness.
+            population = [_Individual((random.randint(0, 4) / 4, random.randint(1, 4))) for _ in range(30)]
+            ranking = ParetoRanking(population)
+            for _ in range(30):
+                individual = _Individual((random.randint(0, 4) / 4, random.randint(1, 4)))
+                population.append(individual)
+                ranking.add(individual)
+                for n in [1, 3, len(population)]:
+                    self.assertListEqual(list(map(id, ranking.worst(n))),
+                                         list(map(id, eliminate_NSGA(population, n))))
+                to_remove = ranking.worst(1)[0]
+                population.remove(to_remove)
+                ranking.remove(to_remove)
+
+    def test_worst_after_update_keeps_population_order(self):
+        random.seed(1)
+        population = [_Individual((random.randint(0, 4) / 4, random.randint(1, 4))) for _ in range(30)]
+        ranking = ParetoRanking(population)
+        for individual in random.sample(population, 10):
+            individual.fitness.values = (random.randint(0, 4) / 4, random.randint(1, 4))
+            ranking.update(individual)
+        self.assertListEqual(list(map(id, ranking.worst(len(population)))),
+                             list(map(id, eliminate_NSGA(population, len(population)))))
+
+    def test_update(self):
+        individuals = [_Individual((0.5, 2)), _Individual((0.6, 3))]
+        ranking = ParetoRanking(individuals)
+        self.assertEqual(ranking.fronts, [individuals])
+        individuals[0].fitness.values = (0.4, 4)
+        ranking.update(individuals[0])
+        self.assertEqual(ranking.fronts, [[individuals[1]], [individuals[0]]])
+
+    def test_only_two_objectives(self):
+        class ThreeObjectives(base.Fitness):
+            weights = (1.0, 1.0, 1.0)
+
+        individual = _Individual((1, 2))
+        individual.fitness = ThreeObjectives((1, 2, 3))
+        with self.assertRaises(ValueError):
+            ParetoRanking([individual])
@@ -0,0 +1,52 @@
+import types
+import unittest
+
+from gama.ea.successive_halving import SuccessiveHalving
+
+
+def successive_halving_test_suite():
+    test_cases = [SuccessiveHalvingTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+def _individual(score):
+    """ Creates a minimal object which has the fitness attributes used by SuccessiveHalving. """
+    return types.SimpleNamespace(fitness=types.SimpleNamespace(wvalues=(score,)))
+
+
+class SuccessiveHalvingTestCase(unittest.TestCase):
+    """ Unit Tests for ea/successive_halving.py """
+
+    def test_fidelities(self):
+        fidelities = SuccessiveHalving(0.1, 3).fidelities
+        self.assertListEqual([round(fidelity, 4) for fidelity in fidelities], [0.1, 0.3, 0.9, 1.0])
+        self.assertListEqual(SuccessiveHalving(1.0, 3).fidelities, [1.0])
+        self.assertRaises(ValueError, SuccessiveHalving, 0, 3)
+        self.assertRaises(ValueError, SuccessiveHalving, 0.1, 1)
+
+    def test_next_promotion(self):
+        sh = SuccessiveHalving(0.25, 2)
+        individuals = [_individual(score) for score in [0.3, 0.9, 0.5, 0.7]]
+
+        sh.record(individuals[0], 0)
+        self.assertEqual(sh.next_promotion(), (None, None), "Too few evaluations on rung 0 to promote.")
+        sh.record(individuals[1], 0)
+        self.assertEqual(sh.next_promotion(), (individuals[1], 1))
+        self.assertEqual(sh.next_promotion(), (None, None), "An individual should be promoted only once.")
+
+        sh.record(individuals[2], 0)
+        sh.record(individuals[3], 0)
+        self.assertEqual(sh.next_promotion(), (individuals[3], 1))
+
+        sh.record(individuals[1], 1)
+        sh.record(individuals[3], 1)
+        self.assertEqual(sh.next_promotion(), (individuals[1], 2), "Higher rungs should be promoted from first.")
+
+        sh.clear()
+        self.assertEqual(sh.next_promotion(), (None, None))
+
+    def test_failed_evaluations_are_not_promoted(self):
+        sh = SuccessiveHalving(0.5, 2)
+        sh.record(_individual(-float('inf')), 0)
+        sh.record(_individual(-float('inf')), 0)
+        self.assertEqual(sh.next_promotion(), (None, None))
@@ -1,4 +1,3 @@
-import importlib
 import unittest
 
 import gama
@@ -22,10 +21,19 @@ class GamaUnitTestCase(unittest.TestCase):
         g1 = gama.GamaClassifier(random_state=1)
         pop1 = g1._toolbox.population(n=10)
 
-        #  For now, operations contains a variable which caches created individuals.
-        importlib.reload(gama.ea.operations)
-
+        # Each instance keeps track of its own created individuals, so g2 may create the same individuals as g1.
         g2 = gama.GamaClassifier(random_state=1)
         pop2 = g2._toolbox.population(n=10)
         for ind1, ind2 in zip(pop1, pop2):
             self.assertEqual(str(ind1), str(ind2), "The initial population should be reproducible.")
+
+    def test_preprocess_arff_keeps_compile_arguments(self):
+        """ Test that compiling with ARFF preprocessing still checks parameters and sets estimator `n_jobs`. """
+        g = gama.GamaClassifier(random_state=1, n_jobs=2, set_estimator_n_jobs=True, keep_analysis_log=False)
+        keywords = dict(g._toolbox.compile.keywords)
+        g._preprocess_arff('tests/data/breast_cancer_train.arff')
+        arff_keywords = g._toolbox.compile.keywords
+        self.assertIn('preprocessing_steps', arff_keywords)
+        for keyword in ['pset', 'parameter_checks', 'n_jobs']:
+            self.assertIs(arff_keywords[keyword], keywords[keyword])
+        self.assertIsNotNone(arff_keywords['n_jobs'])
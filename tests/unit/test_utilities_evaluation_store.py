@@ -0,0 +1,92 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.naive_bayes import GaussianNB
+from sklearn.preprocessing import StandardScaler
+
+from gama.utilities.evaluation_store import EvaluationStore
+
+
+def evaluation_store_test_suite():
+    test_cases = [EvaluationStoreUnitTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class EvaluationStoreUnitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.store = EvaluationStore(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_evaluation_store_append_load(self):
+        """ Test that stored results are loaded with memory-mapped predictions of the right shape and type. """
+        pipelines = [Pipeline([('nb', GaussianNB())]), Pipeline([('scale', StandardScaler()), ('nb', GaussianNB())])]
+        predictions = [np.random.rand(10, 3), np.arange(10)]
+        for score, (pipeline, prediction) in enumerate(zip(pipelines, predictions)):
+            self.store.append(pipeline, prediction, score)
+
+        models = sorted(self.store.load_models(), key=lambda m: m.validation_score)
+        self.assertEqual(len(models), 2)
+        for model, pipeline, prediction in zip(models, pipelines, predictions):
+            self.assertIsInstance(model.predictions, np.memmap)
+            self.assertEqual(model.predictions.dtype, prediction.dtype)
+            np.testing.assert_array_equal(model.predictions, prediction)
+            self.assertEqual(model.name, str(pipeline).replace('\n', ''))
+            self.assertEqual(str(model.pipeline), str(pipeline))
+            self.assertIs(model.pipeline, model.pipeline, "The pipeline should only be unpickled once.")
+
+    def test_evaluation_store_ignores_incomplete_results(self):
+        """ Test that a result whose index line is not completely written is not loaded. """
+        self.store.append(Pipeline([('nb', GaussianNB())]), np.arange(10), 1.0)
+        index_file = [file for file in os.listdir(self._directory.name) if file.endswith('.index')][0]
+        with open(os.path.join(self._directory.name, index_file), 'ab') as fh:
+            fh.write(b'["Pipeline(...)", 0.5, 1')
+        self.assertEqual(len(self.store.load_models()), 1)
+
+    def test_evaluation_store_separate_segments(self):
+        """ Test that stores which write to the same directory with the same process id do not share a segment.
+
+        This is the case for workers on different machines, which write to a shared directory.
+        """
+        other_store = pickle.loads(pickle.dumps(self.store))
+        for i in range(1, 4):
+            self.store.append(Pipeline([('nb', GaussianNB())]), np.full(10, i), float(i))
+            other_store.append(Pipeline([('nb', GaussianNB())]), np.full(20, -i), float(-i))
+
+        models = self.store.load_models()
+        self.assertEqual(len(models), 6)
+        for model in models:
+            np.testing.assert_array_equal(model.predictions, model.validation_score)
+            self.assertEqual(len(model.predictions), 10 if model.validation_score > 0 else 20)
+        self.assertEqual(len([file for file in os.listdir(self._directory.name) if file.endswith('.index')]), 2)
+
+    def test_evaluation_store_pickle(self):
+        """ Test that a store can be appended to after pickling, and the prediction transformation is applied. """
+        self.store.append(Pipeline([('nb', GaussianNB())]), np.arange(10), 1.0)
+        store_copy = pickle.loads(pickle.dumps(self.store))
+        store_copy.append(Pipeline([('nb', GaussianNB())]), np.arange(10), 2.0)
+
+        models = self.store.load_models(prediction_transformation=lambda p: p * 2)
+        self.assertEqual(len(models), 2)
+        np.testing.assert_array_equal(models[0].predictions, np.arange(10) * 2)
+
+    def test_evaluation_store_reduced_precision(self):
+        """ Test that probabilities stored with reduced precision are within the documented error. """
+        probabilities = np.random.RandomState(0).dirichlet(np.ones(4), size=50)
+        for dtype, max_error in [('float32', 2**-24), ('float16', 2**-11), ('uint8', 1 / 510)]:
+            with tempfile.TemporaryDirectory() as directory:
+                store = EvaluationStore(directory, prediction_dtype=dtype)
+                store.append(Pipeline([('nb', GaussianNB())]), probabilities, 1.0)
+                model, = store.load_models()
+                self.assertEqual(model.predictions.dtype, np.dtype(dtype))
+                stored_probabilities = model.predictions * model.prediction_scale
+                relative = dtype != 'uint8'
+                error = np.abs(stored_probabilities - probabilities) / (probabilities if relative else 1)
+                self.assertLessEqual(error.max(), max_error * (1 + 1e-6))
@@ -0,0 +1,71 @@
+import pickle
+import unittest
+
+from gama.utilities.generic.duplicate_registry import DuplicateRegistry
+
+
+def duplicate_registry_test_suite():
+    test_cases = [DuplicateRegistryUnitTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class DuplicateRegistryUnitTestCase(unittest.TestCase):
+
+    def test_duplicate_registry_add(self):
+        """ Test that a key is only new the first time it is added. """
+        registry = DuplicateRegistry()
+        self.assertTrue(registry.add('GaussianNB(data)'))
+        self.assertTrue(registry.add('BernoulliNB(data)'))
+        self.assertFalse(registry.add('GaussianNB(data)'))
+        self.assertIn('BernoulliNB(data)', registry)
+        self.assertNotIn('MultinomialNB(data)', registry)
+        self.assertEqual(len(registry), 2)
+
+    def test_duplicate_registry_bounded(self):
+        """ Test that at least the `max_size` most recent keys are remembered, and at most twice as many. """
+        registry = DuplicateRegistry(max_size=10)
+        for i in range(35):
+            registry.add(str(i))
+            self.assertLessEqual(len(registry), 20)
+        self.assertTrue(all(str(i) in registry for i in range(25, 35)))
+        self.assertFalse(any(str(i) in registry for i in range(20)))
+        self.assertTrue(registry.add('0'))
+
+    def test_duplicate_registry_memory(self):
+        """ Test that hashes are stored in a fixed amount of memory of at most 32 bytes per key. """
+        registry = DuplicateRegistry(max_size=1000)
+        for i in range(1000):
+            self.assertTrue(registry.add(str(i)))
+        self.assertTrue(all(str(i) in registry for i in range(1000)))
+        self.assertLessEqual(registry._current._slots.nbytes, 32 * 1000)
+
+    def test_duplicate_registry_clear(self):
+        registry = DuplicateRegistry()
+        registry.add('GaussianNB(data)')
+        registry.clear()
+        self.assertEqual(len(registry), 0)
+        self.assertTrue(registry.add('GaussianNB(data)'))
+
+    def test_duplicate_registry_bloom_filter(self):
+        """ Test that a Bloom filter remembers all added keys and has about the requested false positive rate. """
+        registry = DuplicateRegistry(max_size=1000, false_positive_rate=0.01)
+        for i in range(1000):
+            registry.add(str(i))
+        self.assertTrue(all(str(i) in registry for i in range(1000)))
+        false_positives = sum(str(i) in registry for i in range(1000, 21000))
+        self.assertLess(false_positives / 20000, 0.02)
+
+    def test_duplicate_registry_pickle(self):
+        """ Test that the registry can be persisted, e.g. along with a Gama instance. """
+        for false_positive_rate in [None, 0.01]:
+            registry = DuplicateRegistry(false_positive_rate=false_positive_rate)
+            registry.add('GaussianNB(data)')
+            restored = pickle.loads(pickle.dumps(registry))
+            self.assertFalse(restored.add('GaussianNB(data)'))
+            self.assertTrue(restored.add('BernoulliNB(data)'))
+
+    def test_duplicate_registry_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            DuplicateRegistry(max_size=0)
+        with self.assertRaises(ValueError):
+            DuplicateRegistry(false_positive_rate=1)
@@ -0,0 +1,227 @@
+import logging
+import os
+import signal
+import time
+import unittest
+from functools import partial
+
+import numpy as np
+
+from gama.utilities.generic.function_dispatcher import FunctionDispatcher, WorkerDiedError, WorkerTimeoutError, \
+    resource
+from gama.utilities.logging_utilities import MultiprocessingLogger
+
+
+def function_dispatcher_test_suite():
+    test_cases = [FunctionDispatcherUnitTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+def _exit_on_negative(x):
+    if x < 0:
+        os._exit(1)
+    return x
+
+
+def _kill_on_negative(x):
+    if x < 0:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return x
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _pid(_):
+    return os.getpid()
+
+
+def _log_and_return(x, logger):
+    logger.info('Evaluating {}.'.format(x))
+    return x
+
+
+def _thread_environment(_):
+    return os.environ.get('OMP_NUM_THREADS')
+
+
+def _allocate(n_bytes):
+    try:
+        return len(np.ones(n_bytes, dtype=np.uint8))
+    except MemoryError:
+        return 'MemoryError'
+
+
+class FunctionDispatcherUnitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_function_dispatcher_replaces_dead_child_process(self):
+        """ Test that a job whose process dies returns a WorkerDiedError, and that other jobs still complete. """
+        dispatcher = FunctionDispatcher(2, _exit_on_negative)
+        dispatcher.start()
+        try:
+            identifiers = [dispatcher.queue_evaluation(x) for x in [-1, 1, 2, 3]]
+            results = dict((identifier, output) for identifier, output, _ in
+                           [dispatcher.get_next_result() for _ in identifiers])
+            self.assertIsInstance(results[identifiers[0]], WorkerDiedError)
+            self.assertEqual(results[identifiers[0]].exitcode, 1)
+            self.assertEqual([results[identifier] for identifier in identifiers[1:]], [1, 2, 3])
+            self.assertTrue(all(process.is_alive() for process in dispatcher._child_processes))
+        finally:
+            dispatcher.stop()
+
+    def test_function_dispatcher_replaces_killed_child_process(self):
+        """ Test that a job whose process is killed by a signal returns a WorkerDiedError, e.g. for a native crash. """
+        dispatcher = FunctionDispatcher(2, _kill_on_negative)
+        dispatcher.start()
+        try:
+            identifiers = [dispatcher.queue_evaluation(x) for x in [1, -1, -2, 2, 3]]
+            results = dict((identifier, output) for identifier, output, _ in
+                           [dispatcher.get_next_result() for _ in identifiers])
+            for identifier in identifiers[1:3]:
+                self.assertIsInstance(results[identifier], WorkerDiedError)
+                self.assertEqual(results[identifier].exitcode, -signal.SIGKILL)
+            self.assertEqual([results[identifiers[i]] for i in [0, 3, 4]], [1, 2, 3])
+            self.assertEqual(len(dispatcher._child_processes), 2)
+            self.assertTrue(all(process.is_alive() for process in dispatcher._child_processes))
+        finally:
+            dispatcher.stop()
+
+    def test_function_dispatcher_result_latency(self):
+        """ Test that results are received as soon as they are available, rather than by polling at an interval. """
+        dispatcher = FunctionDispatcher(2, _exit_on_negative)
+        dispatcher.start()
+        try:
+            start = time.time()
+            for x in range(100):
+                dispatcher.queue_evaluation(x)
+                _, output, __ = dispatcher.get_next_result()
+                self.assertEqual(output, x)
+            self.assertLess(time.time() - start, 5)
+        finally:
+            dispatcher.stop()
+
+    def test_function_dispatcher_timeout(self):
+        """ Test that a job exceeding the timeout returns a WorkerTimeoutError without waiting for it to finish. """
+        dispatcher = FunctionDispatcher(2, _sleep, timeout=1)
+        dispatcher.start()
+        try:
+            start = time.time()
+            long_job = dispatcher.queue_evaluation(60)
+            short_job = dispatcher.queue_evaluation(0)
+            results = dict((identifier, output) for identifier, output, _ in
+                           [dispatcher.get_next_result() for _ in range(2)])
+            self.assertLess(time.time() - start, 10)
+            self.assertIsInstance(results[long_job], WorkerTimeoutError)
+            self.assertEqual(results[short_job], 0)
+
+            dispatcher.queue_evaluation(0)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertEqual(output, 0, "A new child process should replace the terminated one.")
+        finally:
+            dispatcher.stop()
+
+    def test_function_dispatcher_job_timeout(self):
+        """ Test that a job can have a shorter timeout than the other jobs. """
+        dispatcher = FunctionDispatcher(2, _sleep, timeout=30)
+        dispatcher.start()
+        try:
+            short_timeout_job = dispatcher.queue_evaluation(60, job_timeout=1)
+            default_timeout_job = dispatcher.queue_evaluation(2)
+            results = dict((identifier, output) for identifier, output, _ in
+                           [dispatcher.get_next_result() for _ in range(2)])
+            self.assertIsInstance(results[short_timeout_job], WorkerTimeoutError)
+            self.assertEqual(results[short_timeout_job].timeout, 1)
+            self.assertEqual(results[default_timeout_job], 2)
+        finally:
+            dispatcher.stop()
+
+    @unittest.skipIf(resource is None, "Memory can only be limited on Unix.")
+    def test_function_dispatcher_max_memory(self):
+        """ Test that child processes raise a MemoryError when allocating more than `max_memory`. """
+        dispatcher = FunctionDispatcher(2, _allocate, max_memory=2 * 2**30)
+        dispatcher.start()
+        try:
+            dispatcher.queue_evaluation(4 * 2**30)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertEqual(output, 'MemoryError')
+            dispatcher.queue_evaluation(2**20)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertEqual(output, 2**20)
+        finally:
+            dispatcher.stop()
+
+    def test_function_dispatcher_max_threads(self):
+        """ Test that child processes limit their thread pools to `max_threads`. """
+        dispatcher = FunctionDispatcher(2, _thread_environment, max_threads=3)
+        dispatcher.start()
+        try:
+            dispatcher.queue_evaluation(None)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertEqual(output, '3')
+        finally:
+            dispatcher.stop()
+
+    def test_function_dispatcher_max_tasks_per_worker(self):
+        """ Test that child processes are replaced after `max_tasks_per_worker` jobs, without losing jobs. """
+        dispatcher = FunctionDispatcher(2, _pid, max_tasks_per_worker=2)
+        dispatcher.start()
+        try:
+            first_process = dispatcher._child_processes[0]
+            start = time.time()
+            identifiers = [dispatcher.queue_evaluation(x) for x in range(10)]
+            pids = [dispatcher.get_next_result()[1] for _ in identifiers]
+            self.assertGreaterEqual(len(set(pids)), 5)
+            self.assertTrue(all(pids.count(pid) <= 2 for pid in pids))
+            # Idle child processes stop when asked, instead of being terminated after a timeout.
+            self.assertEqual(first_process.exitcode, 0)
+            self.assertLess(time.time() - start, 2)
+        finally:
+            dispatcher.stop()
+
+    def test_function_dispatcher_log_messages(self):
+        """ Test that messages logged in child processes are sent back with the results, exactly once.
+
+        Child processes are replaced after each job, so they are forked while the parent holds unflushed messages.
+        """
+        logger = MultiprocessingLogger()
+        dispatcher = FunctionDispatcher(2, partial(_log_and_return, logger=logger), logger=logger,
+                                        max_tasks_per_worker=1)
+        dispatcher.start()
+        try:
+            identifiers = [dispatcher.queue_evaluation(x) for x in range(4)]
+            for _ in identifiers:
+                dispatcher.get_next_result()
+            self.assertEqual(sorted(logger.pop_messages()),
+                             [(logging.INFO, 'Evaluating {}.'.format(x)) for x in range(4)])
+        finally:
+            dispatcher.stop()
+
+    def test_function_dispatcher_cancel(self):
+        """ Test that pending and running jobs can be cancelled, while other running jobs continue. """
+        dispatcher = FunctionDispatcher(2, _sleep)
+        dispatcher.start()
+        try:
+            start = time.time()
+            long_job = dispatcher.queue_evaluation(60)
+            short_job = dispatcher.queue_evaluation(0.5)
+            pending_job = dispatcher.queue_evaluation(0)
+            self.assertEqual(dispatcher.cancel_pending(), [pending_job])
+            self.assertTrue(dispatcher.cancel(long_job))
+            self.assertFalse(dispatcher.cancel(pending_job))
+
+            identifier, output, _ = dispatcher.get_next_result()
+            self.assertEqual((identifier, output), (short_job, 0.5))
+            dispatcher.queue_evaluation(0)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertEqual(output, 0)
+            self.assertLess(time.time() - start, 10)
+        finally:
+            dispatcher.stop()
@@ -0,0 +1,61 @@
+import unittest
+
+from gama.utilities.generic.lru_cache import LRUCache
+
+
+def lru_cache_test_suite():
+    test_cases = [LRUCacheUnitTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class LRUCacheUnitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_lru_cache_get_put(self):
+        """ Test items can be retrieved after being stored, and that misses return the default. """
+        cache = LRUCache(max_size=2)
+        self.assertTrue(cache.put('a', 1))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 2), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        """ Test that the least recently *used* item is evicted, not the least recently stored one. """
+        cache = LRUCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_lru_cache_size_fn(self):
+        """ Test that the budget is enforced on the total size of items as determined by size_fn. """
+        cache = LRUCache(max_size=10, size_fn=len)
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+        self.assertEqual(cache.total_size, 8)
+        cache.put('c', 'xxxx')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.total_size, 8)
+        self.assertNotIn('a', cache)
+
+        self.assertFalse(cache.put('d', 'x' * 11), "Items exceeding the budget by themselves should not be stored.")
+        self.assertEqual(len(cache), 2)
+
+    def test_lru_cache_overwrite(self):
+        """ Test that storing an item under an existing key replaces it and frees its size. """
+        cache = LRUCache(max_size=10, size_fn=len)
+        cache.put('a', 'xxxx')
+        cache.put('a', 'xx')
+        self.assertEqual(cache.get('a'), 'xx')
+        self.assertEqual(cache.total_size, 2)
+        self.assertEqual(cache.pop('a'), 'xx')
+        self.assertEqual(cache.total_size, 0)
@@ -0,0 +1,41 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from gama.utilities.generic.memmapped_array import MemmappedArray
+
+
+def memmapped_array_test_suite():
+    test_cases = [MemmappedArrayUnitTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class MemmappedArrayUnitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, 'array.npy')
+        self.data = np.arange(1000, dtype=float).reshape(100, 10)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_memmapped_array_pickles_by_path(self):
+        """ Test that a pickled MemmappedArray does not contain the data, but still provides access to it. """
+        memmapped = MemmappedArray(self.data, self.path)
+        pickled = pickle.dumps(memmapped)
+        self.assertLess(len(pickled), self.data.nbytes)
+
+        unpickled = pickle.loads(pickled)
+        self.assertIsInstance(unpickled.array, np.memmap)
+        np.testing.assert_array_equal(unpickled.array, self.data)
+        self.assertEqual(len(unpickled), 100)
+
+    def test_memmapped_array_copy_on_write(self):
+        """ Test that writing to the array does not change the data in the file. """
+        memmapped = MemmappedArray(self.data, self.path)
+        memmapped.array[0, 0] = -1
+        np.testing.assert_array_equal(np.load(self.path), self.data)
@@ -0,0 +1,132 @@
+import multiprocessing as mp
+import os
+import pickle
+import shutil
+import signal
+import socket
+import tempfile
+import time
+import unittest
+from functools import partial
+
+import numpy as np
+
+from gama import GamaClassifier
+from gama.ea.folds import Folds
+from gama.utilities.generic.function_dispatcher import WorkerDiedError, WorkerTimeoutError
+from gama.utilities.generic.memmapped_array import MemmappedArray
+from gama.utilities.generic.remote_dispatcher import RemoteFunctionDispatcher, dumps_with_data, run_worker
+from gama.utilities.persistent_cache import PersistentCache, dataset_fingerprint
+
+
+def remote_dispatcher_test_suite():
+    test_cases = [RemoteDispatcherUnitTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+AUTHKEY = b'test'
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _sum_row(row, data):
+    return float(data.array[row].sum())
+
+
+def _free_address():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()
+
+
+class RemoteDispatcherUnitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.address = _free_address()
+        self.workers = []
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.terminate()
+
+    def start_workers(self, n):
+        # Workers are started before the dispatcher listens, so they do not inherit its socket.
+        for _ in range(n):
+            worker = mp.Process(target=run_worker, args=(self.address, AUTHKEY),
+                                kwargs=dict(heartbeat_interval=0.2, retry_time=5))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def test_remote_dispatcher_ships_data(self):
+        """ Test that workers receive the data of memory-mapped arrays, rather than paths which may not exist. """
+        directory = tempfile.mkdtemp()
+        try:
+            data = MemmappedArray(np.arange(12).reshape(4, 3), os.path.join(directory, 'data.npy'))
+            dispatcher = RemoteFunctionDispatcher(partial(_sum_row, data=data), self.address, AUTHKEY)
+            self.start_workers(2)
+            dispatcher.start()
+        finally:
+            shutil.rmtree(directory)
+        try:
+            identifiers = [dispatcher.queue_evaluation(row) for row in range(4)]
+            results = dict((identifier, output) for identifier, output, _ in
+                           [dispatcher.get_next_result() for _ in identifiers])
+            self.assertEqual([results[identifier] for identifier in identifiers], [3., 12., 21., 30.])
+        finally:
+            dispatcher.stop()
+
+    def test_gama_evaluate_can_be_sent_to_workers(self):
+        """ Test that the evaluation function Gama registers, with all its caches, is pickled as for remote workers. """
+        automl = GamaClassifier(objectives=('accuracy', 'size'), max_prefix_cache_memory=10,
+                                persistent_cache_dir=tempfile.mkdtemp(), random_state=0, keep_analysis_log=False)
+        try:
+            X, y = np.random.RandomState(0).rand(60, 4), np.array([0, 1, 2] * 20)
+            automl._folds = Folds(X, y, y, cv=3, directory=automl._cache_dir)
+            fingerprint = dataset_fingerprint(X, y, automl._folds.splits, 'accuracy')
+            automl._persistent_cache = PersistentCache(automl._persistent_cache_dir, fingerprint, 2**20)
+            automl._register_evaluation()
+            # The same function async_ea gives to a RemoteFunctionDispatcher.
+            evaluate = pickle.loads(dumps_with_data(partial(automl._toolbox.evaluate, logger=None)))
+            result = evaluate(automl._toolbox.compile(automl._toolbox.individual()))
+            self.assertGreater(result.score, -float('inf'))
+        finally:
+            automl.delete_cache()
+            shutil.rmtree(automl._persistent_cache_dir)
+
+    def test_remote_dispatcher_timeout(self):
+        """ Test that a job exceeding the timeout returns a WorkerTimeoutError, and the worker reconnects. """
+        dispatcher = RemoteFunctionDispatcher(_sleep, self.address, AUTHKEY, timeout=1)
+        self.start_workers(1)
+        dispatcher.start()
+        try:
+            dispatcher.queue_evaluation(2)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertIsInstance(output, WorkerTimeoutError)
+            dispatcher.queue_evaluation(0)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertEqual(output, 0)
+        finally:
+            dispatcher.stop()
+
+    def test_remote_dispatcher_heartbeat(self):
+        """ Test that long jobs complete, but a job of a worker that stops responding returns a WorkerDiedError. """
+        dispatcher = RemoteFunctionDispatcher(_sleep, self.address, AUTHKEY, heartbeat_timeout=1)
+        self.start_workers(1)
+        dispatcher.start()
+        try:
+            dispatcher.queue_evaluation(2)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertEqual(output, 2)
+
+            dispatcher.queue_evaluation(2)
+            time.sleep(0.5)
+            os.kill(self.workers[0].pid, signal.SIGSTOP)
+            _, output, __ = dispatcher.get_next_result()
+            self.assertIsInstance(output, WorkerDiedError)
+        finally:
+            os.kill(self.workers[0].pid, signal.SIGCONT)
+            dispatcher.stop()
@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+
+import numpy as np
+from sklearn.naive_bayes import GaussianNB
+from sklearn.pipeline import Pipeline
+
+from gama.utilities.persistent_cache import PersistentCache, dataset_fingerprint, pipeline_key
+
+
+def persistent_cache_test_suite():
+    test_cases = [PersistentCacheUnitTestCase]
+    return unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase, test_cases))
+
+
+class PersistentCacheUnitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.X = np.arange(20).reshape(10, 2).astype(float)
+        self.y = np.asarray([0, 1] * 5)
+        self.splits = [(np.arange(5), np.arange(5, 10)), (np.arange(5, 10), np.arange(5))]
+        self.pipeline = Pipeline([('nb', GaussianNB())])
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_dataset_fingerprint(self):
+        """ Test that the fingerprint changes if the data, splits or metric change, and only then. """
+        fingerprint = dataset_fingerprint(self.X, self.y, self.splits, 'accuracy')
+        self.assertEqual(fingerprint, dataset_fingerprint(self.X.copy(), self.y.copy(), self.splits, 'accuracy'))
+        self.assertNotEqual(fingerprint, dataset_fingerprint(self.X + 1, self.y, self.splits, 'accuracy'))
+        self.assertNotEqual(fingerprint, dataset_fingerprint(self.X, self.y, self.splits[::-1], 'accuracy'))
+        self.assertNotEqual(fingerprint, dataset_fingerprint(self.X, self.y, self.splits, 'neg_log_loss'))
+
+    def test_persistent_cache_get_put(self):
+        """ Test that results persist across cache instances, but only for the same fingerprint. """
+        cache = PersistentCache(self._directory.name, 'a', max_size=2**20)
+        self.assertIsNone(cache.get(pipeline_key(self.pipeline)))
+        cache.put(pipeline_key(self.pipeline), 0.5, 1.0, 1, self.pipeline, np.arange(10))
+        cache.put('failed', -float('inf'), 1.0, 1)
+
+        cached = PersistentCache(self._directory.name, 'a', max_size=2**20).get(pipeline_key(self.pipeline))
+        self.assertEqual((cached.score, cached.time, cached.length), (0.5, 1.0, 1))
+        self.assertEqual(str(cached.pipeline), str(self.pipeline))
+        np.testing.assert_array_equal(cached.predictions, np.arange(10))
+        self.assertEqual(cache.get('failed').score, -float('inf'))
+        self.assertIsNone(PersistentCache(self._directory.name, 'b', max_size=2**20).get(pipeline_key(self.pipeline)))
+
+    def test_persistent_cache_evicts_least_recently_used(self):
+        """ Test that the least recently used results are evicted when the cache exceeds its size. """
+        predictions = np.zeros(1000)
+        cache = PersistentCache(self._directory.name, 'a', max_size=2.5 * predictions.nbytes)
+        cache.put('first', 0.5, 1.0, 1, predictions=predictions)
+        cache.put('second', 0.5, 1.0, 1, predictions=predictions)
+        cache.get('first')
+        cache.put('third', 0.5, 1.0, 1, predictions=predictions)
+        self.assertIsNotNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))